@@ -1,7 +1,11 @@
 from app.settings import Settings
+from app.agents.llmScheduler import LLMScheduler, ModelLimits
+from app.agents.responseCache import ResponseCache
 from google import genai
 from google.genai import types
 from app.models import GenerateRequest, GenerateResponse, ChatRequest, ChatResponse
+from app.telemetry import configure, telemetry, text_bytes
+from app.tokens import estimate_tokens
 import logging
 import asyncio
 
@@ -10,50 +14,107 @@ class GeminiClient:
     '''
     Class to be imported whenever an LLM call needs to be made
     Why: Simplifies API calls
+    Calls go through the SDK's async client (client.aio) behind an LLMScheduler, so they never
+    block the event loop and stay inside the per model RPM/TPM budget
+    Responses are cached by request (see ResponseCache), request.use_cache=False skips the cache
+    Each completion is a gemini.chat / gemini.generate span, the upstream call inside it a
+    gemini.call span with estimated and reported tokens and response bytes counted per model
+    Prompts and responses are only logged at DEBUG, sampled and truncated
     '''
 
-    def __init__(self):
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-        )
+    def __init__(self, scheduler: LLMScheduler = None, client: genai.Client = None, cache: ResponseCache = None):
+        configure()
         self.logger = logging.getLogger(__name__)
         self.settings = Settings
-        self.client = genai.Client(api_key=self.settings.GEMINI_API_KEY) 
+        self.client = client or genai.Client(api_key=self.settings.GEMINI_API_KEY) 
+        self.scheduler = scheduler or LLMScheduler(
+            default=ModelLimits(
+                rpm=self.settings.GEMINI_RPM,
+                tpm=self.settings.GEMINI_TPM,
+                max_in_flight=self.settings.GEMINI_MAX_IN_FLIGHT
+            )
+        )
+        self.cache = cache or ResponseCache(
+            ttl=self.settings.GEMINI_CACHE_TTL,
+            max_entries=self.settings.GEMINI_CACHE_MAX_ENTRIES,
+            root=self.settings.GEMINI_CACHE_DIR
+        )
 
+    @telemetry.traced("gemini.generate")
     async def generate_completion(self,request: GenerateRequest) -> GenerateResponse:
-        self.logger.info(f"generating from a prompt {request.prompt}")
-        response = self.client.models.generate_content(
-            model=request.model,
-            contents=request.prompt,
-            config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
-            ),
+        telemetry.log_payload(self.logger, "generating from a prompt %s", request.prompt)
+        config = types.GenerateContentConfig(
+            thinking_config=types.ThinkingConfig(thinking_budget=0)
+        )
+        text = await self.cache.fetch(
+            self.cache.key(request.model, {"prompt": request.prompt, "config": config}),
+            lambda: self.submit(request, request.prompt, config, estimate_tokens(request.prompt)),
+            use_cache=request.use_cache
         )
-        self.logger.info(f"received a response {response.text}")
-        return GenerateResponse(response=response.text)
+        telemetry.log_payload(self.logger, "received a response %s", text)
+        return GenerateResponse(response=text)
     
+    @telemetry.traced("gemini.chat")
     async def chat_completion(self,request: ChatRequest) -> ChatResponse:
-        self.logger.info(f"sending a chat request {request.messages}")
+        telemetry.log_payload(self.logger, "sending a chat request %s", request.messages)
         #pull relevant data from graphdb
-        response = self.client.models.generate_content(
-            model=request.model,
-            config = types.GenerateContentConfig(
-                system_instruction=request.system_prompt,
-                thinking_config=types.ThinkingConfig(thinking_budget=0),
-                temperature=0,
-                tools= request.tools,
-                automatic_function_calling=genai.types.AutomaticFunctionCallingConfig(
-                    disable=True
-                )
+        config = types.GenerateContentConfig(
+            system_instruction=request.system_prompt,
+            thinking_config=types.ThinkingConfig(thinking_budget=0),
+            temperature=0,
+            tools= request.tools,
+            automatic_function_calling=genai.types.AutomaticFunctionCallingConfig(
+                disable=True
+            )
+        )
+        text = await self.cache.fetch(
+            self.cache.key(request.model, {"messages": request.messages, "config": config}),
+            lambda: self.submit(
+                request, request.messages, config,
+                estimate_tokens(request.system_prompt, request.messages, request.tools)
             ),
-            contents=request.messages
+            use_cache=request.use_cache
         )
-        self.logger.info(f"received a chat response {response.text}")
-        return GenerateResponse(response=response.text)
+        telemetry.log_payload(self.logger, "received a chat response %s", text)
+        return ChatResponse(response=text)
+
+    async def submit(self, request, contents, config, tokens: int) -> tuple:
+        '''
+        One scheduled generate_content call, returns (text, tokens used) for the response cache
+        Only cache misses get here, so the span and counters measure real upstream traffic
+        '''
+        with telemetry.span("gemini.call", model=request.model, estimated_tokens=tokens) as span:
+            response = await self.scheduler.submit(
+                request.model,
+                lambda: self.client.aio.models.generate_content(
+                    model=request.model,
+                    contents=contents,
+                    config=config
+                ),
+                tokens=tokens,
+                priority=request.priority,
+                usage=used_tokens
+            )
+            used = used_tokens(response)
+            text = response.text
+            span.set(tokens=used)
+        telemetry.count("gemini_calls_total", model=request.model)
+        telemetry.count("gemini_tokens_total", tokens, model=request.model, kind="estimated")
+        if used is not None:
+            telemetry.count("gemini_tokens_total", used, model=request.model, kind="used")
+        if text:
+            telemetry.count("gemini_response_bytes_total", text_bytes(text), model=request.model)
+        return text, used
+
+
+def used_tokens(response):
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage else None
+
 
 async def main():
 
+    configure(level="DEBUG", payload_sample=1.0)
     geminiInstance = GeminiClient()
     
     # await geminiInstance.generate_completion(GenerateRequest(prompt='What is the color of the sky and why'))
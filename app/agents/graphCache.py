@@ -0,0 +1,90 @@
+from collections.abc import Mapping, Sequence
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from langgraph.cache.base import BaseCache, FullKey, Namespace
+
+
+class SqliteCache(BaseCache):
+    '''
+    LangGraph node cache in a local SQLite file, so cached node results outlive the process
+    Nodes added with a CachePolicy are skipped when their key is found here and their stored
+    writes are replayed instead. Uses the stdlib sqlite3 module rather than the separate
+    langgraph-checkpoint-sqlite package
+    Nodes that catch their own exceptions still finish, so results that wrote to one of
+    skip_channels (the state's error list) are not stored and the node runs again next time
+    '''
+
+    def __init__(self, path: str = ".cache/graph.sqlite", skip_channels: tuple = ("errors",), *, serde=None):
+        super().__init__(serde=serde)
+        self.path = path
+        self.skip_channels = set(skip_channels)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "namespace TEXT, key TEXT, encoding TEXT, value BLOB, expiry REAL, PRIMARY KEY (namespace, key))"
+            )
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "skipped": 0}
+
+    def get(self, keys: Sequence[FullKey]) -> dict:
+        now = time.time()
+        values = {}
+        with self.lock:
+            for namespace, key in keys:
+                row = self.connection.execute(
+                    "SELECT encoding, value, expiry FROM cache WHERE namespace = ? AND key = ?",
+                    (json.dumps(list(namespace)), key),
+                ).fetchone()
+                if row is None or (row[2] is not None and row[2] <= now):
+                    self.stats["misses"] += 1
+                    continue
+                self.stats["hits"] += 1
+                values[(namespace, key)] = self.serde.loads_typed((row[0], row[1]))
+        return values
+
+    async def aget(self, keys: Sequence[FullKey]) -> dict:
+        return self.get(keys)
+
+    def set(self, pairs: Mapping[FullKey, tuple]) -> None:
+        now = time.time()
+        rows = []
+        for (namespace, key), (value, ttl) in pairs.items():
+            if any(channel in self.skip_channels for channel, _ in value):
+                self.stats["skipped"] += 1
+                continue
+            encoding, data = self.serde.dumps_typed(value)
+            rows.append((json.dumps(list(namespace)), key, encoding, data, now + ttl if ttl is not None else None))
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)
+            self.connection.execute("DELETE FROM cache WHERE expiry IS NOT NULL AND expiry <= ?", (now,))
+        self.stats["writes"] += len(rows)
+
+    async def aset(self, pairs: Mapping[FullKey, tuple]) -> None:
+        self.set(pairs)
+
+    def clear(self, namespaces: Sequence[Namespace] = None) -> None:
+        with self.lock, self.connection:
+            if namespaces is None:
+                self.connection.execute("DELETE FROM cache")
+            else:
+                self.connection.executemany(
+                    "DELETE FROM cache WHERE namespace = ?", [(json.dumps(list(namespace)),) for namespace in namespaces]
+                )
+
+    async def aclear(self, namespaces: Sequence[Namespace] = None) -> None:
+        self.clear(namespaces)
+
+    def report(self) -> dict:
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        return {**self.stats, "entries": entries}
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,253 @@
+from collections import deque
+from dataclasses import dataclass, field
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+
+
+@dataclass
+class ModelLimits:
+    '''
+    Budget for one model, requests and tokens per window (a minute) plus how many calls may run at once
+    '''
+    rpm: float = 60
+    tpm: float = 1_000_000
+    max_in_flight: int = 8
+    window: float = 60.0
+
+
+class SlidingWindow:
+    '''
+    Amount spent over the trailing window, the way per minute quotas are counted server side
+    A refilling bucket lets a burst through and then refills straight away, which a trailing
+    window still counts, so the bucket runs into 429s right after every burst
+    '''
+
+    def __init__(self, capacity: float, window: float):
+        self.capacity = float(capacity)
+        self.window = window
+        self.entries = deque()
+        self.total = 0.0
+
+    def expire(self, now: float):
+        while self.entries and now - self.entries[0][0] >= self.window:
+            self.total -= self.entries.popleft()[1]
+
+    def delay(self, amount: float, now: float) -> float:
+        # a request bigger than the whole window waits for an empty window rather than forever
+        amount = min(amount, self.capacity)
+        self.expire(now)
+        excess = self.total + amount - self.capacity
+        if excess <= 0:
+            return 0.0
+        for started, spent in self.entries:
+            excess -= spent
+            if excess <= 0:
+                return started + self.window - now
+        return self.window
+
+    def take(self, amount: float, now: float) -> list:
+        entry = [now, min(amount, self.capacity)]
+        self.entries.append(entry)
+        self.total += entry[1]
+        return entry
+
+    def settle(self, entry: list, amount: float):
+        # corrects an estimate once the real amount is known, if the entry is still in the window
+        if entry in self.entries:
+            self.total += amount - entry[1]
+            entry[1] = amount
+
+
+class ModelState:
+
+    def __init__(self, limits: ModelLimits):
+        self.limits = limits
+        self.requests = SlidingWindow(limits.rpm, limits.window)
+        self.tokens = SlidingWindow(limits.tpm, limits.window)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+    def delay(self, tokens: float, now: float):
+        '''
+        Seconds until a call of this size may start, None when only a finishing call can free room
+        '''
+        if self.in_flight >= self.limits.max_in_flight:
+            return None
+        return max(self.cooldown_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now), 0.0)
+
+    def acquire(self, tokens: float, now: float) -> list:
+        self.in_flight += 1
+        self.requests.take(1, now)
+        return self.tokens.take(tokens, now)
+
+
+@dataclass(order=True)
+class Job:
+    priority: int
+    sequence: int
+    not_before: float = field(compare=False)
+    model: str = field(compare=False)
+    call: object = field(compare=False)
+    tokens: float = field(compare=False)
+    usage: object = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued: float = field(compare=False)
+    attempts: int = field(default=0, compare=False)
+    spent: list = field(default=None, compare=False)
+
+
+class LLMScheduler:
+    '''
+    Queues LLM calls and starts them as each model's budget allows
+        ordering    lowest priority value first, then submission order
+        budgets     per model requests and tokens over a trailing minute and a cap on calls in flight
+        429s        the call is requeued with exponential backoff plus jitter, and the model pauses
+                    for the same time so its other queued calls do not hit the limit as well
+    Token use is estimated up front and corrected from the response's usage once it completes
+    Why: Gemini enforces RPM/TPM per model, and bursting past them only buys 429s
+    '''
+
+    RATE_LIMITED = (429,)
+
+    def __init__(
+        self,
+        limits: dict = None,
+        default: ModelLimits = None,
+        max_retries: int = 5,
+        backoff: float = 1.0,
+        max_backoff: float = 32.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.limits = limits or {}
+        self.default = default or ModelLimits()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.models = {}
+        self.queue = []
+        self.sequence = itertools.count()
+        self.dispatcher = None
+        self.wakeup = None
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rate_limited": 0, "retries": 0, "queue_wait": 0.0}
+
+    def state(self, model: str) -> ModelState:
+        if model not in self.models:
+            self.models[model] = ModelState(self.limits.get(model, self.default))
+        return self.models[model]
+
+    async def submit(self, model: str, call, tokens: float = 0, priority: int = 10, usage=None):
+        '''
+        Runs call() (a coroutine factory, called again on retry) once the model has room and returns its result
+        usage(result) may return the tokens actually used so the budget is corrected
+        '''
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        job = Job(priority, next(self.sequence), now, model, call, tokens, usage, loop.create_future(), now)
+        self.stats["submitted"] += 1
+        heapq.heappush(self.queue, job)
+        self.notify()
+        return await job.future
+
+    def notify(self):
+        if self.dispatcher is None or self.dispatcher.done():
+            self.wakeup = asyncio.Event()
+            self.dispatcher = asyncio.get_running_loop().create_task(self.dispatch())
+        self.wakeup.set()
+
+    async def dispatch(self):
+        while self.queue:
+            self.wakeup.clear()
+            now = time.monotonic()
+            waits = []
+            deferred = []
+            blocked = set()
+
+            # one pass in priority order, a model stays blocked for the rest of the pass once its
+            # best job has to wait, so smaller low priority jobs cannot starve it
+            while self.queue:
+                job = heapq.heappop(self.queue)
+                if job.model in blocked:
+                    deferred.append(job)
+                    continue
+                state = self.state(job.model)
+                delay = state.delay(job.tokens, now)
+                if delay is not None:
+                    delay = max(delay, job.not_before - now)
+                if delay == 0:
+                    job.spent = state.acquire(job.tokens, now)
+                    self.stats["queue_wait"] += now - job.enqueued
+                    asyncio.get_running_loop().create_task(self.run(job, state))
+                    continue
+                blocked.add(job.model)
+                deferred.append(job)
+                if delay is not None:
+                    waits.append(delay)
+
+            for job in deferred:
+                heapq.heappush(self.queue, job)
+            if not self.queue:
+                break
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=min(waits) if waits else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, job: Job, state: ModelState):
+        try:
+            result = await job.call()
+        except asyncio.CancelledError:
+            # the caller sees the cancellation, and the freed slot goes to the next queued call
+            job.future.cancel()
+            self.notify()
+            raise
+        except Exception as e:
+            if getattr(e, "code", None) in self.RATE_LIMITED and job.attempts < self.max_retries:
+                self.requeue(job, state)
+            else:
+                self.stats["failed"] += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+            # the dispatcher may have exited while this call ran, notify restarts it for a requeued job
+            self.notify()
+            return
+        finally:
+            # released however the call ended, a cancelled call would otherwise hold its slot for good
+            state.in_flight -= 1
+
+        if job.usage is not None:
+            # the call succeeded, a response without readable usage keeps the estimate rather than
+            # leaving the caller waiting on a future that is never resolved
+            try:
+                used = job.usage(result)
+                if used is not None:
+                    # settle the estimate against what the response says it used
+                    state.tokens.settle(job.spent, used)
+            except Exception as e:
+                self.logger.warning("%s token usage could not be read, keeping the estimate: %r", job.model, e)
+        self.stats["completed"] += 1
+        if not job.future.done():
+            job.future.set_result(result)
+        self.notify()
+
+    def requeue(self, job: Job, state: ModelState):
+        delay = min(self.max_backoff, self.backoff * 2 ** job.attempts) * (0.5 + random.random() / 2)
+        now = time.monotonic()
+        job.attempts += 1
+        job.not_before = now + delay
+        state.cooldown_until = max(state.cooldown_until, now + delay)
+        self.stats["rate_limited"] += 1
+        self.stats["retries"] += 1
+        self.logger.warning("%s rate limited, retry %d in %.1fs", job.model, job.attempts, delay)
+        heapq.heappush(self.queue, job)
+
+    def report(self) -> dict:
+        return {
+            **self.stats,
+            "queued": len(self.queue),
+            "in_flight": {model: state.in_flight for model, state in self.models.items()},
+        }
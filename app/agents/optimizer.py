@@ -1,56 +1,115 @@
 from langgraph.graph import StateGraph, START, END
-from typing_extensions import TypedDict
+from langgraph.types import Send, CachePolicy
+from typing_extensions import TypedDict, Annotated
 from app.settings import Settings
 from app.agents.geminiClient import GeminiClient
+from app.agents.graphCache import SqliteCache
+from app.data.priceLoader import PriceLoader, PolygonSource, align
+from app.data.priceCache import PriceCache, CachedSource
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio.solvers import PortfolioSolver
+from app.telemetry import configure, telemetry
 import logging
-import httpx
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
 import json
-from uuid import uuid4
-from app.models import ChatRequest, ChatResponse, GenerateRequest
+import hashlib
+import operator
+import os
+from datetime import datetime
+from app.models import GenerateRequest
 import asyncio
+import pandas as pd
+from matplotlib.figure import Figure
 from app.mcp.client.mcpExecutor import mcpExecutor
 
+
+def merge(left: dict, right: dict) -> dict:
+    return {**left, **right}
+
+
 class OptimizerState(TypedDict):
-    ticker: set
+    ticker: list
+    servers: list
+    startDate: str
+    endDate: str
+    # written by the per ticker history branches at the same time, so they merge
+    history: Annotated[dict, merge]
+    plots: dict
+    variables: dict
+    weights: dict
+    errors: Annotated[list, operator.add]
+    executionlog: Annotated[list, operator.add]
+
+
+class HistoryTask(TypedDict):
+    ticker: str
     startDate: str
-    errors: set
-    executionlog: set
+    endDate: str
+
+
+# key functions also see empty input when the graph is drawn
+def task_key(task: HistoryTask) -> str:
+    return json.dumps([task.get("ticker"), task.get("startDate"), task.get("endDate")])
+
+
+def universe_key(state: OptimizerState) -> str:
+    # the tickers that actually have history, so a run with a failed fetch is not reused later
+    return json.dumps([sorted(state.get("history") or {}), state.get("startDate"), state.get("endDate")])
+
 
 class Optimizer:
-    
-    def __init__(self):
-        
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-        )
-        
+    '''
+    Portfolio workflow as a compiled LangGraph
+        initialize -> history (one branch per ticker) -> plot and variables in parallel -> optimize
+    history, variables and optimize are cached in a local SQLite node cache keyed by tickers and
+    dates, so a rerun over the same universe and range replays their results instead of
+    re-fetching and re-estimating
+    '''
+
+    def __init__(self, llm: GeminiClient = None, loader: PriceLoader = None, cache=None, output_dir: str = "output"):
+
+        configure()
+
         self.logger = logging.getLogger(__name__)
-        
-        self.llm = GeminiClient()
-        
+
+        self.llm = llm or GeminiClient()
+
         self.executor = mcpExecutor(self.llm)
-        
+
+        # bars missing from the local price cache are the only ones fetched
+        self.loader = loader or PriceLoader(
+            CachedSource(
+                PolygonSource(Settings.POLYGON_API_KEY),
+                PriceCache(os.path.join(Settings.PRICE_CACHE_DIR, "polygon"), Settings.PRICE_CACHE_MAX_BYTES)
+            )
+        )
+
+        self.cache = cache or SqliteCache(Settings.GRAPH_CACHE_PATH)
+        self.cache_ttl = Settings.GRAPH_CACHE_TTL
+        self.output_dir = output_dir
+        self.solver = PortfolioSolver()
+
         self.setupGraph()
-        
+
     def setupGraph(self):
-        
+
         graph = StateGraph(OptimizerState)
-        
-        graph.add_node("initialize",self.initialize)
-        graph.add_node("history",self.history)
-        graph.add_node("plot", self.plot)
-        graph.add_node("variables", self.variables)
-        graph.add_node("optimize", self.optimize)
-        graph.add_node("finalize", self.finalize)
-        graph.add_node("error", self.error)
-        
-        graph.set_entry_point("initialize")
-        graph.add_edge("intialize", "history")
+
+        # every node runs inside a span, a node replayed from the cache never runs so it has none
+        node = lambda name: telemetry.traced(f"optimizer.{name}", getattr(self, name))
+        graph.add_node("initialize", node("initialize"))
+        graph.add_node("history", node("history"), cache_policy=CachePolicy(key_func=task_key, ttl=self.cache_ttl))
+        graph.add_node("plot", node("plot"))
+        graph.add_node("variables", node("variables"), cache_policy=CachePolicy(key_func=universe_key, ttl=self.cache_ttl))
+        graph.add_node("optimize", node("optimize"), cache_policy=CachePolicy(key_func=universe_key, ttl=self.cache_ttl))
+        graph.add_node("finalize", node("finalize"))
+        graph.add_node("error", node("error"))
+
+        graph.add_edge(START, "initialize")
+        graph.add_conditional_edges("initialize", self.fanOut, ["history", "error"])
+        # plot and variables both wait for every history branch, then run side by side
         graph.add_edge("history", "plot")
-        graph.add_edge("plot", "variables")
-        graph.add_edge("variables", "optimize")
+        graph.add_edge("history", "variables")
+        graph.add_edge(["plot", "variables"], "optimize")
         graph.add_conditional_edges(
             "optimize",
             self.determineEnd,
@@ -61,51 +120,165 @@ class Optimizer:
         )
         graph.add_edge("finalize", END)
         graph.add_edge("error", END)
-        
+
+        self.workflow = graph.compile(cache=self.cache)
+
     async def initialize(self, state: OptimizerState):
-        
+
+        update = {"executionlog": []}
+
         try:
-            
+
             # check status of the executor (checks each MCP server)
-            status = await self.executor.ping()
-            
-            self.logger.info(f"Received status from MCP Executor: {status}")
-            
-            #retrieve start date
-            with open("app/prompts/optimizer_startDate.txt", "r") as file:
-                prompt = file.read()
-            
-            date = await self.llm.generate_completion(
-                request = GenerateRequest(prompt = prompt)
-            )
-            
-            state["startDate"] = date.response
-            
-            self.logger.info(f"Selected start date for the optimization with at least 1 year of fiscal data available: {state['startDate']}")
-            
-            
-            
-            
+            status = await asyncio.gather(*(self.executor.ping(server) for server in state.get("servers") or []))
+
+            self.logger.info("Received status from MCP Executor: %s", status)
+
+            update["endDate"] = state.get("endDate") or datetime.today().strftime('%Y-%m-%d')
+
+            if state.get("startDate"):
+                update["startDate"] = state["startDate"]
+            else:
+                #retrieve start date
+                with open("app/prompts/optimizer_startDate.txt", "r") as file:
+                    prompt = file.read()
+
+                date = await self.llm.generate_completion(
+                    request = GenerateRequest(prompt = prompt.replace("[INSERT TICKER LIST HERE]", json.dumps(sorted(state["ticker"]))))
+                )
+
+                update["startDate"] = pd.Timestamp(date.response.strip()).strftime('%Y-%m-%d')
+
+            self.logger.info("Selected start date for the optimization with at least 1 year of fiscal data available: %s", update["startDate"])
+
         except Exception as e:
-            state["executionlog"].append(f"Error encountered during initialization: {e}")
-        
-        return state
-    
-    async def history(self, state: OptimizerState):
-        return state
-    
+            update["errors"] = [f"Error encountered during initialization: {e}"]
+
+        return update
+
+    def fanOut(self, state: OptimizerState):
+        if state["errors"]:
+            return "error"
+        # one history branch per ticker, run concurrently in the same step
+        return [
+            Send("history", {"ticker": ticker, "startDate": state["startDate"], "endDate": state["endDate"]})
+            for ticker in sorted(state["ticker"])
+        ]
+
+    async def history(self, task: HistoryTask):
+
+        try:
+            frames = await asyncio.to_thread(self.loader.load_ohlcv, [task["ticker"]], task["startDate"], task["endDate"])
+            frame = frames.get(task["ticker"])
+            if frame is None or not len(frame):
+                return {"errors": [f"No price history for {task['ticker']}"]}
+
+            return {
+                "history": {
+                    task["ticker"]: {
+                        "dates": frame.index.strftime('%Y-%m-%d').tolist(),
+                        "close": frame["close"].tolist()
+                    }
+                },
+                "executionlog": [f"Fetched {len(frame)} bars for {task['ticker']}"]
+            }
+
+        except Exception as e:
+            return {"errors": [f"Error fetching history for {task['ticker']}: {e}"]}
+
     async def plot(self, state: OptimizerState):
-        
-        return state
-    
+
+        try:
+            path = await asyncio.to_thread(self.plot_history, state)
+            return {"plots": {"history": path}}
+
+        except Exception as e:
+            return {"errors": [f"Error plotting history: {e}"]}
+
+    def plot_history(self, state: OptimizerState) -> str:
+        # a Figure without pyplot keeps no global state, so it is safe off the event loop thread
+        prices = self.prices(state)
+        figure = Figure(figsize=(12, 6))
+        axes = figure.subplots()
+        for ticker in prices.columns:
+            axes.plot(prices.index, prices[ticker], label=ticker)
+        axes.set_title('Portfolio Close Price History')
+        axes.set_xlabel('Date')
+        axes.set_ylabel('Price USD')
+        axes.legend(loc='upper left')
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        digest = hashlib.sha256(universe_key(state).encode()).hexdigest()[:12]
+        path = os.path.join(self.output_dir, f"history_{digest}.png")
+        figure.savefig(path)
+        return path
+
     async def variables(self, state: OptimizerState):
-        return state
-    
+
+        try:
+            engine = await asyncio.to_thread(RiskEngine.from_prices, self.prices(state))
+            return {
+                "variables": {
+                    "tickers": engine.tickers,
+                    "mu": engine.mu.tolist(),
+                    "cov": engine.cov.tolist()
+                }
+            }
+
+        except Exception as e:
+            return {"errors": [f"Error estimating variables: {e}"]}
+
     async def optimize(self, state: OptimizerState):
-        return state
-    
+
+        if not state.get("variables"):
+            # an error result is never cached, so a later run with working estimates still optimizes
+            return {"errors": ["Optimization skipped, no variables were estimated"]}
+
+        try:
+            variables = state["variables"]
+            mu = pd.Series(variables["mu"], index=variables["tickers"])
+            cov = pd.DataFrame(variables["cov"], index=variables["tickers"], columns=variables["tickers"])
+            result = await asyncio.to_thread(self.solver.max_sharpe, mu, cov)
+            return {"weights": dict(result.clean_weights())}
+
+        except Exception as e:
+            return {"errors": [f"Error optimizing weights: {e}"]}
+
     async def finalize(self, state: OptimizerState):
-        return state
-    
+        self.logger.info("Optimized weights: %s", state["weights"])
+        return {}
+
     async def error(self, state: OptimizerState):
-        return state 
\ No newline at end of file
+        self.logger.error("Optimizer finished with errors: %s", state["errors"])
+        return {}
+
+    async def determineEnd(self, state: OptimizerState) -> str:
+        return "error" if state["errors"] or not state.get("weights") else "finalize"
+
+    def prices(self, state: OptimizerState) -> pd.DataFrame:
+        tickers = sorted(state["history"])
+        frames = {
+            ticker: pd.DataFrame(
+                {"close": state["history"][ticker]["close"]},
+                index=pd.DatetimeIndex(state["history"][ticker]["dates"])
+            )
+            for ticker in tickers
+        }
+        return align(frames, tickers)
+
+    # ---------------------------------------------------------------------
+    # ENTRYPOINT
+    # ---------------------------------------------------------------------
+    async def run(self, tickers: list, servers: list = None, startDate: str = None, endDate: str = None) -> OptimizerState:
+        self.logger.info("Starting optimizer workflow...")
+        # node spans, and the Gemini, MCP and Polygon spans under them, share this run's trace
+        with telemetry.span("optimizer.run", tickers=len(tickers)):
+            return await self.workflow.ainvoke(
+                {"ticker": list(tickers), "servers": servers or [], "startDate": startDate, "endDate": endDate}
+            )
+
+    def visualize_graph(self):
+        try:
+            return self.workflow.get_graph().draw_ascii()
+        except Exception as e:
+            return f"Cannot draw graph: {e}"
@@ -0,0 +1,186 @@
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from app.coalescing import Coalescer
+
+
+class ResponseCache:
+    '''
+    Cache of LLM response text keyed by a canonical hash of everything that shapes the response
+    (model, prompt or system prompt, messages, tools and generation config)
+    An in memory LRU tier sits in front of an optional on disk tier of one JSON file per key, both
+    expire entries after ttl seconds. Identical requests arriving while the first is still running
+    share its call instead of each paying for one
+    Why: the same prompts (the optimizer's start date prompt on every run) were paid for again and again
+    '''
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024, root: str = None, max_disk_entries: int = 10_000):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.root = root
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.lock = threading.RLock()
+        self.in_flight = Coalescer()
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "bypassed": 0, "expired": 0,
+            "evictions": 0, "saved_tokens": 0, "saved_seconds": 0.0,
+        }
+
+        if self.root is not None:
+            os.makedirs(self.root, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # keys
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(model: str, payload: dict) -> str:
+        text = json.dumps({"model": model, **payload}, sort_keys=True, separators=(",", ":"), default=canonical)
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.json")
+
+    # ------------------------------------------------------------------
+    # tiers
+    # ------------------------------------------------------------------
+    def lookup(self, key: str):
+        '''
+        Cached entry for a key or None, a disk hit is promoted into memory
+        '''
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry["expires"] > now:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry
+                del self.entries[key]
+                self.stats["expired"] += 1
+
+        entry = self.read(key, now)
+        if entry is not None:
+            self.stats["disk_hits"] += 1
+            self.remember(key, entry)
+        return entry
+
+    def read(self, key: str, now: float):
+        if self.root is None:
+            return None
+        try:
+            with open(self.path(key), "r") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if entry["expires"] <= now:
+            self.stats["expired"] += 1
+            self.discard(key)
+            return None
+        # the file's modification time is its last use, which disk eviction goes by
+        os.utime(self.path(key))
+        return entry
+
+    def remember(self, key: str, entry: dict):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def store(self, key: str, text: str, tokens: int, seconds: float):
+        entry = {"text": text, "tokens": tokens or 0, "seconds": seconds, "expires": time.time() + self.ttl}
+        self.remember(key, entry)
+        if self.root is None:
+            return
+        # write to a temp file first so a concurrent reader never sees half an entry
+        with open(self.path(key) + ".tmp", "w") as file:
+            json.dump(entry, file)
+        os.replace(self.path(key) + ".tmp", self.path(key))
+        self.evict_disk()
+
+    def evict_disk(self):
+        names = [name for name in os.listdir(self.root) if name.endswith(".json")]
+        if len(names) <= self.max_disk_entries:
+            return
+        names.sort(key=lambda name: os.path.getmtime(os.path.join(self.root, name)))
+        for name in names[: len(names) - self.max_disk_entries]:
+            self.discard(name[: -len(".json")])
+            self.stats["evictions"] += 1
+
+    def discard(self, key: str):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.root is not None:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.entries):
+                self.discard(key)
+        if self.root is not None:
+            for name in os.listdir(self.root):
+                if name.endswith(".json"):
+                    self.discard(name[: -len(".json")])
+
+    # ------------------------------------------------------------------
+    # read through
+    # ------------------------------------------------------------------
+    async def fetch(self, key: str, call, use_cache: bool = True) -> str:
+        '''
+        Response text for a key, from the cache or from call()
+        call is a coroutine factory returning (text, tokens used), a None text is never cached
+        '''
+        if not use_cache:
+            self.stats["bypassed"] += 1
+            text, _ = await call()
+            return text
+
+        entry = self.lookup(key)
+        if entry is not None:
+            self.stats["saved_tokens"] += entry["tokens"]
+            self.stats["saved_seconds"] += entry["seconds"]
+            return entry["text"]
+
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+        return await self.in_flight.run(key, lambda: asyncio.get_running_loop().create_task(self.call(key, call)))
+
+    async def call(self, key: str, call) -> str:
+        started = time.perf_counter()
+        text, tokens = await call()
+        if text is not None:
+            self.store(key, text, tokens, time.perf_counter() - started)
+        return text
+
+    def report(self) -> dict:
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "in_flight": len(self.in_flight),
+        }
+
+
+def canonical(value):
+    # SDK types (types.Tool and friends) are pydantic models, sets have no order of their own
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
@@ -1,11 +1,19 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import matplotlib.pyplot as plt
-from pypfopt.efficient_frontier import EfficientFrontier
-from pypfopt import risk_models, expected_returns
-from pypfopt.discrete_allocation import DiscreteAllocation, get_latest_prices
+from pypfopt import expected_returns, risk_models
+from pypfopt.discrete_allocation import get_latest_prices
+from app.data.priceLoader import PriceLoader, YFinanceSource
+from app.data.priceCache import PriceCache, CachedSource
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio.rollingCovariance import RollingCovariance
+from app.portfolio.frontier import FrontierSweep
+from app.portfolio.solvers import PortfolioSolver
+from app.portfolio.allocation import DiscreteAllocator
+from app.portfolio.backtest import Backtester, BacktestParams
+from app.portfolio.monteCarlo import MonteCarloEngine
+from app.portfolio.selection import AssetSelector
 plt.style.use('fivethirtyeight')
 
 # TICKERS
@@ -14,16 +22,22 @@ assets = ['META', 'AMZN', 'AAPL', 'NFLX', 'GOOG']
 # weight assignment @ 20% each
 weights = np.array([0.2, 0.2, 0.2, 0.2, 0.2])
 
+# the demos after the optimization each take a while, set to True to run them
+run_backtest = False
+run_simulation = False
+run_selection = False
+run_frontier = False
+
 #start date, end date
 stockStartDate = '2013-01-01'
 today = datetime.today().strftime('%Y-%m-%d')
 print(today)
 
 #dataframe for stock prices, get the last traded prices
-df = pd.DataFrame()
-
-for stock in assets:
-    df[stock] = yf.download(stock, start = stockStartDate, end = today, progress = False)['Close']
+# only the bars missing from the local cache are downloaded
+cache = PriceCache('.cache/prices/yfinance')
+loader = PriceLoader(CachedSource(YFinanceSource(), cache))
+df = loader.load(assets, stockStartDate, today)
     
 #print(df)
 
@@ -47,42 +61,89 @@ print(returns)
 
 # covariance matrix, risk, shows variance and correlations, multiplying by # of trading days
 # diagonal is variance, else is covariance (diff from expected returns)
+# the engine annualizes the mean and covariance once and scores any number of weight rows against them
 
-annual_cov = returns.cov() * 252
+engine = RiskEngine.from_returns(returns)
+annual_cov = pd.DataFrame(engine.cov, index = engine.tickers, columns = engine.tickers)
 
 print(annual_cov)
 
-variance = np.dot(weights.T, np.dot(annual_cov, weights))
+metrics = engine.evaluate(weights)
+
+variance = metrics.variance[0]
 print(variance)
 
 # find volatility
 
-volatility = np.sqrt(variance)
+volatility = metrics.volatility[0]
 print(volatility)
 
 # annual return
-annual_return = np.sum(returns.mean() * weights) * 252
+annual_return = metrics.expected_return[0]
 print(annual_return)
 
 #optimize
 
 #expected returns
 mew = expected_returns.mean_historical_return(df)
-#sample covariance matrix of asset returns
-s = risk_models.sample_cov(df)
+#sample covariance matrix of asset returns, the estimator state is saved so the next run only applies new days
+estimator = RollingCovariance.load_or_create('.cache/covariance/static.npz', assets)
+estimator.refresh(df)
+estimator.save('.cache/covariance/static.npz')
+# pairwise estimates over staggered listings need not be PSD, repaired the way sample_cov does
+s = risk_models.fix_nonpositive_semidefinite(estimator.covariance())
 
 # max sharpe ratio, describe excess return given excess volatility in subtracting a risk free rate from a return / std dev
-ef = EfficientFrontier(mew, s)
-weights = ef.max_sharpe()
-cleaned_weights = ef.clean_weights()
+# long only max sharpe goes to the native active set solver, pypfopt only handles what it cannot
+solver = PortfolioSolver()
+result = solver.max_sharpe(mew, s)
+weights = result.weights
+cleaned_weights = result.clean_weights()
 print(cleaned_weights)
-ef.portfolio_performance(verbose = True)
+result.performance(mew, s, verbose = True)
+
+# the performance above is in sample, walk forward re-estimation over rolling one year windows
+# rebalanced monthly with 10bps costs shows what the strategy would have done out of sample
+if run_backtest:
+    backtest = Backtester.from_prices(df).run(BacktestParams(lookback = 252, rebalance_every = 21, cost_bps = 10))
+    print(backtest.summary())
+
+# volatility says nothing about the tails, one year of simulated paths bootstrapped from the history
+# gives VaR, CVaR and drawdowns for the optimized and the equal weight portfolio against the same scenarios
+if run_simulation:
+    simulation = MonteCarloEngine.from_returns(returns.dropna(), method = 'bootstrap')
+    candidates = pd.DataFrame([cleaned_weights, dict.fromkeys(assets, 1 / len(assets))], index = ['max_sharpe', 'equal_weight'])
+    print(simulation.simulate(candidates, paths = 10000).to_frame())
+
+# cardinality constrained: the best 3 of the 5 tickers for the mean-variance objective, found over the
+# QUBO by parallel tempering, then max sharpe weights over just those 3
+
+if run_selection:
+    selection, selected_result = AssetSelector(mew, s, solver = solver).optimize(3)
+    print(selection.tickers)
+    selected_result.performance(mew, s, verbose = True)
+
+# full efficient frontier, one problem warm started across every target return
+
+if run_frontier:
+    frontier = FrontierSweep(mew, s).efficient_return(points = 100)
+
+    plt.figure()
+    plt.plot(frontier.volatilities, frontier.returns)
+    plt.title('Efficient Frontier')
+    plt.xlabel('Volatility')
+    plt.ylabel('Expected Return')
+    # plt.show()
 
 # discrete allocation of share per stock
 
+# exact mode is the lp_portfolio MILP, greedy handles large universes and many account sizes in one call
+
 latest_prices = get_latest_prices(df)
-da = DiscreteAllocation(cleaned_weights, latest_prices, total_portfolio_value= 15000)
-allocation, leftover = da.lp_portfolio()
+allocator = DiscreteAllocator(cleaned_weights, latest_prices)
+allocated = allocator.allocate([15000], mode = 'exact')
+allocation, leftover = allocated.allocation(0), allocated.leftover[0]
 
 print(allocation)
-print(leftover)
\ No newline at end of file
+print(leftover)
+print(allocated.tracking_error[0])
\ No newline at end of file
@@ -0,0 +1,35 @@
+import asyncio
+
+
+class Coalescer:
+    '''
+    Shares one running call among every caller asking for the same key while it is in flight
+    Callers await it through asyncio.shield, so one caller being cancelled does not cancel the call
+    for everyone else, and the key is released as soon as the call finishes
+    '''
+
+    def __init__(self):
+        self.in_flight = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self.in_flight
+
+    def __len__(self) -> int:
+        return len(self.in_flight)
+
+    async def run(self, key, start):
+        '''
+        Awaits the call already running under key, or the future or task start() returns if there is none
+        key=None never coalesces
+        '''
+        future = self.in_flight.get(key) if key is not None else None
+        if future is None:
+            future = start()
+            if key is not None:
+                self.in_flight[key] = future
+                future.add_done_callback(lambda done: self.release(key, done))
+        return await asyncio.shield(future)
+
+    def release(self, key, future):
+        if self.in_flight.get(key) is future:
+            del self.in_flight[key]
@@ -0,0 +1,184 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+import itertools
+import logging
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+ALIGNMENT = 64
+
+
+@dataclass(frozen=True)
+class SnapshotHandle:
+    '''
+    Everything a worker needs to find one published snapshot, small enough to pickle per task
+    '''
+    name: str
+    version: int
+    tickers: tuple
+    n_dates: int
+
+    def layout(self) -> dict:
+        # dates, returns and latest prices are written by the publisher, mu and cov by the estimating worker
+        n, t = len(self.tickers), self.n_dates
+        arrays = {
+            "dates": ((t,), np.int64),
+            "returns": ((t, n), np.float64),
+            "latest": ((n,), np.float64),
+            "mu": ((n,), np.float64),
+            "cov": ((n, n), np.float64),
+        }
+        layout, offset = {}, 0
+        for name, (shape, dtype) in arrays.items():
+            layout[name] = (offset, shape, dtype)
+            offset += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // ALIGNMENT) * ALIGNMENT
+        return layout
+
+    @property
+    def nbytes(self) -> int:
+        offset, shape, dtype = self.layout()["cov"]
+        return max(offset + int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+
+
+class MarketSnapshot:
+    '''
+    NumPy views straight onto a shared memory segment, nothing is copied on attach
+    '''
+
+    def __init__(self, handle: SnapshotHandle, segment: shared_memory.SharedMemory):
+        self.handle = handle
+        self.segment = segment
+        for name, (offset, shape, dtype) in handle.layout().items():
+            setattr(self, name, np.ndarray(shape, dtype=dtype, buffer=segment.buf, offset=offset))
+
+    @property
+    def tickers(self) -> list:
+        return list(self.handle.tickers)
+
+    def returns_frame(self) -> pd.DataFrame:
+        # a single float64 block, pandas wraps the view without copying it
+        return pd.DataFrame(
+            self.returns, index=pd.DatetimeIndex(self.dates.view("datetime64[ns]")), columns=self.tickers, copy=False
+        )
+
+    def release(self):
+        for name in self.handle.layout():
+            setattr(self, name, None)
+        try:
+            self.segment.close()
+        except BufferError:
+            # a caller still holds a view, the mapping goes when that view is collected
+            pass
+
+
+class MarketDataStore:
+    '''
+    Publishes aligned market data into shared memory as immutable, versioned snapshots
+    One segment per snapshot holds the dates, the daily returns matrix, the latest prices and room
+    for the annualized mean and covariance. Workers get a SnapshotHandle and attach() to it, so a
+    universe is held once in memory however many processes read it, instead of once per pickled copy
+    A retired snapshot is unlinked once no batch holds it, workers that still map it keep a valid view
+    '''
+
+    def __init__(self, prefix: str = None):
+        self.logger = logging.getLogger(__name__)
+        self.prefix = prefix or f"mds_{os.getpid()}"
+        self.versions = itertools.count(1)
+        self.segments = {}
+        self.holds = {}
+        self.retired = set()
+        self.lock = threading.Lock()
+        self.stats = {"published": 0, "unlinked": 0, "bytes": 0}
+
+    def publish(self, prices: pd.DataFrame) -> SnapshotHandle:
+        '''
+        Writes a new snapshot from an aligned close price matrix, columns without any price are left out
+        '''
+        prices = prices.dropna(axis=1, how="all")
+        # the same returns RiskEngine.from_prices estimates from
+        returns = prices.pct_change().dropna(how="all")
+
+        with self.lock:
+            version = next(self.versions)
+        handle = SnapshotHandle(f"{self.prefix}_{version}", version, tuple(prices.columns), len(returns))
+        segment = shared_memory.SharedMemory(name=handle.name, create=True, size=handle.nbytes)
+
+        snapshot = MarketSnapshot(handle, segment)
+        snapshot.dates[:] = returns.index.values.astype("datetime64[ns]").astype(np.int64)
+        snapshot.returns[:] = returns.to_numpy(dtype=np.float64)
+        snapshot.latest[:] = prices.ffill().iloc[-1].to_numpy(dtype=np.float64) if len(prices) else np.nan
+        snapshot.mu[:] = np.nan
+        snapshot.cov[:] = np.nan
+        del snapshot
+
+        with self.lock:
+            self.segments[handle.name] = segment
+            self.holds[handle.name] = 0
+            self.stats["published"] += 1
+            self.stats["bytes"] += handle.nbytes
+        return handle
+
+    def acquire(self, handle: SnapshotHandle):
+        with self.lock:
+            self.holds[handle.name] += 1
+
+    def release(self, handle: SnapshotHandle):
+        with self.lock:
+            self.holds[handle.name] -= 1
+            if handle.name in self.retired and self.holds[handle.name] == 0:
+                self.unlink(handle.name)
+
+    def retire(self, handle: SnapshotHandle):
+        with self.lock:
+            if handle.name not in self.segments:
+                return
+            self.retired.add(handle.name)
+            if self.holds[handle.name] == 0:
+                self.unlink(handle.name)
+
+    def unlink(self, name: str):
+        segment = self.segments.pop(name)
+        self.holds.pop(name, None)
+        self.retired.discard(name)
+        self.stats["unlinked"] += 1
+        self.stats["bytes"] -= segment.size
+        segment.close()
+        segment.unlink()
+
+    def close(self):
+        with self.lock:
+            for name in list(self.segments):
+                self.unlink(name)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {**self.stats, "live": len(self.segments), "held": sum(1 for n in self.holds.values() if n)}
+
+
+# snapshots this process has attached to, kept open across tasks and closed oldest first
+attached = OrderedDict()
+MAX_ATTACHED = 8
+
+
+def attach(handle: SnapshotHandle) -> MarketSnapshot:
+    '''
+    Zero copy views of a published snapshot, attached once per process
+    '''
+    snapshot = attached.get(handle.name)
+    if snapshot is not None:
+        attached.move_to_end(handle.name)
+        return snapshot
+
+    # pool workers are children of the publisher and share its resource tracker, whose registrations
+    # are a set, so the registration made here is the publisher's and is cleared by its unlink
+    segment = shared_memory.SharedMemory(name=handle.name)
+
+    snapshot = MarketSnapshot(handle, segment)
+    attached[handle.name] = snapshot
+    while len(attached) > MAX_ATTACHED:
+        attached.popitem(last=False)[1].release()
+    return snapshot
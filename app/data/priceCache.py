@@ -0,0 +1,308 @@
+from collections import defaultdict
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.data.priceLoader import OHLCV_FIELDS, empty_frame
+
+
+class PriceCache:
+    '''
+    Persistent per ticker OHLCV cache stored as memory mapped NumPy arrays
+    Entries are keyed by ticker, timespan and adjustment flag and remember the half open
+    [start, end) range they cover, so a request only goes upstream for the uncovered edges
+    Why: every run re-downloaded the full history when only the newest bar had changed
+    Adjusted history is rebased upstream on every split and dividend, so adjusted fetches also
+    cover one cached bar and consistent() tells when the cached entry has to be refetched whole
+    '''
+
+    INDEX_FILE = "index.json"
+
+    def __init__(self, root: str = ".cache/prices", max_bytes: int = 1 << 30, max_entries: int = None):
+        self.logger = logging.getLogger(__name__)
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.key_locks = defaultdict(threading.Lock)
+        self.stats = {"hits": 0, "partial_hits": 0, "misses": 0, "upstream_calls": 0, "evictions": 0, "rebased": 0}
+
+        os.makedirs(self.root, exist_ok=True)
+        self.index = self.read_index()
+
+    # ------------------------------------------------------------------
+    # keys and index
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(ticker: str, timespan: str = "day", adjusted: bool = True) -> str:
+        return f"{ticker.replace('/', '_')}__{timespan}__{'adj' if adjusted else 'raw'}"
+
+    def paths(self, key: str) -> tuple:
+        return (
+            os.path.join(self.root, f"{key}.dates.npy"),
+            os.path.join(self.root, f"{key}.values.npy"),
+        )
+
+    def read_index(self) -> dict:
+        try:
+            with open(os.path.join(self.root, self.INDEX_FILE), "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def write_index(self):
+        path = os.path.join(self.root, self.INDEX_FILE)
+        with open(path + ".tmp", "w") as file:
+            json.dump(self.index, file)
+        os.replace(path + ".tmp", path)
+
+    def size(self) -> int:
+        return sum(entry["bytes"] for entry in self.index.values())
+
+    def bars(self, key: str) -> tuple:
+        # first and last cached bar dates, None for an entry without bars
+        dates = np.load(self.paths(key)[0], mmap_mode="r")
+        if not len(dates):
+            return None
+        return pd.Timestamp(int(dates[0])), pd.Timestamp(int(dates[-1]))
+
+    # ------------------------------------------------------------------
+    # lookups
+    # ------------------------------------------------------------------
+    def lookup(self, ticker: str, start, end, timespan: str = "day", adjusted: bool = True) -> list:
+        '''
+        Returns the [start, end) ranges that still need to come from upstream and records hit/miss
+        Missing ranges always extend the covered range contiguously so coverage never has holes
+        Adjusted ranges reach one cached bar into the entry, so consistent() can compare it
+        '''
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        key = self.key(ticker, timespan, adjusted)
+        # the index and stats are shared with store() and evict() on other threads
+        with self.lock:
+            entry = self.index.get(key)
+
+            if entry is None:
+                self.stats["misses"] += 1
+                return [(start, end)]
+
+            covered_start, covered_end = pd.Timestamp(entry["start"]), pd.Timestamp(entry["end"])
+            missing = []
+            if start < covered_start:
+                missing.append((start, covered_start))
+            if end > covered_end:
+                missing.append((covered_end, end))
+
+            bars = self.bars(key) if adjusted and missing else None
+            if bars is not None:
+                first, last = bars
+                missing = [
+                    (range_start, first + pd.Timedelta(days=1)) if range_end == covered_start else (last, range_end)
+                    for range_start, range_end in missing
+                ]
+
+            self.stats["partial_hits" if missing else "hits"] += 1
+            return missing
+
+    def read(self, ticker: str, start, end, timespan: str = "day", adjusted: bool = True) -> pd.DataFrame:
+        key = self.key(ticker, timespan, adjusted)
+        dates_path, values_path = self.paths(key)
+
+        with self.lock:
+            if key not in self.index:
+                return empty_frame()
+            self.index[key]["last_access"] = time.time()
+
+        dates = np.load(dates_path, mmap_mode="r")
+        values = np.load(values_path, mmap_mode="r")
+        lo = np.searchsorted(dates, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(dates, pd.Timestamp(end).value, side="left")
+
+        return pd.DataFrame(
+            np.array(values[lo:hi]),
+            index=pd.DatetimeIndex(np.array(dates[lo:hi]).astype("datetime64[ns]")),
+            columns=OHLCV_FIELDS,
+        )
+
+    # ------------------------------------------------------------------
+    # writes
+    # ------------------------------------------------------------------
+    def store(self, ticker: str, frame: pd.DataFrame, start, end, timespan: str = "day", adjusted: bool = True):
+        '''
+        Merges freshly fetched bars for [start, end) into the entry, newer bars win on overlap
+        Coverage is capped at the start of today so the live session is always refetched
+        '''
+        key = self.key(ticker, timespan, adjusted)
+        dates_path, values_path = self.paths(key)
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is not None:
+                old = self.read(ticker, pd.Timestamp.min, pd.Timestamp.max, timespan, adjusted)
+                frame = pd.concat([old, frame[OHLCV_FIELDS]]) if len(frame) else old
+                start = min(start, pd.Timestamp(entry["start"]))
+                end = max(end, pd.Timestamp(entry["end"]))
+
+            frame = frame[~frame.index.duplicated(keep="last")].sort_index()
+            end = min(end, pd.Timestamp.today().normalize())
+
+            dates = frame.index.values.astype("datetime64[ns]").astype(np.int64)
+            values = frame[OHLCV_FIELDS].to_numpy(dtype=np.float64)
+            # write to temp files first so concurrent readers never see a half written array
+            np.save(dates_path + ".tmp.npy", dates)
+            np.save(values_path + ".tmp.npy", values)
+            os.replace(dates_path + ".tmp.npy", dates_path)
+            os.replace(values_path + ".tmp.npy", values_path)
+
+            self.index[key] = {
+                "ticker": ticker,
+                "timespan": timespan,
+                "adjusted": adjusted,
+                "start": start.isoformat(),
+                "end": max(start, end).isoformat(),
+                "bytes": os.path.getsize(dates_path) + os.path.getsize(values_path),
+                "last_access": time.time(),
+            }
+            self.evict(keep=key)
+            self.write_index()
+
+    def consistent(self, ticker: str, frame: pd.DataFrame, timespan: str = "day", adjusted: bool = True, rtol: float = 1e-5) -> bool:
+        '''
+        False if freshly fetched adjusted bars disagree with the cached bars on the same dates,
+        i.e. upstream re-adjusted the history for a split or dividend since the entry was stored
+        '''
+        if not adjusted or not len(frame) or self.key(ticker, timespan, adjusted) not in self.index:
+            return True
+        cached = self.read(ticker, frame.index[0], frame.index[-1] + pd.Timedelta(days=1), timespan, adjusted)
+        dates = cached.index.intersection(frame.index)
+        if not len(dates):
+            return True
+        prices = ["open", "high", "low", "close"]
+        return np.allclose(
+            frame.loc[dates, prices].to_numpy(dtype=np.float64),
+            cached.loc[dates, prices].to_numpy(dtype=np.float64),
+            rtol=rtol, atol=0, equal_nan=True,
+        )
+
+    def rebase(self, ticker: str, timespan: str = "day", adjusted: bool = True):
+        # the whole entry is on the old adjustment basis, drop it so the caller refetches the range
+        self.logger.info("Cached %s history was re-adjusted upstream, refetching", ticker)
+        with self.lock:
+            self.remove(self.key(ticker, timespan, adjusted))
+            self.stats["rebased"] += 1
+
+    def evict(self, keep: str = None):
+        '''
+        Drops least recently used entries until the cache fits max_bytes and max_entries
+        '''
+        with self.lock:
+            order = sorted(self.index, key=lambda k: self.index[k]["last_access"])
+            for key in order:
+                over_bytes = self.size() > self.max_bytes
+                over_entries = self.max_entries is not None and len(self.index) > self.max_entries
+                if not (over_bytes or over_entries):
+                    break
+                if key == keep:
+                    continue
+                self.remove(key)
+                self.stats["evictions"] += 1
+
+    def remove(self, key: str):
+        with self.lock:
+            self.index.pop(key, None)
+            for path in self.paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self.lock:
+            for key in list(self.index):
+                self.remove(key)
+            self.write_index()
+
+    def count(self, name: str):
+        with self.lock:
+            self.stats[name] += 1
+
+    # ------------------------------------------------------------------
+    # read through helpers
+    # ------------------------------------------------------------------
+    def get(self, ticker: str, start, end, fetch, timespan: str = "day", adjusted: bool = True) -> pd.DataFrame:
+        '''
+        Read through access for a single ticker
+        fetch(start, end) must return an OHLCV frame for the half open range
+        '''
+        with self.key_locks[self.key(ticker, timespan, adjusted)]:
+            for range_start, range_end in self.lookup(ticker, start, end, timespan, adjusted):
+                self.count("upstream_calls")
+                frame = fetch(range_start, range_end)
+                if not self.consistent(ticker, frame, timespan, adjusted):
+                    self.rebase(ticker, timespan, adjusted)
+                    self.count("upstream_calls")
+                    range_start, range_end = pd.Timestamp(start), pd.Timestamp(end)
+                    self.store(ticker, fetch(range_start, range_end), range_start, range_end, timespan, adjusted)
+                    break
+                self.store(ticker, frame, range_start, range_end, timespan, adjusted)
+            return self.read(ticker, start, end, timespan, adjusted)
+
+    def report(self) -> dict:
+        requests = self.stats["hits"] + self.stats["partial_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "requests": requests,
+            "hit_rate": self.stats["hits"] / requests if requests else 0.0,
+            "entries": len(self.index),
+            "bytes": self.size(),
+        }
+
+
+class CachedSource:
+    '''
+    PriceSource wrapper that serves what it can from a PriceCache
+    Tickers sharing the same missing range are fetched upstream as one batch
+    '''
+
+    def __init__(self, source, cache: PriceCache, timespan: str = "day", adjusted: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.source = source
+        self.cache = cache
+        self.timespan = timespan
+        self.adjusted = adjusted
+
+    def fetch(self, tickers: list, start: str, end: str) -> dict:
+        pending = defaultdict(list)
+        for ticker in tickers:
+            for missing in self.cache.lookup(ticker, start, end, self.timespan, self.adjusted):
+                pending[missing].append(ticker)
+
+        rebased = []
+        for (range_start, range_end), group in pending.items():
+            group = [ticker for ticker in group if ticker not in rebased]
+            if not group:
+                continue
+            self.cache.count("upstream_calls")
+            frames = self.source.fetch(group, range_start.strftime("%Y-%m-%d"), range_end.strftime("%Y-%m-%d"))
+            for ticker in group:
+                frame = frames.get(ticker, empty_frame())
+                if not self.cache.consistent(ticker, frame, self.timespan, self.adjusted):
+                    self.cache.rebase(ticker, self.timespan, self.adjusted)
+                    rebased.append(ticker)
+                    continue
+                self.cache.store(ticker, frame, range_start, range_end, self.timespan, self.adjusted)
+
+        if rebased:
+            # one batch refetch of the requested range for every ticker whose entry was dropped
+            self.cache.count("upstream_calls")
+            frames = self.source.fetch(rebased, start, end)
+            for ticker in rebased:
+                self.cache.store(ticker, frames.get(ticker, empty_frame()), start, end, self.timespan, self.adjusted)
+
+        self.logger.info("Price cache: %s", self.cache.report())
+        return {ticker: self.cache.read(ticker, start, end, self.timespan, self.adjusted) for ticker in tickers}
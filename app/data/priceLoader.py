@@ -0,0 +1,229 @@
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from typing import Protocol
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.telemetry import telemetry
+
+OHLCV_FIELDS = ["open", "high", "low", "close", "volume"]
+
+
+class PriceSource(Protocol):
+    '''
+    Anything that can return daily OHLCV bars for a batch of tickers
+    Frames are indexed by date and carry the lowercase OHLCV_FIELDS columns
+    '''
+
+    def fetch(self, tickers: list, start: str, end: str) -> dict: ...
+
+
+class YFinanceSource:
+    '''
+    Yahoo Finance source, one yf.download call per batch instead of per ticker
+    '''
+
+    def __init__(self, auto_adjust: bool = True):
+        self.auto_adjust = auto_adjust
+
+    def fetch(self, tickers: list, start: str, end: str) -> dict:
+        import yfinance as yf
+
+        raw = yf.download(
+            tickers,
+            start=start,
+            end=end,
+            group_by="ticker",
+            auto_adjust=self.auto_adjust,
+            threads=False,  # concurrency is owned by the PriceLoader
+            progress=False,
+            multi_level_index=True,
+        )
+
+        frames = {}
+        if raw is None or raw.empty:
+            return frames
+
+        for ticker in tickers:
+            if ticker not in raw.columns.get_level_values(0):
+                continue
+            frame = raw[ticker].rename(columns=str.lower)[OHLCV_FIELDS].dropna(how="all")
+            frame.index = pd.DatetimeIndex(frame.index).tz_localize(None)
+            frames[ticker] = frame
+        return frames
+
+
+class PolygonSource:
+    '''
+    Polygon aggregates source, mirrors the get_aggs call made by the polygon MCP server
+    '''
+
+    def __init__(self, api_key: str = None, client=None, adjusted: bool = True, timespan: str = "day"):
+        if client is None:
+            from polygon.rest import RESTClient
+            from app.settings import Settings
+
+            client = RESTClient(api_key=api_key or Settings.POLYGON_API_KEY)
+        self.client = client
+        self.adjusted = adjusted
+        self.timespan = timespan
+
+    def fetch(self, tickers: list, start: str, end: str) -> dict:
+        # get_aggs treats `to` as inclusive, sources use yfinance style [start, end)
+        last = (pd.Timestamp(end) - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+        frames = {}
+        for ticker in tickers:
+            with telemetry.span("polygon.get_aggs", ticker=ticker, start=start, end=last) as span:
+                aggs = self.client.get_aggs(
+                    ticker=ticker,
+                    multiplier=1,
+                    timespan=self.timespan,
+                    from_=start,
+                    to=last,
+                    adjusted=self.adjusted,
+                )
+                span.set(bars=len(aggs or []))
+            telemetry.count("polygon_calls_total", call="get_aggs")
+            telemetry.count("polygon_bars_total", len(aggs or []))
+            if aggs:
+                frames[ticker] = aggs_to_frame(aggs)
+        return frames
+
+
+class FixtureSource:
+    '''
+    Offline source backed by in-memory frames, used for benchmarks and local runs
+    latency simulates the round trip cost of one upstream call
+    '''
+
+    def __init__(self, frames: dict, latency: float = 0.0):
+        self.frames = frames
+        self.latency = latency
+        self.calls = 0
+
+    @classmethod
+    def synthetic(cls, tickers: list, start: str, end: str, seed: int = 0, latency: float = 0.0):
+        # geometric brownian motion closes on business days, one random listing gap per ticker
+        rng = np.random.default_rng(seed)
+        dates = pd.bdate_range(start, end)
+        n = len(dates)
+
+        frames = {}
+        for ticker in tickers:
+            drift = rng.normal(0.0004, 0.0002)
+            vol = rng.uniform(0.01, 0.03)
+            close = 100 * np.exp(np.cumsum(rng.normal(drift, vol, n)))
+            first = int(rng.integers(0, max(n // 10, 1)))
+            frames[ticker] = pd.DataFrame(
+                {
+                    "open": close,
+                    "high": close * 1.01,
+                    "low": close * 0.99,
+                    "close": close,
+                    "volume": rng.integers(1e5, 1e7, n).astype(np.float64),
+                },
+                index=dates,
+            ).iloc[first:]
+        return cls(frames, latency=latency)
+
+    def fetch(self, tickers: list, start: str, end: str) -> dict:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        frames = {}
+        for ticker in tickers:
+            frame = self.frames.get(ticker)
+            if frame is None:
+                continue
+            # yfinance style half open interval [start, end)
+            frames[ticker] = frame.loc[(frame.index >= start) & (frame.index < end)]
+        return frames
+
+
+def empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(index=pd.DatetimeIndex([]), columns=OHLCV_FIELDS, dtype=np.float64)
+
+
+def aggs_to_frame(aggs) -> pd.DataFrame:
+    '''
+    Converts a polygon get_aggs result into an OHLCV frame indexed by exchange date
+    '''
+    timestamps = np.fromiter((a.timestamp for a in aggs), dtype=np.int64, count=len(aggs))
+    values = np.array(
+        [[a.open, a.high, a.low, a.close, a.volume] for a in aggs],
+        dtype=np.float64,
+    )
+    dates = (
+        pd.to_datetime(timestamps, unit="ms", utc=True)
+        .tz_convert("America/New_York")
+        .tz_localize(None)
+        .normalize()
+    )
+    return pd.DataFrame(values, index=dates, columns=OHLCV_FIELDS)
+
+
+def align(frames: dict, tickers: list, field: str = "close") -> pd.DataFrame:
+    '''
+    Builds one date aligned float64 matrix from per ticker frames in a single allocation
+    Tickers without data keep an all NaN column so the column order always matches tickers
+    '''
+    present = [frames[t] for t in tickers if t in frames and len(frames[t])]
+    if present:
+        dates = np.unique(np.concatenate([f.index.values for f in present]))
+    else:
+        dates = np.array([], dtype="datetime64[ns]")
+
+    matrix = np.full((len(dates), len(tickers)), np.nan, dtype=np.float64)
+    for j, ticker in enumerate(tickers):
+        frame = frames.get(ticker)
+        if frame is None or not len(frame):
+            continue
+        rows = np.searchsorted(dates, frame.index.values)
+        matrix[rows, j] = frame[field].to_numpy(dtype=np.float64)
+
+    return pd.DataFrame(matrix, index=pd.DatetimeIndex(dates, name="Date"), columns=list(tickers))
+
+
+class PriceLoader:
+    '''
+    Fetches a ticker universe in batches over a bounded thread pool
+    Why: the per ticker yf.download loop dominated the static optimizer run time
+    '''
+
+    def __init__(self, source: PriceSource, batch_size: int = 50, max_workers: int = 8):
+        self.logger = logging.getLogger(__name__)
+        self.source = source
+        self.batch_size = max(1, batch_size)
+        self.max_workers = max(1, max_workers)
+
+    def batches(self, tickers: list) -> list:
+        return [tickers[i:i + self.batch_size] for i in range(0, len(tickers), self.batch_size)]
+
+    def load_ohlcv(self, tickers: list, start: str, end: str) -> dict:
+        tickers = list(dict.fromkeys(tickers))
+        batches = self.batches(tickers)
+
+        frames = {}
+        if len(batches) == 1 or self.max_workers == 1:
+            for batch in batches:
+                frames.update(self.source.fetch(batch, start, end))
+        else:
+            # a context copy per batch keeps upstream spans under the caller's span in the worker threads
+            contexts = [contextvars.copy_context() for _ in batches]
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as pool:
+                for result in pool.map(lambda context, batch: context.run(self.source.fetch, batch, start, end), contexts, batches):
+                    frames.update(result)
+
+        missing = [t for t in tickers if t not in frames]
+        if missing:
+            self.logger.warning("No price data returned for %d tickers: %s", len(missing), missing)
+        return frames
+
+    def load(self, tickers: list, start: str, end: str, field: str = "close") -> pd.DataFrame:
+        tickers = list(dict.fromkeys(tickers))
+        return align(self.load_ohlcv(tickers, start, end), tickers, field)
@@ -0,0 +1,95 @@
+from contextlib import asynccontextmanager
+import os
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+import uvicorn
+
+from app.settings import Settings
+from app.data.priceLoader import PriceLoader, PolygonSource
+from app.data.priceCache import PriceCache, CachedSource
+from app.models import RebalanceRequest, JobStatus
+from app.service.jobManager import JobManager
+from app.telemetry import configure, telemetry
+
+
+def default_loader() -> PriceLoader:
+    # bars missing from the local price cache are the only ones fetched
+    return PriceLoader(
+        CachedSource(
+            PolygonSource(Settings.POLYGON_API_KEY),
+            PriceCache(os.path.join(Settings.PRICE_CACHE_DIR, "polygon"), Settings.PRICE_CACHE_MAX_BYTES)
+        )
+    )
+
+
+def create_app(loader: PriceLoader = None, max_workers: int = None) -> FastAPI:
+    '''
+    Optimizer job API
+        POST /jobs                  submit one rebalance request, returns its job straight away
+        POST /jobs/batch            submit many at once
+        GET  /jobs/{id}             poll a job
+        GET  /jobs/{id}/events      stream a job's status changes as server sent events until it finishes
+        GET  /stats                 batching, estimate reuse and job counts
+        GET  /metrics               spans, token and byte counters in the Prometheus text format
+    '''
+    configure()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        app.state.jobs = JobManager(
+            loader or default_loader(),
+            max_workers=max_workers or Settings.JOB_WORKERS,
+            batch_window=Settings.JOB_BATCH_WINDOW,
+            estimate_ttl=Settings.JOB_ESTIMATE_TTL
+        )
+        await app.state.jobs.start()
+        yield
+        await app.state.jobs.close()
+
+    app = FastAPI(title="Portfolio Optimization", lifespan=lifespan)
+
+    def find(job_id: str):
+        job = app.state.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        return job
+
+    @app.post("/jobs", status_code=202)
+    async def submit(request: RebalanceRequest) -> JobStatus:
+        return app.state.jobs.submit(request).snapshot()
+
+    @app.post("/jobs/batch", status_code=202)
+    async def submit_batch(requests: list[RebalanceRequest]) -> list[JobStatus]:
+        return [app.state.jobs.submit(request).snapshot() for request in requests]
+
+    @app.get("/jobs/{job_id}")
+    async def status(job_id: str) -> JobStatus:
+        return find(job_id).snapshot()
+
+    @app.get("/jobs/{job_id}/events")
+    async def events(job_id: str):
+        find(job_id)
+
+        async def stream():
+            async for snapshot in app.state.jobs.watch(job_id):
+                yield f"event: {snapshot.status}\ndata: {snapshot.model_dump_json()}\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats() -> dict:
+        return {**app.state.jobs.report(), "telemetry": telemetry.report()}
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics() -> str:
+        return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4")
+
+    return app
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,159 @@
+import json
+import logging
+import re
+
+from app.tokens import estimate_tokens
+
+RESULTS_HEADER = "New context received:\n"
+FAILURES_HEADER = "Tool error. Provide new arguments for these calls only. RESPONSE:\n"
+# collapsed messages keep one reference per result and one label per failure under these headers
+COLLAPSED = {
+    RESULTS_HEADER: "Earlier context, kept out of band:\n",
+    FAILURES_HEADER: "Earlier failed calls:\n",
+}
+REFERENCE = re.compile(r"(.*? -> (?:context\[\d+\]|failed))")
+
+
+class contextManager:
+    '''
+    Keeps the executor's message log small enough to resend every turn
+    Tool results larger than inline_chars stay out of band in state["context"] and the model sees
+    a reference (context[i]), the size and a short outline of the data instead. Before each LLM call
+    the log is fitted to a token budget: the first user message (the request) and the latest turns
+    are kept, older result messages are collapsed to their references and the oldest turns are
+    dropped last. Prompt size per turn is recorded in state["execution_log"]
+    Why: every turn used to resend every raw tool response, so prompts grew with the square of the calls
+    '''
+
+    def __init__(self, budget: int = 30_000, inline_chars: int = 2_000, preview_chars: int = 200, keep_turns: int = 2):
+        self.logger = logging.getLogger(__name__)
+        self.budget = budget
+        self.inline_chars = inline_chars
+        self.preview_chars = preview_chars
+        self.keep_turns = keep_turns
+
+    # ------------------------------------------------------------------
+    # results
+    # ------------------------------------------------------------------
+    def record(self, state: dict, label: str, response: str) -> str:
+        '''
+        Stores a tool response in state["context"] and returns the line the model sees for it
+        '''
+        index = len(state["context"])
+        state["context"].append(response)
+        if len(response) <= self.inline_chars:
+            return f"{label} -> context[{index}]: {response}"
+        return f"{label} -> context[{index}] stored out of band, {len(response)} chars, {outline(response)}, starts {response[:self.preview_chars]!r}"
+
+    @staticmethod
+    def failure(label: str, response: str) -> str:
+        return f"{label} -> failed: {response}"
+
+    def results_message(self, results: list, failures: list) -> dict:
+        # every result of the turn goes back to the model as one message, with one part per result
+        # or failure so collapse() handles each as a unit however many lines its text spans
+        parts = []
+        for header, entries in ((RESULTS_HEADER, results), (FAILURES_HEADER, failures)):
+            if entries:
+                parts.append({"text": header})
+                parts.extend({"text": entry + "\n"} for entry in entries)
+        return {"role": "user", "parts": parts}
+
+    # ------------------------------------------------------------------
+    # prompt
+    # ------------------------------------------------------------------
+    def fit(self, state: dict, system_prompt: str = "") -> list:
+        '''
+        Messages to send this turn, within budget tokens together with the system prompt
+        state["messages"] itself is left whole
+        '''
+        messages = list(state["messages"])
+        fixed = estimate_tokens(system_prompt)
+        sizes = [estimate_tokens(message_text(message)) for message in messages]
+        collapsed = dropped = 0
+
+        # the request and the latest turns (a model reply and the results it led to) are always sent
+        recent = len(messages) - 2 * self.keep_turns
+        for i, message in enumerate(messages):
+            if fixed + sum(sizes) <= self.budget:
+                break
+            if i == 0 or i >= recent or not is_results(message):
+                continue
+            messages[i] = collapse(message)
+            sizes[i] = estimate_tokens(message_text(messages[i]))
+            collapsed += 1
+
+        while fixed + sum(sizes) > self.budget and len(messages) - 2 * self.keep_turns >= 3:
+            # drop the oldest model reply with the results that answered it, so roles still alternate
+            del messages[1:3], sizes[1:3]
+            dropped += 2
+
+        tokens = fixed + sum(sizes)
+        entry = {
+            "turn": sum(1 for message in state["messages"] if message.get("role") == "model") + 1,
+            "messages": len(messages),
+            "prompt_tokens": tokens,
+            "history_tokens": fixed + sum(estimate_tokens(message_text(message)) for message in state["messages"]),
+            "collapsed": collapsed,
+            "dropped": dropped,
+            "context_items": len(state["context"]),
+        }
+        state["execution_log"].append(entry)
+        if tokens > self.budget:
+            self.logger.warning("Prompt of %d tokens is over the %d token budget after trimming", tokens, self.budget)
+        self.logger.info("Turn %d prompt: %d messages, ~%d tokens (history ~%d, %d collapsed, %d dropped)",
+                         entry["turn"], entry["messages"], tokens, entry["history_tokens"], collapsed, dropped)
+        return messages
+
+
+def message_text(message: dict) -> str:
+    return "".join(part.get("text", "") for part in message.get("parts", []))
+
+
+def is_results(message: dict) -> bool:
+    return message.get("role") == "user" and any(
+        part.get("text", "") in COLLAPSED for part in message.get("parts", [])
+    )
+
+
+def collapse(message: dict) -> dict:
+    # every result part becomes its context reference and every failure its call label, without the
+    # inlined data or error text
+    parts, section = [], None
+    for part in message["parts"]:
+        text = part.get("text", "")
+        if text in COLLAPSED:
+            section, text = text, COLLAPSED[text]
+        elif section is not None:
+            text = reference(text) + "\n"
+        parts.append({**part, "text": text})
+    return {**message, "parts": parts}
+
+
+def reference(entry: str) -> str:
+    match = REFERENCE.match(entry)
+    return match.group(1) if match else entry.split("\n", 1)[0][:80]
+
+
+def outline(response: str, depth: int = 2) -> str:
+    '''
+    Short description of the shape of a JSON response, e.g. object{t: array[252], AAPL: object{c: array[252]}}
+    '''
+    try:
+        value = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        return f"text, {response.count(chr(10)) + 1} lines"
+    return shape(value, depth)
+
+
+def shape(value, depth: int) -> str:
+    if isinstance(value, dict):
+        if depth == 0:
+            return f"object[{len(value)}]"
+        items = [f"{key}: {shape(v, depth - 1)}" for key, v in list(value.items())[:8]]
+        more = f", +{len(value) - 8} keys" if len(value) > 8 else ""
+        return "object{" + ", ".join(items) + more + "}"
+    if isinstance(value, list):
+        inner = f" of {shape(value[0], depth - 1)}" if value and depth > 0 and isinstance(value[0], (dict, list)) else ""
+        return f"array[{len(value)}]{inner}"
+    return type(value).__name__
@@ -8,6 +8,12 @@ from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_excep
 import json
 from uuid import uuid4
 from app.models import ChatRequest, ChatResponse
+from app.mcp.client.contextManager import contextManager
+from app.mcp.client.mcpTransport import mcpTransport
+from app.mcp.client.sessionManager import sessionManager
+from app.mcp.client.toolRegistry import toolRegistry
+from app.telemetry import configure, telemetry, text_bytes
+from collections import defaultdict
 import asyncio
 
 class executionState(TypedDict):
@@ -19,6 +25,8 @@ class executionState(TypedDict):
     arguments: dict
     context: list
     problemStatus: bool
+    # this run's tool registry, set at initialize, runs sharing an executor may use different servers
+    registry: toolRegistry
 
 
 class mcpExecutor:
@@ -26,17 +34,29 @@ class mcpExecutor:
     Agent for MCP standardized tool calling using LangGraph
     """
 
-    def __init__(self, llm_client: GeminiClient):
+    def __init__(
+        self,
+        llm_client: GeminiClient,
+        session_ttl: float = 900,
+        max_calls_per_server: int = 8,
+        transport: mcpTransport = None,
+        context_budget: int = 30_000,
+        inline_chars: int = 2_000
+    ):
 
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(name)s: %(message)s"
-        )
+        configure()
 
         self.logger = logging.getLogger(__name__)
         self.llm = llm_client
-        self.httpx_client = httpx.AsyncClient()
-        self.mcp_headers = {}
+        # pooled, streaming transport shared by every server and run
+        self.transport = transport or mcpTransport()
+        self.httpx_client = self.transport.client
+        # sessions and tool lists outlive a single workflow run
+        self.sessions = sessionManager(self.transport, ttl=session_ttl)
+        # one turn can hold many calls, cap how many hit the same server at once
+        self.server_limits = defaultdict(lambda: asyncio.Semaphore(max_calls_per_server))
+        # large tool results stay out of band and the resent history is held to a token budget
+        self.context = contextManager(budget=context_budget, inline_chars=inline_chars)
 
         self.setup_graph()
 
@@ -45,12 +65,9 @@ class mcpExecutor:
 
         graph = StateGraph(executionState)
 
-        graph.add_node("initialize", self.initialize)
-        graph.add_node("getArguments", self.getArguments)
-        graph.add_node("executeTool", self.executeTool)
-        graph.add_node("validation", self.validation)
-        graph.add_node("finalization", self.finalization)
-        graph.add_node("handleErrors", self.handleErrors)
+        # every node runs inside a span, so a run's trace shows where its time went
+        for name in ("initialize", "getArguments", "executeTool", "validation", "finalization", "handleErrors"):
+            graph.add_node(name, telemetry.traced(f"executor.{name}", getattr(self, name)))
 
         graph.set_entry_point("initialize")
         graph.add_edge("initialize", "getArguments")
@@ -75,23 +92,13 @@ class mcpExecutor:
 
     async def initialize(self, state: executionState) -> executionState:
 
-        self.logger.info(f"Commencing MCP Initialization")
-
-        self.mcp_headers = {
-            server: {
-                "Content-Type": "application/json",
-                "Accept": "application/json, text/event-stream",
-                "MCP-Protocol-Version": "2025-06-18"
-            } for server in state["servers"]
-        }
-
-        for server in state["servers"]:
-            ping_status = await self.ping(server)
-            await self.handshake(server)
-            self.logger.info(f"Server {server} ping OK: {ping_status}")
+        self.logger.info("Commencing MCP Initialization")
 
         state["tools"] = await self.list_tools(state["servers"])
-        self.logger.info(f"Verified tools: {state['tools']}")
+        state["registry"] = self.sessions.registry(state["servers"])
+        self.logger.info("MCP sessions: %s", self.sessions.report())
+        self.logger.info("Verified %d tools", len(state["tools"]))
+        telemetry.log_payload(self.logger, "Verified tools: %s", state["tools"])
 
         return state
 
@@ -103,20 +110,23 @@ class mcpExecutor:
             with open("app/prompts/mcpExecutor_getArguments.txt", "r") as file:
                 prompt = file.read()
 
+            # the calls come back as JSON text, so the tools are described in the prompt
+            # rather than declared as Gemini functions
+            system_prompt = f"{prompt}\n\nAvailable tools:\n{state['registry'].catalogue}"
             resp = await self.llm.chat_completion(
                 ChatRequest(
                     model=Settings.GEMINI_MODEL,
-                    system_prompt=prompt,
-                    messages=state["messages"],
-                    tools=state["tools"],
+                    system_prompt=system_prompt,
+                    messages=self.context.fit(state, system_prompt),
+                    tools=[],
                 )
             )
 
-            state["arguments"] = resp.response
             state["messages"].append({"role": "model", "parts": [{"text": resp.response}]})
+            state["arguments"] = self.parse_calls(resp.response)
 
         except Exception as e:
-            self.logger.error(f"Argument generation failed: {e}")
+            self.logger.error("Argument generation failed: %s", e)
             state["errors"].append(str(e))
 
         return state
@@ -130,34 +140,28 @@ class mcpExecutor:
                 self.logger.info("LLM says request is completed; skipping tool")
                 return state
 
-            tool = state["arguments"].get("tool")
-            args = state["arguments"].get("args")
+            calls = state["arguments"].get("calls")
 
-            if not tool or args is None:
+            if not calls:
                 self.logger.error("Missing tool or args")
                 state["errors"].append("Missing tool or args")
                 return state
 
-            response = await self.tool_call(tool, args, state["tools"])
-
-            if isinstance(response, str) and "error" in response.lower():
-                state["messages"].append({
-                    "role": "user",
-                    "parts": [{
-                        "text": f"Tool error. Provide new arguments. RESPONSE: {response}"
-                    }]
-                })
-            else:
-                state["context"].append(response)
-                state["messages"].append({
-                    "role": "user",
-                    "parts": [{
-                        "text": f"New context received: {response}"
-                    }]
-                })
+            responses = await self.tool_calls(calls, state["registry"])
+
+            results, failures = [], []
+            for call, response in zip(calls, responses):
+                label = f"{call.get('tool', '?')}({json.dumps(call.get('args', {}), separators=(',', ':'), default=str)})"
+                if self.is_error(response):
+                    failures.append(self.context.failure(label, response))
+                else:
+                    results.append(self.context.record(state, label, response))
+            self.logger.info("Executed %d tool calls, %d failed", len(calls), len(failures))
+
+            state["messages"].append(self.context.results_message(results, failures))
 
         except Exception as e:
-            self.logger.error(f"Tool execution failure: {e}")
+            self.logger.error("Tool execution failure: %s", e)
             state["errors"].append(str(e))
 
         return state
@@ -190,82 +194,141 @@ class mcpExecutor:
         return "getArguments"
 
 
+    async def make_request(self, method: str, args: dict, url: str, on_notification=None):
+        # one span per request including its retries, result bytes are counted per method
+        with telemetry.span("mcp.request", method=method, url=url, tool=args.get("name")) as span:
+            try:
+                result = self.read_result(await self.send(method, args, url, on_notification))
+
+            except Exception as e:
+                self.logger.error("HTTP failure: %r", e)
+                span.error = repr(e)
+                result = json.dumps({"error": str(e) or repr(e)})
+
+            size = text_bytes(result)
+            span.set(bytes=size)
+        telemetry.count("mcp_requests_total", method=method)
+        telemetry.count("mcp_response_bytes_total", size, method=method)
+        telemetry.log_payload(self.logger, "MCP result %s", result)
+        return result
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=4, max=10),
         retry=retry_if_exception_type((httpx.TimeoutException, httpx.ConnectError)),
     )
-    async def make_request(self, method: str, args: dict, url: str):
-        try:
-            self.logger.info(f"Request to {url} - {method}")
-
-            response = await self.httpx_client.post(
-                url=url,
-                json={
-                    "jsonrpc": "2.0",
-                    "id": str(uuid4()),
-                    "method": method,
-                    "params": args,
-                },
-                headers=self.mcp_headers[url],
-            )
+    async def send(self, method: str, args: dict, url: str, on_notification=None) -> dict:
+        self.logger.debug("Request to %s - %s", url, method)
 
-            response.raise_for_status()
+        request_id = str(uuid4())
+        if on_notification is not None:
+            # servers only report progress for requests that carry a progress token
+            args = {**args, "_meta": {"progressToken": request_id}}
 
-            data = response.json()
-            if "result" in data:
-                try:
-                    return data["result"]["content"][0]["text"]
-                except:
-                    return json.dumps(data["result"])
+        return await self.sessions.request(
+            url,
+            {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "method": method,
+                "params": args,
+            },
+            on_notification,
+        )
 
-        except Exception as e:
-            self.logger.error(f"HTTP failure: {e}")
-            return json.dumps({"error": str(e)})
+    @staticmethod
+    def read_result(message: dict) -> str:
+        '''
+        Tool result text for the model, JSON-RPC errors and isError results come back as {"error": ...}
+        '''
+        if "error" in message:
+            return json.dumps({"error": message["error"].get("message", message["error"])})
+
+        result = message.get("result", {})
+        # list results arrive as one text item per element, keep all of them
+        texts = [item["text"] for item in result.get("content", []) if item.get("type") == "text"]
+        if result.get("isError"):
+            return json.dumps({"error": "\n".join(texts) or "Tool reported an error"})
+        if not texts:
+            return json.dumps(result)
+        return "\n".join(texts)
 
     async def list_tools(self, servers):
-
-        tools = []
-
-        for server in servers:
-            raw = await self.make_request("tools/list", {}, server)
+        # every server is brought up concurrently, warm sessions come straight from the cache
+        await self.sessions.ensure(servers)
+        return self.sessions.tools(servers)
+
+    async def tool_calls(self, calls: list, registry: toolRegistry) -> list:
+        '''
+        Runs one turn's calls concurrently over the shared httpx client, at most max_calls_per_server
+        in flight per server, one response string per call in call order
+        '''
+        async def limited(call):
+            if "invalid" in call:
+                return json.dumps({"error": call["invalid"]})
             try:
-                parsed = json.loads(raw)
-                for t in parsed:
-                    tools.append((server, t))
-            except:
-                pass
-
-        return tools
-
-    async def tool_call(self, tool: str, args: dict, tools: list):
-
-        def convert_value(val):
-            if isinstance(val, str):
-                if val.lower() == "true": return True
-                if val.lower() == "false": return False
-                try:
-                    if "." in val:
-                        return float(val)
-                    return int(val)
-                except:
-                    return val
-            if isinstance(val, list):
-                return [convert_value(v) for v in val]
-            if isinstance(val, dict):
-                return {k: convert_value(v) for k, v in val.items()}
-            return val
-
+                server = registry.resolve(call["tool"], call.get("server"))
+            except ValueError as e:
+                return json.dumps({"error": str(e)})
+            async with self.server_limits[server]:
+                return await self.tool_call(call["tool"], call["args"], registry, server=server)
+
+        responses = await asyncio.gather(*(limited(call) for call in calls), return_exceptions=True)
+        return [json.dumps({"error": str(r)}) if isinstance(r, BaseException) else r for r in responses]
+
+    def parse_calls(self, text: str) -> dict:
+        '''
+        Model output into {"completed": bool, "calls": [{"tool", "args", "server"?}]}
+        Also accepts a bare list of calls and the older single {"tool", "args"} object
+        Malformed calls stay in the list marked "invalid", so they fail alone and the rest still run
+        '''
+        text = text.strip()
+        if text.startswith("```"):
+            text = text.strip("`").removeprefix("json").strip()
+        parsed = json.loads(text)
+
+        if isinstance(parsed, list):
+            parsed = {"calls": parsed}
+        elif "tool" in parsed:
+            parsed = {"completed": parsed.get("completed", False), "calls": [parsed]}
+
+        calls = [self.parse_call(call) for call in parsed.get("calls") or []]
+        return {"completed": bool(parsed.get("completed")), "calls": calls}
+
+    @staticmethod
+    def parse_call(call) -> dict:
+        if not isinstance(call, dict):
+            return {"tool": "?", "args": {}, "invalid": f"Malformed tool call: {call!r}"}
+        tool, args = call.get("tool"), call.get("args", {})
+        if not isinstance(tool, str) or not tool:
+            return {"tool": "?", "args": {}, "invalid": f"Tool call without a tool name: {call!r}"}
+        if isinstance(args, str):
+            try:
+                args = json.loads(args)
+            except json.JSONDecodeError as e:
+                return {"tool": tool, "args": {}, "invalid": f"Malformed args for {tool}: {e}"}
+        if not isinstance(args, dict):
+            return {"tool": tool, "args": {}, "invalid": f"Args for {tool} must be an object, got {type(args).__name__}"}
+        return {**{key: value for key, value in call.items() if key != "invalid"}, "args": args}
+
+    @staticmethod
+    def is_error(response) -> bool:
+        # transport and routing failures come back as {"error": ...}, tool failures as MCP error text
+        if not isinstance(response, str):
+            return False
+        if response.startswith("Error executing tool"):
+            return True
         try:
-            args = {k: convert_value(v) for k, v in args.items()}
+            parsed = json.loads(response)
+        except json.JSONDecodeError:
+            return False
+        return isinstance(parsed, dict) and set(parsed) == {"error"}
 
-            url = None
-            for srv, tool_info in tools:
-                if tool == tool_info.get("name"):
-                    url = srv
+    async def tool_call(self, tool: str, args: dict, registry: toolRegistry, server: str = None):
 
-            if not url:
-                return json.dumps({"error": "Tool not found"})
+        try:
+            # routing and argument types come from the registry built at initialize for this run
+            url, args = registry.prepare(tool, args, server)
 
             return await self.make_request(
                 "tools/call",
@@ -274,62 +337,23 @@ class mcpExecutor:
             )
 
         except Exception as e:
-            self.logger.error(f"Tool call failed: {e}")
+            self.logger.error("Tool call failed: %s", e)
             return json.dumps({"error": str(e)})
 
 
     async def ping(self, server):
         try:
-            resp = await self.httpx_client.post(
-                url=server,
-                headers=self.mcp_headers[server],
-                json={"jsonrpc": "2.0", "id": uuid4(), "method": "ping"},
-            )
-            return resp.text
+            return await self.sessions.ping(server)
         except Exception as e:
             return f"Ping failed: {e}"
 
-    async def handshake(self, server):
-        try:
-            result = await self.httpx_client.post(
-                url=server,
-                headers=self.mcp_headers[server],
-                json={
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "initialize",
-                    "params": {
-                        "protocolVersion": "2025-06-18",
-                        "capabilities": {}
-                    },
-                    "clientInfo": {
-                        "name": "PortfolioOptimizerClient",
-                        "version": "1.0.0"
-                    }
-                }
-            )
-
-            if "Mcp-Session-Id" in result.headers:
-                self.mcp_headers[server]["Mcp-Session-Id"] = result.headers["Mcp-Session-Id"]
-
-            await self.httpx_client.post(
-                url=server,
-                headers=self.mcp_headers[server],
-                json={
-                    "jsonrpc": "2.0",
-                    "method": "notifications/initialized"
-                }
-            )
-
-        except Exception as e:
-            self.logger.error(f"Handshake failed: {e}")
-
     # ---------------------------------------------------------------------
     # ENTRYPOINT
     # ---------------------------------------------------------------------
     async def run(self, state: executionState):
         self.logger.info("Starting workflow...")
-        await self.workflow.ainvoke(state)
+        with telemetry.span("executor.run", servers=len(state.get("servers") or [])):
+            await self.workflow.ainvoke(state)
 
     def visualize_graph(self):
         try:
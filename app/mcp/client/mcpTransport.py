@@ -0,0 +1,153 @@
+from contextlib import asynccontextmanager
+import importlib.util
+import json
+import logging
+import re
+
+import httpx
+
+LINE_END = re.compile(r"\r\n|\r|\n")
+
+# per JSON-RPC method timeouts, tool calls can stream for a long time between events
+DEFAULT_TIMEOUTS = {
+    "ping": httpx.Timeout(5.0),
+    "initialize": httpx.Timeout(10.0),
+    "notifications/initialized": httpx.Timeout(10.0),
+    "tools/list": httpx.Timeout(10.0),
+    "tools/call": httpx.Timeout(connect=5.0, read=300.0, write=30.0, pool=30.0),
+}
+
+
+class sseParser:
+    '''
+    Incremental text/event-stream parser, feed it decoded chunks as they arrive and it returns
+    every event completed so far. Chunks may split lines and events anywhere, and each chunk is
+    scanned once so a multi megabyte data line costs linear time
+    '''
+
+    def __init__(self):
+        self.partial = []
+        self.carriage = False
+        self.reset()
+
+    def reset(self):
+        self.event = None
+        self.data = []
+        self.id = None
+
+    def feed(self, chunk: str) -> list:
+        # a \r that ended the previous chunk already closed its line, drop the \n of that \r\n
+        if self.carriage and chunk.startswith("\n"):
+            chunk = chunk[1:]
+        self.carriage = chunk.endswith("\r")
+
+        events = []
+        start = 0
+        for match in LINE_END.finditer(chunk):
+            self.partial.append(chunk[start:match.start()])
+            line = "".join(self.partial)
+            self.partial = []
+            start = match.end()
+
+            event = self.line(line)
+            if event is not None:
+                events.append(event)
+        if start < len(chunk):
+            self.partial.append(chunk[start:])
+        return events
+
+    def line(self, line: str):
+        if not line:
+            if not self.data:
+                self.reset()
+                return None
+            event = {"event": self.event or "message", "data": "\n".join(self.data), "id": self.id}
+            self.reset()
+            return event
+        if line.startswith(":"):
+            return None
+
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            self.data.append(value)
+        elif field == "event":
+            self.event = value
+        elif field == "id":
+            self.id = value
+        return None
+
+    def flush(self) -> list:
+        # a stream closed without a final blank line still dispatches its last event
+        events = self.feed("\n") if self.partial else []
+        event = self.line("")
+        return events + ([event] if event else [])
+
+
+class mcpTransport:
+    '''
+    Streamable HTTP transport for the MCP client
+    One pooled httpx.AsyncClient with explicit limits and keep alive, HTTP/2 when the h2 package is
+    installed, and per method timeouts. Responses are read as a stream so SSE events are parsed and
+    handed out one JSON-RPC message at a time instead of buffering the whole body
+    '''
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = None,
+        timeouts: dict = None,
+        default_timeout: float = 30.0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        if http2 is None:
+            http2 = importlib.util.find_spec("h2") is not None
+        self.http2 = http2
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = httpx.Timeout(default_timeout)
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=self.default_timeout,
+        )
+
+    def timeout(self, method: str) -> httpx.Timeout:
+        return self.timeouts.get(method, self.default_timeout)
+
+    @asynccontextmanager
+    async def post(self, url: str, headers: dict, payload: dict):
+        '''
+        Streams the response to one JSON-RPC payload, the body is not read until messages() iterates it
+        '''
+        async with self.client.stream(
+            "POST", url, headers=headers, json=payload, timeout=self.timeout(payload.get("method", ""))
+        ) as response:
+            yield response
+
+    async def messages(self, response: httpx.Response):
+        '''
+        Async iterator over the JSON-RPC messages in a response, either one JSON body or an SSE stream
+        '''
+        if not response.headers.get("content-type", "").startswith("text/event-stream"):
+            body = await response.aread()
+            if body:
+                yield json.loads(body)
+            return
+
+        parser = sseParser()
+        async for chunk in response.aiter_text():
+            for event in parser.feed(chunk):
+                if event["event"] == "message" and event["data"]:
+                    yield json.loads(event["data"])
+        for event in parser.flush():
+            if event["event"] == "message" and event["data"]:
+                yield json.loads(event["data"])
+
+    async def aclose(self):
+        await self.client.aclose()
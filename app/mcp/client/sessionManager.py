@@ -0,0 +1,202 @@
+from collections import defaultdict
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from uuid import uuid4
+import asyncio
+import json
+import logging
+import time
+
+from app.mcp.client.mcpTransport import mcpTransport
+from app.mcp.client.toolRegistry import toolRegistry
+
+PROTOCOL_VERSION = "2025-06-18"
+
+
+@dataclass
+class serverSession:
+    '''
+    One initialized MCP server, its session headers and the tools it listed at handshake time
+    '''
+    url: str
+    headers: dict
+    session_id: str = None
+    tools: list = field(default_factory=list)
+    created: float = field(default_factory=time.monotonic)
+
+
+class sessionManager:
+    '''
+    Brings MCP servers up concurrently and keeps their sessions and tool lists for ttl seconds
+    Sessions are shared by every workflow run of the executor, so a warm run makes no requests to set up
+    A request rejected with 400/404 (unknown or expired Mcp-Session-Id) drops the session,
+    re-handshakes once and is retried
+    '''
+
+    REJECTED = (400, 404)
+
+    def __init__(self, transport: mcpTransport, ttl: float = 900, client_name: str = "PortfolioOptimizerClient"):
+        self.logger = logging.getLogger(__name__)
+        self.transport = transport
+        self.ttl = ttl
+        self.client_name = client_name
+        self.sessions = {}
+        # one handshake per server even when several runs ask for it at the same time
+        self.locks = defaultdict(asyncio.Lock)
+        self.registries = {}
+        self.stats = {"hits": 0, "handshakes": 0, "expired": 0, "rejected": 0, "failures": 0}
+
+    def fresh(self, session: serverSession) -> bool:
+        return session is not None and time.monotonic() - session.created < self.ttl
+
+    async def get(self, server: str) -> serverSession:
+        session = self.sessions.get(server)
+        if self.fresh(session):
+            self.stats["hits"] += 1
+            return session
+
+        async with self.locks[server]:
+            session = self.sessions.get(server)
+            if self.fresh(session):
+                self.stats["hits"] += 1
+                return session
+            if session is not None:
+                self.stats["expired"] += 1
+            session = await self.connect(server)
+            self.sessions[server] = session
+            return session
+
+    async def ensure(self, servers: list) -> dict:
+        '''
+        Sessions for every server brought up concurrently, servers that fail are logged and left out
+        '''
+        results = await asyncio.gather(*(self.get(server) for server in servers), return_exceptions=True)
+        sessions = {}
+        for server, result in zip(servers, results):
+            if isinstance(result, Exception):
+                self.stats["failures"] += 1
+                self.logger.error("MCP server %s unavailable: %r", server, result)
+            else:
+                sessions[server] = result
+        return sessions
+
+    def tools(self, servers: list) -> list:
+        return [(server, tool) for server in servers if server in self.sessions for tool in self.sessions[server].tools]
+
+    def registry(self, servers: list) -> toolRegistry:
+        '''
+        Tool registry for these servers, rebuilt only when one of their sessions (and so its tool list) changed
+        '''
+        key = tuple(servers)
+        sessions = [self.sessions.get(server) for server in servers]
+        cached = self.registries.get(key)
+        if cached is not None and all(a is b for a, b in zip(cached[0], sessions)):
+            return cached[1]
+        registry = toolRegistry(self.tools(servers))
+        self.registries[key] = (sessions, registry)
+        return registry
+
+    def invalidate(self, server: str):
+        self.sessions.pop(server, None)
+
+    async def connect(self, server: str) -> serverSession:
+        self.stats["handshakes"] += 1
+        session = serverSession(
+            url=server,
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "application/json, text/event-stream",
+                "MCP-Protocol-Version": PROTOCOL_VERSION,
+            },
+        )
+
+        initialize = {
+            "jsonrpc": "2.0",
+            "id": str(uuid4()),
+            "method": "initialize",
+            "params": {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {},
+                "clientInfo": {"name": self.client_name, "version": "1.0.0"},
+            },
+        }
+        async with self.transport.post(server, session.headers, initialize) as response:
+            await raise_for_status(response)
+            # the session id arrives as a header on the initialize response
+            if "Mcp-Session-Id" in response.headers:
+                session.session_id = response.headers["Mcp-Session-Id"]
+                session.headers["Mcp-Session-Id"] = session.session_id
+            await response_to(self.transport, response, initialize)
+
+        notification = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+        async with self.transport.post(server, session.headers, notification) as response:
+            await response.aread()
+        session.tools = await self.list_tools(session)
+        self.logger.info("MCP session with %s ready, %d tools", server, len(session.tools))
+        return session
+
+    async def list_tools(self, session: serverSession) -> list:
+        # tools/list returns {"tools": [...], "nextCursor": ...}, follow the cursor until it runs out
+        tools, cursor = [], None
+        while True:
+            payload = {"jsonrpc": "2.0", "id": str(uuid4()), "method": "tools/list", "params": {"cursor": cursor} if cursor else {}}
+            async with self.transport.post(session.url, session.headers, payload) as response:
+                await raise_for_status(response)
+                result = (await response_to(self.transport, response, payload)).get("result", {})
+            tools.extend(result.get("tools", []))
+            cursor = result.get("nextCursor")
+            if not cursor:
+                return tools
+
+    async def stream(self, server: str, payload: dict):
+        '''
+        Async iterator over every JSON-RPC message the server sends back for a payload, progress and log
+        notifications first and the response last, re-handshaking once if the session was rejected
+        '''
+        session = await self.get(server)
+        for attempt in range(2):
+            async with self.transport.post(server, session.headers, payload) as response:
+                if response.status_code in self.REJECTED and session.session_id is not None and attempt == 0:
+                    self.stats["rejected"] += 1
+                    self.logger.info("MCP server %s rejected session %s, reconnecting", server, session.session_id)
+                    if self.sessions.get(server) is session:
+                        self.invalidate(server)
+                    session = await self.get(server)
+                    continue
+                await raise_for_status(response)
+                async for message in self.transport.messages(response):
+                    yield message
+                return
+
+    async def request(self, server: str, payload: dict, on_notification=None) -> dict:
+        '''
+        The JSON-RPC response to a payload, notifications received on the way go to on_notification
+        '''
+        async with aclosing(self.stream(server, payload)) as messages:
+            async for message in messages:
+                if message.get("id") == payload.get("id") and ("result" in message or "error" in message):
+                    return message
+                if on_notification is not None:
+                    on_notification(message)
+        raise RuntimeError(f"{server} closed the stream without answering {payload.get('method')}")
+
+    async def ping(self, server: str) -> str:
+        response = await self.request(server, {"jsonrpc": "2.0", "id": str(uuid4()), "method": "ping"})
+        return json.dumps(response)
+
+    def report(self) -> dict:
+        return {**self.stats, "sessions": len(self.sessions)}
+
+
+async def raise_for_status(response):
+    # streamed responses need their body read before raise_for_status can report it
+    if response.is_error:
+        await response.aread()
+    response.raise_for_status()
+
+
+async def response_to(transport: mcpTransport, response, payload: dict) -> dict:
+    async for message in transport.messages(response):
+        if message.get("id") == payload.get("id"):
+            return message
+    return {}
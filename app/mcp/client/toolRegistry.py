@@ -0,0 +1,227 @@
+import json
+import logging
+
+
+class toolRegistry:
+    '''
+    Index over the (server, tool) pairs from list_tools, built once per tool listing
+    Routing a tool name to its server is a dict lookup, and each tool's inputSchema is compiled
+    into a coercer up front so LLM arguments ("5", "true", "[...]") are converted by the declared
+    types instead of guessed. Names exposed by more than one server are kept out of the route
+    table and must be called with their server
+    '''
+
+    def __init__(self, tools: list):
+        self.logger = logging.getLogger(__name__)
+        self.tools = tools
+        self.routes = {}
+        self.specs = {}
+        self.coercers = {}
+        self.ambiguous = {}
+
+        servers_by_name = {}
+        for server, tool in tools:
+            servers_by_name.setdefault(tool["name"], []).append(server)
+            self.specs[(server, tool["name"])] = tool
+            self.coercers[(server, tool["name"])] = compile_object(tool.get("inputSchema") or {}, tool["name"])
+
+        for name, servers in servers_by_name.items():
+            if len(servers) == 1:
+                self.routes[name] = servers[0]
+            else:
+                self.ambiguous[name] = servers
+                self.logger.warning("Tool %s is exposed by %d servers: %s", name, len(servers), servers)
+        self.catalogue = self.describe()
+
+    def __len__(self):
+        return len(self.specs)
+
+    def __contains__(self, name):
+        return name in self.routes or name in self.ambiguous
+
+    def describe(self) -> str:
+        '''
+        Compact JSON listing of the tools for the model, the server is only named where it is needed
+        '''
+        listing = []
+        for (server, name), tool in self.specs.items():
+            entry = {"tool": name}
+            if name in self.ambiguous:
+                entry["server"] = server
+            if tool.get("description"):
+                entry["description"] = tool["description"]
+            entry["parameters"] = (tool.get("inputSchema") or {}).get("properties", {})
+            listing.append(entry)
+        return json.dumps(listing, separators=(",", ":"))
+
+    def resolve(self, name: str, server: str = None) -> str:
+        if server is not None:
+            if (server, name) not in self.specs:
+                raise ValueError(f"Tool {name} is not exposed by {server}")
+            return server
+        if name in self.routes:
+            return self.routes[name]
+        if name in self.ambiguous:
+            raise ValueError(f"Tool {name} is ambiguous, exposed by {self.ambiguous[name]}, specify the server")
+        raise ValueError(f"Tool {name} not found")
+
+    def prepare(self, name: str, args: dict, server: str = None) -> tuple:
+        '''
+        Returns (server, coerced arguments) for a call, raising ValueError on unknown tools or bad arguments
+        '''
+        server = self.resolve(name, server)
+        return server, self.coercers[(server, name)](args or {})
+
+
+# ----------------------------------------------------------------------
+# inputSchema compilation
+# ----------------------------------------------------------------------
+def compile_schema(schema: dict, path: str):
+    '''
+    Turns a JSON schema node into a function that converts and checks one value
+    Only the keywords FastMCP emits from type hints are handled: type, properties, required,
+    items, anyOf/oneOf (Optional[...]) and enum, anything else is passed through untouched
+    '''
+    options = schema.get("anyOf") or schema.get("oneOf")
+    if options:
+        return compile_union([compile_schema(option, path) for option in options], path)
+
+    kind = schema.get("type")
+    if isinstance(kind, list):
+        return compile_union([compile_schema({**schema, "type": k}, path) for k in kind], path)
+
+    coerce = {
+        "string": compile_string,
+        "integer": compile_integer,
+        "number": compile_number,
+        "boolean": compile_boolean,
+        "null": compile_null,
+        "array": lambda path: compile_array(schema, path),
+        "object": lambda path: compile_object(schema, path),
+    }.get(kind, lambda path: lambda value: value)(path)
+
+    if "enum" in schema:
+        allowed = schema["enum"]
+
+        def check_enum(value, coerce=coerce):
+            value = coerce(value)
+            if value not in allowed:
+                raise ValueError(f"{path} must be one of {allowed}, got {value!r}")
+            return value
+
+        return check_enum
+    return coerce
+
+
+def compile_union(coercers: list, path: str):
+    def coerce(value):
+        errors = []
+        for option in coercers:
+            try:
+                return option(value)
+            except ValueError as e:
+                errors.append(str(e))
+        raise ValueError(f"{path} matched no allowed type: {'; '.join(errors)}")
+
+    return coerce
+
+
+def compile_string(path: str):
+    def coerce(value):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        raise ValueError(f"{path} must be a string, got {value!r}")
+
+    return coerce
+
+
+def compile_integer(path: str):
+    def coerce(value):
+        if isinstance(value, bool):
+            raise ValueError(f"{path} must be an integer, got {value!r}")
+        if isinstance(value, int):
+            return value
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path} must be an integer, got {value!r}")
+        if not number.is_integer():
+            raise ValueError(f"{path} must be an integer, got {value!r}")
+        return int(number)
+
+    return coerce
+
+
+def compile_number(path: str):
+    def coerce(value):
+        if isinstance(value, bool):
+            raise ValueError(f"{path} must be a number, got {value!r}")
+        if isinstance(value, (int, float)):
+            return value
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{path} must be a number, got {value!r}")
+
+    return coerce
+
+
+def compile_boolean(path: str):
+    def coerce(value):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+        raise ValueError(f"{path} must be a boolean, got {value!r}")
+
+    return coerce
+
+
+def compile_null(path: str):
+    def coerce(value):
+        if value is None or (isinstance(value, str) and value.lower() in ("null", "none")):
+            return None
+        raise ValueError(f"{path} must be null, got {value!r}")
+
+    return coerce
+
+
+def parse_json(value, expected: type, path: str):
+    # models often send lists and objects as JSON text
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except json.JSONDecodeError:
+            pass
+    if not isinstance(value, expected):
+        raise ValueError(f"{path} must be {'an array' if expected is list else 'an object'}, got {value!r}")
+    return value
+
+
+def compile_array(schema: dict, path: str):
+    item = compile_schema(schema.get("items") or {}, f"{path}[]")
+
+    def coerce(value):
+        if isinstance(value, tuple):
+            value = list(value)
+        return [item(v) for v in parse_json(value, list, path)]
+
+    return coerce
+
+
+def compile_object(schema: dict, path: str):
+    properties = {
+        name: compile_schema(spec, f"{path}.{name}") for name, spec in (schema.get("properties") or {}).items()
+    }
+    required = list(schema.get("required") or [])
+
+    def coerce(value):
+        value = parse_json(value, dict, path)
+        missing = [name for name in required if name not in value]
+        if missing:
+            raise ValueError(f"{path} is missing required arguments {missing}")
+        return {key: properties[key](v) if key in properties else v for key, v in value.items()}
+
+    return coerce
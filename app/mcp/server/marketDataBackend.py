@@ -0,0 +1,67 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+
+from app.coalescing import Coalescer
+from app.telemetry import telemetry
+
+
+class marketDataBackend():
+    '''
+    Runs blocking market data work (RESTClient calls, cache reads) on a bounded thread pool so the
+    FastMCP event loop keeps serving other clients while a request waits on Polygon
+    Requests submitted under the same key while one is already running share its result
+    instead of making a second upstream call
+    '''
+
+    def __init__(self, client=None, max_workers: int = 16):
+        self.logger = logging.getLogger(__name__)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-data")
+        self.in_flight = Coalescer()
+        self.stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0, "errors": 0}
+
+        # RESTClient's urllib3 PoolManager keeps a single connection per host by default, so
+        # parallel workers would open and throw away sockets, size the pool to the workers instead
+        pool = getattr(client, "client", None)
+        if pool is not None and hasattr(pool, "connection_pool_kw"):
+            pool.connection_pool_kw["maxsize"] = max_workers
+
+    async def submit(self, key, fn, *args, **kwargs):
+        '''
+        Runs fn(*args, **kwargs) on the pool, key=None opts out of coalescing
+        '''
+        self.stats["requests"] += 1
+        if key in self.in_flight:
+            self.stats["coalesced"] += 1
+            telemetry.count("polygon_backend_coalesced_total")
+        return await self.in_flight.run(key, lambda: self.start(key, fn, *args, **kwargs))
+
+    def start(self, key, fn, *args, **kwargs) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        # the span covers the pool wait and the call, it ends in the done callback so callers that
+        # are cancelled or coalesced do not cut it short, fn runs with it as the current span
+        operation = key[0] if isinstance(key, tuple) else getattr(fn, "__name__", "call")
+        span = telemetry.span("polygon.backend", operation=operation)
+        context = telemetry.context(span)
+        future = loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args, **kwargs))
+        self.stats["upstream_calls"] += 1
+        telemetry.count("polygon_backend_calls_total", operation=operation)
+        future.add_done_callback(lambda done: self.finished(key, done, span))
+        return future
+
+    def finished(self, key, future, span=None):
+        # retrieve the exception so it is not reported as unhandled when every caller was cancelled
+        error = None if future.cancelled() else future.exception()
+        if span is not None:
+            span.end(error)
+        if error is not None:
+            self.stats["errors"] += 1
+            self.logger.warning("Market data call %s failed: %r", key, error)
+
+    def report(self) -> dict:
+        return {**self.stats, "in_flight": len(self.in_flight), "max_workers": self.max_workers}
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -1,12 +1,34 @@
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import FastMCP, Context
 from polygon.rest import RESTClient
 from app.settings import Settings
+from app.data.priceCache import PriceCache
+from app.data.priceLoader import PolygonSource, OHLCV_FIELDS, empty_frame
+from app.mcp.server.marketDataBackend import marketDataBackend
+from app.mcp.server.tradeStream import tradeReducer, consume_page
+from app.telemetry import configure, telemetry
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
+import numpy as np
+import pandas as pd
+import asyncio
+import json
+import os
 
 class polygonMCP():
     
-    def __init__(self, api_key: str):
+    # polygon's largest trades page, one page is all list_trades ever holds in memory
+    TRADE_PAGE_SIZE = 50000
+    
+    def __init__(self, api_key: str, cache: PriceCache = None, client: RESTClient = None, max_workers: int = 16):
         
-        self.market_client = RESTClient(api_key=api_key)
+        self.market_client = client or RESTClient(api_key=api_key)
+        # every RESTClient call blocks, so tools hand them to a worker pool instead of the event loop
+        self.backend = marketDataBackend(self.market_client, max_workers=max_workers)
+        self.source = PolygonSource(client=self.market_client)
+        self.cache = cache or PriceCache(
+            os.path.join(Settings.PRICE_CACHE_DIR, "polygon"),
+            max_bytes=Settings.PRICE_CACHE_MAX_BYTES
+        )
         self.mcp = FastMCP(
             "A StockMarket MCP Server Integrating Polygon",
             host='0.0.0.0',
@@ -20,33 +42,178 @@ class polygonMCP():
         
         @self.mcp.tool()
         async def get_last_trade(ticker):
-            return self.market_client.get_last_trade()
+            return await self.backend.submit(("get_last_trade", ticker), self.market_client.get_last_trade, ticker)
         
         @self.mcp.tool()
-        async def list_trades(ticker, timestamp):
-            return self.market_client.list_trades(ticker,timestamp)
+        async def list_trades(
+            ticker: str,
+            timestamp: str = None,
+            timestamp_gte: str = None,
+            timestamp_lt: str = None,
+            mode: str = "ohlc",
+            interval: str = "1min",
+            bucket_volume: float = None,
+            limit: int = 1000,
+            ctx: Context = None
+        ):
+            '''
+            Trades for a ticker reduced on the server while the pages stream in
+            mode is one of ohlc or vwap bars per interval (e.g. 1min, 5min, 1h), volume bars of bucket_volume
+            shares, or raw for the first limit ticks. Progress is reported after every page
+            '''
+            reducer = tradeReducer(mode, interval, bucket_volume, limit)
+            page_size = min(self.TRADE_PAGE_SIZE, limit) if mode == "raw" else self.TRADE_PAGE_SIZE
+            # the client returns a lazy generator, no request is made until a worker starts reading it
+            trades = self.market_client.list_trades(
+                ticker,
+                timestamp=timestamp,
+                timestamp_gte=timestamp_gte,
+                timestamp_lt=timestamp_lt,
+                limit=page_size,
+                sort="timestamp",
+                order="asc"
+            )
+            pages = 0
+            while not reducer.done:
+                # stateful iterator, so pages are never coalesced with another caller
+                if not await self.backend.submit(None, consume_page, reducer, trades, page_size):
+                    break
+                pages += 1
+                await self.report_progress(ctx, reducer.trades, f"{pages} pages, {reducer.trades} trades, {reducer.bars} bars")
+            return json.dumps({"ticker": ticker, **reducer.result()}, separators=(",", ":"))
         
         @self.mcp.tool()
         async def get_last_quote(ticker):
-            return self.market_client.get_last_quote(ticker)
+            return await self.backend.submit(("get_last_quote", ticker), self.market_client.get_last_quote, ticker)
         
         @self.mcp.tool()
         async def get_data(ticker, start, end):
-            return self.market_client.get_aggs(
-                ticker = ticker,
-                multiplier = 1,
-                timespan = "day",
-                from_=start,
-                to = end,
-                adjusted = True
-            )
+            return await self.backend.submit(("get_data", ticker, start, end), self.get_daily, ticker, start, end)
+        
+        @self.mcp.tool()
+        async def get_bulk_data(
+            tickers: list[str], start: str, end: str, fields: list[str] = None, max_points: int = None, decimals: int = 4
+        ):
+            '''
+            Daily bars for many tickers in one call as columns on one shared date axis:
+            {"t": [dates], "data": {"AAPL": {"c": [closes]}, ...}, "missing": [...]}
+            A ticker without a bar on some date has null there
+            fields picks any of o, h, l, c, v, max_points folds the dates into at most that many bars dated by
+            their last day (first o, highest h, lowest l, last c, summed v), always keeping the last day
+            '''
+            fields = fields or ["c"]
+            unknown = [field for field in fields if field not in COLUMN_FIELDS]
+            if unknown:
+                raise ValueError(f"Unknown fields {unknown}, expected any of {list(COLUMN_FIELDS)}")
+
+            tickers = list(dict.fromkeys(tickers))
+            frames = await asyncio.gather(*(
+                self.backend.submit(("get_daily_frame", ticker, start, end), self.get_daily_frame, ticker, start, end)
+                for ticker in tickers
+            ))
+            frames = {ticker: frame for ticker, frame in zip(tickers, frames) if len(frame)}
+            payload = {
+                "start": start,
+                "end": end,
+                **frames_to_columns(frames, fields, max_points, decimals),
+                "missing": [ticker for ticker in tickers if ticker not in frames],
+            }
+            # FastMCP pretty prints dicts one value per line, compact text is several times smaller
+            return json.dumps(payload, separators=(",", ":"))
+        
+        @self.mcp.tool()
+        async def get_cache_stats():
+            return {**self.cache.report(), "backend": self.backend.report(), "telemetry": telemetry.report()}
+
+        @self.mcp.custom_route("/metrics", methods=["GET"])
+        async def metrics(request: Request) -> Response:
+            # scraped over plain HTTP next to the MCP endpoint, not exposed as a tool
+            return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4")
+        
+    async def report_progress(self, ctx, progress, message):
+        # tools called directly through mcp.call_tool have no request to report back to
+        if ctx is None:
+            return
+        try:
+            await ctx.report_progress(progress, message=message)
+        except ValueError:
+            pass
+        
+    def get_daily(self, ticker, start, end):
+        return frame_to_aggs(self.get_daily_frame(ticker, start, end))
+        
+    def get_daily_frame(self, ticker, start, end):
+        # end is inclusive like get_aggs, the cache works on [start, end)
+        return self.cache.get(
+            ticker,
+            start,
+            pd.Timestamp(end) + pd.Timedelta(days=1),
+            fetch=lambda a, b: self.fetch_daily(ticker, a, b)
+        )
+        
+    def fetch_daily(self, ticker, start, end):
+        frames = self.source.fetch([ticker], start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+        return frames.get(ticker, empty_frame())
         
         
     def run(self):
+        configure()
         print('running the server')
         self.mcp.run(transport='streamable-http')
 
 
+def frame_to_aggs(frame):
+    '''
+    Cached OHLCV frame back into the get_aggs record layout, timestamp is exchange midnight in ms
+    '''
+    timestamps = frame.index.tz_localize("America/New_York").asi8 // 1_000_000
+    return [
+        {"timestamp": int(ts), **{field: float(value) for field, value in zip(OHLCV_FIELDS, row)}}
+        for ts, row in zip(timestamps, frame[OHLCV_FIELDS].to_numpy())
+    ]
+
+
+# short column names keep the bulk payload small, they match Polygon's own o/h/l/c/v keys
+COLUMN_FIELDS = dict(zip(["o", "h", "l", "c", "v"], OHLCV_FIELDS))
+
+
+# how each field combines the days folded into one downsampled bar
+AGGREGATES = {"o": "first", "h": "max", "l": "min", "c": "last", "v": "sum"}
+
+
+def frames_to_columns(frames: dict, fields=("c",), max_points=None, decimals=4) -> dict:
+    '''
+    Cached OHLCV frames as {"t": [YYYY-MM-DD], "data": {ticker: {field: [values]}}} on the union of their dates
+    Dates are sent once rather than per ticker since they make up most of the payload otherwise
+    With max_points the dates are split into consecutive buckets and each bucket is one bar dated by its
+    last day, so highs, lows and volume still cover every day rather than only the sampled ones
+    '''
+    dates = pd.DatetimeIndex([])
+    for frame in frames.values():
+        dates = dates.union(frame.index)
+
+    buckets, labels = None, dates
+    if max_points and len(dates) > max_points:
+        # evenly spaced bucket ends that always include the first and last bar
+        ends = np.unique(np.linspace(0, len(dates) - 1, max_points).round().astype(int))
+        buckets = np.searchsorted(ends, np.arange(len(dates)))
+        labels = dates[ends]
+
+    columns = {}
+    for field in fields:
+        wide = pd.DataFrame({ticker: frame[COLUMN_FIELDS[field]] for ticker, frame in frames.items()}, index=dates)
+        if buckets is not None:
+            grouped = wide.groupby(buckets)
+            # a bucket without any bar stays null rather than summing to zero volume
+            wide = grouped.sum(min_count=1) if AGGREGATES[field] == "sum" else grouped.agg(AGGREGATES[field])
+        columns[field] = wide.to_numpy(dtype=np.float64).round(decimals)
+
+    data = {}
+    for j, ticker in enumerate(frames):
+        # JSON has no NaN, days a ticker did not trade go out as null
+        data[ticker] = {field: [None if value != value else value for value in columns[field][:, j].tolist()] for field in fields}
+    return {"t": labels.strftime("%Y-%m-%d").tolist(), "data": data}
+
 if __name__ == '__main__':
     poly = polygonMCP(Settings.POLYGON_API_KEY)
     poly.run()
@@ -0,0 +1,151 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+
+# running state of a bar, vwap is derived from pv / v when the result is built
+BAR_STATE = ["id", "t", "o", "h", "l", "c", "v", "pv", "n"]
+
+# fields each reduction mode sends back, bars are always built with all of them
+MODE_FIELDS = {
+    "raw": ["t", "p", "s"],
+    "ohlc": ["t", "o", "h", "l", "c", "v", "n"],
+    "vwap": ["t", "vwap", "v", "n"],
+    "volume": ["t", "o", "h", "l", "c", "v", "vwap", "n"],
+}
+
+
+class tradeReducer():
+    '''
+    Folds trade pages into bars as they arrive so only one page and the bars are ever in memory
+        raw     the first `limit` ticks unchanged
+        ohlc    open/high/low/close/volume per time interval
+        vwap    volume weighted average price per time interval
+        volume  bars that close every `bucket_volume` shares, a trade belongs to the bucket it starts in
+    Pages must be in ascending timestamp order, a bar still open at the end of a page is carried
+    into the next one
+    '''
+
+    def __init__(self, mode: str = "ohlc", interval: str = "1min", bucket_volume: float = None, limit: int = 1000):
+        if mode not in MODE_FIELDS:
+            raise ValueError(f"Unknown trade reduction mode {mode}, expected one of {list(MODE_FIELDS)}")
+        if mode == "volume" and not bucket_volume:
+            raise ValueError("Volume bars need a positive bucket_volume")
+
+        self.mode = mode
+        self.interval = interval
+        self.interval_ns = pd.Timedelta(interval).value if mode in ("ohlc", "vwap") else None
+        self.bucket_volume = bucket_volume
+        self.limit = limit
+
+        self.trades = 0
+        self.volume = 0.0
+        self.closed = {field: [] for field in BAR_STATE}
+        self.pending = None
+        self.ticks = {"t": [], "p": [], "s": []}
+
+    @property
+    def done(self) -> bool:
+        # only raw mode can stop paging early, every other mode needs the whole range
+        return self.mode == "raw" and self.trades >= self.limit
+
+    @property
+    def bars(self) -> int:
+        return sum(len(ids) for ids in self.closed["id"]) + (self.pending is not None)
+
+    def consume(self, trades: list) -> int:
+        '''
+        Adds one page of polygon Trade objects, returns the number of trades used
+        '''
+        timestamps = np.array([trade.sip_timestamp for trade in trades], dtype=np.int64)
+        prices = np.array([trade.price for trade in trades], dtype=np.float64)
+        sizes = np.array([trade.size for trade in trades], dtype=np.float64)
+        return self.consume_arrays(timestamps, prices, sizes)
+
+    def consume_arrays(self, timestamps: np.ndarray, prices: np.ndarray, sizes: np.ndarray) -> int:
+        if self.mode == "raw":
+            keep = max(self.limit - self.trades, 0)
+            for field, values in zip("tps", (timestamps, prices, sizes)):
+                self.ticks[field].append(values[:keep])
+            self.trades += min(keep, len(timestamps))
+            return min(keep, len(timestamps))
+
+        if not len(timestamps):
+            return 0
+        self.trades += len(timestamps)
+
+        if self.interval_ns:
+            ids = timestamps // self.interval_ns
+        else:
+            # shares traded before each trade decide which bucket it opens in
+            before = self.volume + np.cumsum(sizes) - sizes
+            ids = (before // self.bucket_volume).astype(np.int64)
+            self.volume += sizes.sum()
+
+        starts = np.r_[0, np.flatnonzero(np.diff(ids)) + 1]
+        ends = np.r_[starts[1:], len(ids)]
+        bars = {
+            "id": ids[starts],
+            "t": ids[starts] * self.interval_ns if self.interval_ns else timestamps[starts],
+            "o": prices[starts],
+            "h": np.maximum.reduceat(prices, starts),
+            "l": np.minimum.reduceat(prices, starts),
+            "c": prices[ends - 1],
+            "v": np.add.reduceat(sizes, starts),
+            "pv": np.add.reduceat(prices * sizes, starts),
+            "n": ends - starts,
+        }
+
+        if self.pending is not None:
+            if self.pending["id"] == bars["id"][0]:
+                # the first bar of this page continues the bar left open by the previous page
+                bars["t"][0] = self.pending["t"]
+                bars["o"][0] = self.pending["o"]
+                bars["h"][0] = max(bars["h"][0], self.pending["h"])
+                bars["l"][0] = min(bars["l"][0], self.pending["l"])
+                for field in ("v", "pv", "n"):
+                    bars[field][0] += self.pending[field]
+            else:
+                for field, value in self.pending.items():
+                    self.closed[field].append(np.array([value]))
+
+        for field in BAR_STATE:
+            self.closed[field].append(bars[field][:-1])
+        self.pending = {field: values[-1] for field, values in bars.items()}
+        return len(timestamps)
+
+    def result(self, decimals: int = 4) -> dict:
+        '''
+        Columnar payload of everything consumed so far, bar timestamps are epoch milliseconds
+        while raw ticks keep polygon's nanosecond sip_timestamp
+        '''
+        if self.mode == "raw":
+            columns = {field: np.concatenate(values) if values else np.empty(0) for field, values in self.ticks.items()}
+            columns["t"] = columns["t"].astype(np.int64)
+        else:
+            tail = {field: [np.array([value])] for field, value in (self.pending or {}).items()}
+            columns = {field: np.concatenate(values + tail.get(field, []) or [np.empty(0)]) for field, values in self.closed.items()}
+            with np.errstate(divide="ignore", invalid="ignore"):
+                columns["vwap"] = columns["pv"] / columns["v"]
+            columns["t"] = columns["t"].astype(np.int64) // 1_000_000
+
+        payload = {"mode": self.mode, "trades": self.trades}
+        if self.interval_ns:
+            payload["interval"] = self.interval
+        if self.bucket_volume:
+            payload["bucket_volume"] = self.bucket_volume
+        for field in MODE_FIELDS[self.mode]:
+            values = columns[field]
+            payload[field] = values.tolist() if field in ("t", "n") else np.round(values, decimals).tolist()
+        return payload
+
+
+def consume_page(reducer: tradeReducer, trades, size: int) -> int:
+    '''
+    Pulls up to size trades off the lazy list_trades iterator into the reducer, returns how many were read
+    Runs on a backend worker since reading past a page boundary blocks on the next polygon request
+    '''
+    page = list(itertools.islice(trades, size))
+    if page:
+        reducer.consume(page)
+    return len(page)
@@ -3,6 +3,8 @@ from pydantic import BaseModel
 class GenerateRequest(BaseModel):
     model : str = "gemini-2.5-flash"
     prompt : str
+    priority : int = 10
+    use_cache : bool = True
 
 class GenerateResponse(BaseModel):
     response : str
@@ -12,6 +14,38 @@ class ChatRequest(BaseModel):
     system_prompt : str = "Respond concisely to the user query",
     tools: list
     messages: list
+    priority : int = 10
+    use_cache : bool = True
 
 class ChatResponse(BaseModel):
     response : str
+
+class RebalanceRequest(BaseModel):
+    tickers : list[str]
+    start : str
+    end : str | None = None
+    objective : str = "max_sharpe"
+    target_return : float | None = None
+    risk_free_rate : float = 0.02
+    weight_bounds : tuple[float, float] = (0.0, 1.0)
+    total_portfolio_value : float = 15000
+    allocation_mode : str = "greedy"
+
+class RebalanceResult(BaseModel):
+    weights : dict
+    allocation : dict
+    leftover : float
+    expected_return : float
+    volatility : float
+    sharpe : float
+    backend : str
+
+class JobStatus(BaseModel):
+    id : str
+    status : str
+    created : float
+    started : float | None = None
+    finished : float | None = None
+    batch_size : int = 0
+    result : RebalanceResult | None = None
+    error : str | None = None
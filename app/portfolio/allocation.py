@@ -0,0 +1,166 @@
+from dataclasses import dataclass
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class AllocationResult:
+    '''
+    Share counts for m accounts over the same n tickers
+    tracking_error is the RMSE between target and allocated weights, measured on the invested
+    value like pypfopt's DiscreteAllocation, so heuristic and exact results are comparable
+    '''
+    shares: np.ndarray
+    leftover: np.ndarray
+    tracking_error: np.ndarray
+    portfolio_values: np.ndarray
+    tickers: list
+    mode: str
+
+    def allocation(self, account: int = 0) -> dict:
+        return {t: int(s) for t, s in zip(self.tickers, self.shares[account]) if s > 0}
+
+
+class DiscreteAllocator:
+    '''
+    Converts continuous long only weights into whole shares for a batch of account sizes
+        greedy  vectorized floor + deficit fill, then a bounded swap repair, all accounts at once
+        exact   pypfopt DiscreteAllocation.lp_portfolio per account (MILP)
+    Latest prices are taken once and shared by every account in the batch
+    '''
+
+    def __init__(self, weights, latest_prices: pd.Series, min_weight: float = 0.0):
+        self.logger = logging.getLogger(__name__)
+        weights = pd.Series(dict(weights) if not isinstance(weights, pd.Series) else weights, dtype=np.float64)
+        if (weights < 0).any():
+            raise ValueError("DiscreteAllocator only supports long only weights, use pypfopt for shorts")
+        weights = weights[weights > min_weight]
+
+        prices = latest_prices.reindex(weights.index)
+        if prices.isna().any() or (prices <= 0).any():
+            raise ValueError(f"Missing or non positive prices for {list(prices.index[prices.isna() | (prices <= 0)])}")
+
+        self.tickers = list(weights.index)
+        self.weights = weights.to_numpy() / weights.sum()
+        self.prices = prices.to_numpy(dtype=np.float64)
+
+    def allocate(
+        self, total_portfolio_values, mode: str = "greedy", repair_iterations: int = 50, repair_candidates: int = 8
+    ) -> AllocationResult:
+        values = np.atleast_1d(np.asarray(total_portfolio_values, dtype=np.float64))
+        if (values <= 0).any():
+            raise ValueError("total_portfolio_value must be greater than zero")
+
+        if mode == "greedy":
+            shares = self.greedy(values)
+            if repair_iterations:
+                shares = self.repair(shares, values, repair_iterations, repair_candidates)
+        elif mode == "exact":
+            shares = self.exact(values)
+        else:
+            raise ValueError(f"Unknown allocation mode: {mode}")
+
+        invested = shares @ self.prices
+        return AllocationResult(
+            shares=shares,
+            leftover=values - invested,
+            tracking_error=self.tracking_error(shares),
+            portfolio_values=values,
+            tickers=self.tickers,
+            mode=mode,
+        )
+
+    def tracking_error(self, shares: np.ndarray) -> np.ndarray:
+        held = shares * self.prices
+        invested = held.sum(axis=1, keepdims=True)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            allocated = np.where(invested > 0, held / invested, 0.0)
+        return np.sqrt(((allocated - self.weights) ** 2).mean(axis=1))
+
+    def greedy(self, values: np.ndarray) -> np.ndarray:
+        '''
+        Floors every target position, then like pypfopt's greedy_portfolio keeps buying one share of
+        the most underweight ticker each account can still afford until no ticker is affordable
+        Every account advances one share per round, so the loop is over rounds not accounts
+        '''
+        shares = np.floor(values[:, None] * self.weights[None, :] / self.prices[None, :]).astype(np.int64)
+        leftover = values - shares @ self.prices
+        quanta = self.prices[None, :] / values[:, None]
+        rows = np.arange(len(values))
+
+        while True:
+            deficit = self.weights[None, :] - shares * quanta
+            deficit[self.prices[None, :] > leftover[:, None]] = -np.inf
+            best = deficit.argmax(axis=1)
+            buying = np.isfinite(deficit[rows, best])
+            if not buying.any():
+                return shares
+            shares[rows[buying], best[buying]] += 1
+            leftover[buying] -= self.prices[best[buying]]
+
+    def repair(self, shares: np.ndarray, values: np.ndarray, iterations: int, candidates: int = 8) -> np.ndarray:
+        '''
+        Bounded local search over one for one swaps (sell a share of j, buy a share of i) and plain buys that lower
+        the squared weight error, where a swap changes it by q_i (q_i - 2 d_i) + q_j (q_j + 2 d_j)
+        with d = target - held weight and q = price / account value, plus the change in squared cash weight
+        Only the most under and over weight candidates are scored, keeping each pass O(m * k^2)
+        '''
+        shares = shares.copy()
+        quanta = self.prices[None, :] / values[:, None]
+        rows = np.arange(len(values))
+        k = min(candidates, len(self.tickers))
+
+        for _ in range(iterations):
+            leftover = values - shares @ self.prices
+            deficit = self.weights[None, :] - shares * quanta
+
+            buy = np.argsort(-deficit, axis=1)[:, :k]
+            sell = np.argsort(deficit, axis=1)[:, :k]
+            d_buy = np.take_along_axis(deficit, buy, axis=1)[:, :, None]
+            d_sell = np.take_along_axis(deficit, sell, axis=1)[:, None, :]
+            q_buy = np.take_along_axis(quanta, buy, axis=1)[:, :, None]
+            q_sell = np.take_along_axis(quanta, sell, axis=1)[:, None, :]
+
+            # idle cash is scored as a zero target position so swaps cannot just park money
+            cash = (leftover / values)[:, None, None]
+            change = q_buy * (q_buy - 2 * d_buy) + q_sell * (q_sell + 2 * d_sell)
+            change += (cash + q_sell - q_buy) ** 2 - cash ** 2
+            affordable = (
+                (leftover[:, None, None] + self.prices[sell][:, None, :] >= self.prices[buy][:, :, None])
+                & (np.take_along_axis(shares, sell, axis=1)[:, None, :] > 0)
+                & (buy[:, :, None] != sell[:, None, :])
+            )
+            change = np.where(affordable, change, np.inf).reshape(len(values), -1)
+
+            # plain buys spend cash that earlier swaps freed up
+            purchase = q_buy[:, :, 0] * (q_buy[:, :, 0] - 2 * d_buy[:, :, 0])
+            purchase += (cash[:, :, 0] - q_buy[:, :, 0]) ** 2 - cash[:, :, 0] ** 2
+            purchase = np.where(self.prices[buy] <= leftover[:, None], purchase, np.inf)
+            change = np.concatenate([change, purchase], axis=1)
+
+            flat = change.argmin(axis=1)
+            improving = change[rows, flat] < -1e-15
+            if not improving.any():
+                break
+
+            swap = rows[improving & (flat < k * k)]
+            shares[swap, buy[swap, flat[swap] // k]] += 1
+            shares[swap, sell[swap, flat[swap] % k]] -= 1
+            purchase = rows[improving & (flat >= k * k)]
+            shares[purchase, buy[purchase, flat[purchase] - k * k]] += 1
+        return shares
+
+    def exact(self, values: np.ndarray) -> np.ndarray:
+        from pypfopt.discrete_allocation import DiscreteAllocation
+
+        weights = dict(zip(self.tickers, self.weights))
+        prices = pd.Series(self.prices, index=self.tickers)
+        columns = {ticker: j for j, ticker in enumerate(self.tickers)}
+        shares = np.zeros((len(values), len(self.tickers)), dtype=np.int64)
+        for row, value in enumerate(values):
+            allocation, _ = DiscreteAllocation(weights, prices, total_portfolio_value=float(value)).lp_portfolio()
+            for ticker, count in allocation.items():
+                shares[row, columns[ticker]] = count
+        return shares
@@ -0,0 +1,325 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from app.data.marketDataStore import MarketDataStore, SnapshotHandle, attach
+from app.portfolio.riskEngine import TRADING_DAYS
+from app.portfolio.solvers import PortfolioSolver
+
+# module level so each pool process keeps one solver across tasks
+solver = PortfolioSolver()
+
+
+@dataclass(frozen=True)
+class BacktestParams:
+    '''
+    One walk-forward configuration, lookback and rebalance_every are in trading days
+    cost_bps is charged on one way turnover at every rebalance
+    '''
+    lookback: int = 252
+    rebalance_every: int = 21
+    objective: str = "max_sharpe"
+    bounds: tuple = (0.0, 1.0)
+    target_return: float = None
+    risk_free_rate: float = 0.02
+    cost_bps: float = 10.0
+
+    @property
+    def schedule_key(self) -> tuple:
+        return (self.lookback, self.rebalance_every)
+
+    @property
+    def solve_key(self) -> tuple:
+        return (self.objective, tuple(self.bounds), self.target_return, self.risk_free_rate)
+
+
+@dataclass
+class BacktestResult:
+    '''
+    Out of sample daily returns of one configuration, net of costs
+    weights holds the target weights set at the close of each rebalance date, they are held
+    (and drift with prices) from the next day on. Days before the first rebalance are in cash
+    '''
+    params: BacktestParams
+    dates: pd.DatetimeIndex
+    tickers: list
+    rebalance_dates: pd.DatetimeIndex
+    weights: np.ndarray
+    returns: np.ndarray
+    turnover: np.ndarray
+    costs: np.ndarray
+    failed: int = 0
+    frequency: int = TRADING_DAYS
+
+    def equity(self) -> pd.Series:
+        return pd.Series(np.cumprod(1 + self.returns), index=self.dates)
+
+    def weights_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.weights, index=self.rebalance_dates, columns=self.tickers)
+
+    def summary(self) -> dict:
+        held = self.returns[self.dates > self.rebalance_dates[0]] if len(self.rebalance_dates) else self.returns[:0]
+        if len(held) < 2:
+            return {"days": len(held), "rebalances": len(self.rebalance_dates), "failed": self.failed}
+
+        equity = np.cumprod(1 + held)
+        volatility = held.std(ddof=1) * np.sqrt(self.frequency)
+        return {
+            "days": len(held),
+            "rebalances": len(self.rebalance_dates),
+            "failed": self.failed,
+            "cagr": float(equity[-1] ** (self.frequency / len(held)) - 1),
+            "volatility": float(volatility),
+            "sharpe": float((held.mean() * self.frequency - self.params.risk_free_rate) / volatility) if volatility > 0 else float("nan"),
+            "max_drawdown": float((equity / np.maximum.accumulate(equity) - 1).min()),
+            "mean_turnover": float(self.turnover.mean()),
+            "total_costs": float(self.costs.sum()),
+        }
+
+
+class Backtester:
+    '''
+    Walk-forward backtest over one aligned daily returns matrix
+        estimate    mean and covariance of every rebalance window, rolled forward by rank k updates
+                    or computed as batched matmuls over stacked windows, not one returns.cov() per date
+        solve       one solve per rebalance per distinct objective and bounds, configurations that
+                    differ only in costs share the weights
+        paths       drifted holdings, turnover and costs for all segments at once from prefix sums
+                    of log growth, no per day loop
+    An asset enters a window's solve only if it has a return on every day of the window
+    A failed solve keeps the previous target weights
+    '''
+
+    def __init__(self, returns: pd.DataFrame, frequency: int = TRADING_DAYS, solver: PortfolioSolver = None, chunk_size: int = 16):
+        self.logger = logging.getLogger(__name__)
+        self.tickers = list(returns.columns)
+        self.dates = pd.DatetimeIndex(returns.index)
+        self.frequency = frequency
+        self.solver = solver or PortfolioSolver()
+        # windows estimated per batched matmul, bounds the (chunk, n, n) temporary
+        self.chunk_size = chunk_size
+
+        values = returns.to_numpy(dtype=np.float64)
+        self.valid = np.isfinite(values)
+        self.filled = np.where(self.valid, values, 0.0)
+        # log growth of each asset up to and including each day, a missing return counts as flat
+        self.growth = np.cumsum(np.log1p(self.filled), axis=0)
+        self.missing = np.concatenate([np.zeros((1, len(self.tickers)), dtype=np.int64), np.cumsum(~self.valid, axis=0)])
+
+    @classmethod
+    def from_prices(cls, prices: pd.DataFrame, **kwargs):
+        # the same returns RiskEngine.from_prices and MarketDataStore.publish use
+        return cls(prices.dropna(axis=1, how="all").pct_change().dropna(how="all"), **kwargs)
+
+    @property
+    def n_assets(self) -> int:
+        return len(self.tickers)
+
+    def schedule(self, lookback: int, rebalance_every: int) -> np.ndarray:
+        # row index of each rebalance close, the last one still needs a day to hold its weights
+        if lookback < 2 or rebalance_every < 1:
+            raise ValueError("lookback needs at least 2 days and rebalance_every at least 1")
+        return np.arange(lookback - 1, len(self.dates) - 1, rebalance_every)
+
+    # ------------------------------------------------------------------
+    # estimates and solves
+    # ------------------------------------------------------------------
+    def estimates(self, rebalances: np.ndarray, lookback: int):
+        '''
+        Yields (mu, cov, eligible) per rebalance, annualized like RiskEngine.from_returns
+        Overlapping windows keep running sums of x and x x', so moving one rebalance forward is a
+        rank k update with the rows that entered and a downdate with the rows that left
+        Windows that do not overlap enough, and every resync, are recomputed as one batched matmul
+        '''
+        windows = sliding_window_view(self.filled, lookback, axis=0)
+        step = int(rebalances[1] - rebalances[0]) if len(rebalances) > 1 else lookback
+        # a rank k update touches 2 * step rows against lookback for a recompute
+        rolling = 2 * step < lookback
+        chunk = 1 if rolling else self.chunk_size
+        since_resync = total = sums = None
+
+        for start in range(0, len(rebalances), chunk):
+            ends = rebalances[start:start + chunk]
+            eligible = self.missing[ends + 1] - self.missing[ends + 1 - lookback] == 0
+
+            if rolling and sums is not None and since_resync < lookback:
+                end = ends[0]
+                entered = self.filled[end - step + 1:end + 1]
+                left = self.filled[end - step - lookback + 1:end - lookback + 1]
+                sums += entered.sum(axis=0) - left.sum(axis=0)
+                total += entered.T @ entered
+                total -= left.T @ left
+                since_resync += step
+                # at this size the passes over n x n memory cost more than the flops, so they are fused
+                mean = sums / lookback
+                cov = np.multiply(total, self.frequency / (lookback - 1))
+                cov -= np.outer(mean, mean * (lookback * self.frequency / (lookback - 1)))
+                yield mean * self.frequency, cov, eligible[0]
+                continue
+
+            block = windows[ends - lookback + 1]
+            mean = block.mean(axis=2)
+            centered = block - mean[:, :, None]
+            cov = np.matmul(centered, centered.transpose(0, 2, 1)) / (lookback - 1)
+            if rolling:
+                # exact restart of the running sums, bounds the rounding the downdates accumulate
+                sums = block[0].sum(axis=1)
+                total = block[0] @ block[0].T
+                since_resync = 0
+            for i in range(len(ends)):
+                yield mean[i] * self.frequency, cov[i] * self.frequency, eligible[i]
+
+    def solve(self, key: tuple, mu: np.ndarray, cov: np.ndarray, eligible: np.ndarray) -> np.ndarray:
+        objective, bounds, target_return, risk_free_rate = key
+        if eligible.all():
+            index = slice(None)
+        else:
+            index = np.flatnonzero(eligible)
+            mu, cov = mu[index], cov[np.ix_(index, index)]
+        result = self.solver.solve(
+            objective, mu, cov,
+            target_return=target_return, bounds=bounds, risk_free_rate=risk_free_rate,
+        )
+        weights = np.zeros(self.n_assets)
+        weights[index] = result.weights
+        return weights
+
+    def weights(self, rebalances: np.ndarray, lookback: int, keys: list) -> dict:
+        '''
+        Target weights (m x n) and the number of failed solves per solve key, each window estimated once
+        '''
+        targets = {key: np.zeros((len(rebalances), self.n_assets)) for key in keys}
+        failed = dict.fromkeys(keys, 0)
+        for i, (mu, cov, eligible) in enumerate(self.estimates(rebalances, lookback)):
+            for key in keys:
+                try:
+                    targets[key][i] = self.solve(key, mu, cov, eligible)
+                except Exception as e:
+                    self.logger.debug("Rebalance on %s failed for %s: %r", self.dates[rebalances[i]].date(), key, e)
+                    failed[key] += 1
+                    if i:
+                        targets[key][i] = targets[key][i - 1]
+        return {key: (targets[key], failed[key]) for key in keys}
+
+    # ------------------------------------------------------------------
+    # paths
+    # ------------------------------------------------------------------
+    def paths(self, rebalances: np.ndarray, weights: np.ndarray, cost_bps: float) -> tuple:
+        '''
+        Net daily returns (T), turnover (m) and costs (m) of holding weights[k] from the day after
+        rebalances[k] until the next rebalance, with holdings drifting with prices in between
+        '''
+        days = len(self.dates)
+        returns = np.zeros(days)
+        if not len(rebalances):
+            return returns, np.zeros(0), np.zeros(0)
+
+        starts = rebalances + 1
+        segment = np.searchsorted(starts, np.arange(days), side="right") - 1
+        held = np.flatnonzero(segment >= 0)
+        segment = segment[held]
+
+        # value of each holding relative to the close it was bought at
+        relative = np.exp(self.growth[held] - self.growth[rebalances][segment])
+        value = np.einsum("tn,tn->t", relative, weights[segment])
+        previous = np.ones_like(value)
+        continuing = np.r_[False, segment[1:] == segment[:-1]]
+        previous[continuing] = value[:-1][continuing[1:]]
+        gross = value / previous - 1
+
+        # holdings at the close of each rebalance, drifted from the previous target
+        closes = rebalances[1:] - starts[0]
+        drifted = np.zeros_like(weights)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            drifted[1:] = np.nan_to_num(weights[:-1] * relative[closes] / value[closes, None])
+        turnover = np.abs(weights - drifted).sum(axis=1)
+        costs = turnover * cost_bps / 10_000
+
+        net = gross.copy()
+        net[starts - starts[0]] = (1 + gross[starts - starts[0]]) * (1 - costs) - 1
+        returns[held] = net
+        return returns, turnover, costs
+
+    # ------------------------------------------------------------------
+    # runs
+    # ------------------------------------------------------------------
+    def run(self, params: BacktestParams) -> BacktestResult:
+        return self.run_many([params])[0]
+
+    def run_many(self, params_list: list) -> list:
+        '''
+        Results in input order, configurations sharing a schedule share their window estimates
+        '''
+        results = [None] * len(params_list)
+        schedules = defaultdict(list)
+        for i, params in enumerate(params_list):
+            schedules[params.schedule_key].append(i)
+
+        for (lookback, rebalance_every), members in schedules.items():
+            rebalances = self.schedule(lookback, rebalance_every)
+            keys = list(dict.fromkeys(params_list[i].solve_key for i in members))
+            solved = self.weights(rebalances, lookback, keys)
+            for i in members:
+                params = params_list[i]
+                weights, failed = solved[params.solve_key]
+                returns, turnover, costs = self.paths(rebalances, weights, params.cost_bps)
+                results[i] = BacktestResult(
+                    params=params,
+                    dates=self.dates,
+                    tickers=self.tickers,
+                    rebalance_dates=self.dates[rebalances],
+                    weights=weights,
+                    returns=returns,
+                    turnover=turnover,
+                    costs=costs,
+                    failed=failed,
+                    frequency=self.frequency,
+                )
+        return results
+
+
+def run_batch(handle: SnapshotHandle, params_list: list) -> list:
+    '''
+    Pool task, backtests params_list against a published MarketDataStore snapshot
+    '''
+    snapshot = attach(handle)
+    return Backtester(snapshot.returns_frame(), solver=solver).run_many(params_list)
+
+
+def run_parallel(prices: pd.DataFrame, params_list: list, max_workers: int = None, store: MarketDataStore = None) -> list:
+    '''
+    Results in input order with independent schedules spread over a spawn process pool
+    The returns matrix is published once to shared memory, workers attach instead of unpickling it
+    '''
+    max_workers = max_workers or os.cpu_count() or 1
+    owned = store is None
+    store = store or MarketDataStore()
+    handle = store.publish(prices)
+
+    # a schedule is the unit of shared work, so whole schedules go to one task
+    schedules = defaultdict(list)
+    for i, params in enumerate(params_list):
+        schedules[params.schedule_key].append(i)
+    chunks = [[] for _ in range(min(max_workers, len(schedules)))]
+    for members in sorted(schedules.values(), key=len, reverse=True):
+        min(chunks, key=len).extend(members)
+
+    results = [None] * len(params_list)
+    try:
+        with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(run_batch, handle, [params_list[i] for i in chunk]) for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for i, result in zip(chunk, future.result()):
+                    results[i] = result
+    finally:
+        store.retire(handle)
+        if owned:
+            store.close()
+    return results
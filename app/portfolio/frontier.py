@@ -0,0 +1,230 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import logging
+
+import numpy as np
+import osqp
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio import riskModels
+from app.portfolio.riskModels import FactorModel
+
+
+@dataclass
+class FrontierResult:
+    '''
+    One swept frontier, row i of weights is the solution for targets[i]
+    Points that failed to solve are NaN and flagged in solved
+    '''
+    label: str
+    kind: str
+    targets: np.ndarray
+    returns: np.ndarray
+    volatilities: np.ndarray
+    sharpes: np.ndarray
+    weights: np.ndarray
+    solved: np.ndarray
+    tickers: list = None
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {"target": self.targets, "return": self.returns, "volatility": self.volatilities, "sharpe": self.sharpes}
+        )
+
+
+@dataclass
+class SweepSpec:
+    '''
+    Independent sweep for FrontierSweep.sweep_many, e.g. one shrinkage variant x one constraint set
+    '''
+    label: str
+    mu: object
+    cov: object
+    bounds: tuple = (0.0, 1.0)
+    kind: str = "return"
+    targets: object = None
+    points: int = 100
+    risk_free_rate: float = 0.02
+    solver_options: dict = field(default_factory=dict)
+
+
+class FrontierSweep:
+    '''
+    Sweeps the efficient frontier over one OSQP problem that is set up once
+        return        minimize 1/2 w'Sw                 subject to mu'w >= target
+        risk_aversion minimize 1/2 w'Sw - mu'w / gamma  (same argmin as mu'w - gamma/2 w'Sw)
+    plus sum(w) == 1 and the weight bounds. Moving along the frontier only updates one constraint
+    bound or the linear term, so the factorization is reused and every solve is warm started from
+    the previous point instead of building a new EfficientFrontier per point
+    With a FactorModel the problem is set up over (w, y) with y = B'w, minimizing y'Fy + w'Dw, so the
+    quadratic and constraint matrices hold O(n k) nonzeros instead of a dense n x n block
+    '''
+
+    # polishing snaps each solution onto its active set, so loose tolerances still give exact weights
+    SETTINGS = {"eps_abs": 1e-6, "eps_rel": 1e-6, "polishing": True, "max_iter": 100000, "verbose": False}
+
+    def __init__(self, mu, cov, bounds: tuple = (0.0, 1.0), risk_free_rate: float = 0.02, **solver_options):
+        self.logger = logging.getLogger(__name__)
+        self.engine = RiskEngine(mu, cov, risk_free_rate=risk_free_rate)
+        self.tickers = self.engine.tickers
+        self.mu = self.engine.mu
+        self.cov = self.engine.cov if isinstance(self.engine.cov, FactorModel) else (self.engine.cov + self.engine.cov.T) / 2
+        self.n = len(self.mu)
+        self.risk_free_rate = risk_free_rate
+
+        lower, upper = bounds
+        self.lower = np.broadcast_to(np.asarray(-np.inf if lower is None else lower, dtype=np.float64), self.n).copy()
+        self.upper = np.broadcast_to(np.asarray(np.inf if upper is None else upper, dtype=np.float64), self.n).copy()
+        self.settings = {**self.SETTINGS, **solver_options}
+
+        # constraint rows: budget, return floor, then one row per weight bound
+        self.A = sparse.vstack(
+            [sparse.csc_matrix(np.ones((1, self.n))), sparse.csc_matrix(self.mu[None, :]), sparse.identity(self.n)],
+            format="csc",
+        )
+        self.l = np.concatenate([[1.0, -np.inf], self.lower])
+        self.u = np.concatenate([[1.0, np.inf], self.upper])
+
+        if isinstance(self.cov, FactorModel):
+            # extra variables y = B'w carry the factor exposures, their rows pin B'w - y to zero
+            k = self.cov.n_factors
+            P = sparse.block_diag([sparse.diags(self.cov.specific), sparse.csc_matrix(self.cov.factor_cov)], format="csc")
+            exposures = sparse.hstack([sparse.csc_matrix(self.cov.loadings.T), -sparse.identity(k)])
+            self.A = sparse.vstack([sparse.hstack([self.A, sparse.csc_matrix((self.A.shape[0], k))]), exposures], format="csc")
+            self.l = np.concatenate([self.l, np.zeros(k)])
+            self.u = np.concatenate([self.u, np.zeros(k)])
+            # the default picks the rho update interval from setup time, which left the (w, y) problem
+            # stalling at the top of the frontier, a fixed interval keeps it converging
+            self.settings = {"adaptive_rho_interval": 25, **self.settings}
+        else:
+            P = sparse.csc_matrix(self.cov)
+        self.variables = P.shape[0]
+
+        self.solver = osqp.OSQP()
+        self.solver.setup(sparse.triu(P, format="csc"), np.zeros(self.variables), self.A, self.l, self.u, **self.settings)
+        self.x = None
+        self.y = None
+
+    def solve(self, q: np.ndarray, return_floor: float):
+        l = self.l.copy()
+        l[1] = return_floor
+        if len(q) < self.variables:
+            q = np.concatenate([q, np.zeros(self.variables - len(q))])
+        self.solver.update(q=q, l=l)
+        if self.x is not None:
+            self.solver.warm_start(x=self.x, y=self.y)
+
+        result = self.solver.solve()
+        if result.info.status_val not in (osqp.constant("OSQP_SOLVED"), osqp.constant("OSQP_SOLVED_INACCURATE")):
+            return None
+        self.x, self.y = result.x, result.y
+        return result.x[:self.n]
+
+    def return_range(self) -> tuple:
+        '''
+        Returns (min variance return, max feasible return) for the current bounds
+        Raises ValueError if no fully invested portfolio fits the bounds or the return is unbounded
+        '''
+        weights = self.solve(np.zeros(self.n), -np.inf)
+        if weights is None:
+            raise ValueError(f"No minimum variance portfolio for weight bounds {self.describe_bounds()}")
+        low = float(self.mu @ weights)
+
+        lower = np.where(np.isfinite(self.lower), self.lower, None)
+        upper = np.where(np.isfinite(self.upper), self.upper, None)
+        best = linprog(-self.mu, A_eq=np.ones((1, self.n)), b_eq=[1.0], bounds=list(zip(lower, upper)), method="highs")
+        if best.x is None:
+            raise ValueError(f"No maximum return portfolio for weight bounds {self.describe_bounds()}: {best.message}")
+        high = float(self.mu @ best.x)
+        return low, high
+
+    def describe_bounds(self) -> str:
+        # one (lower, upper) pair when every weight shares it, otherwise the range of each side
+        side = lambda values: f"{values[0]:g}" if np.all(values == values[0]) else f"{values.min():g}..{values.max():g}"
+        return f"({side(self.lower)}, {side(self.upper)})"
+
+    def sweep(self, kind: str, targets, label: str = "") -> FrontierResult:
+        if kind not in ("return", "risk_aversion"):
+            raise ValueError(f"Unknown frontier sweep kind: {kind}")
+
+        targets = np.asarray(targets, dtype=np.float64)
+        weights = np.full((len(targets), self.n), np.nan)
+        solved = np.zeros(len(targets), dtype=bool)
+
+        # walk risk aversion from risky to conservative so neighbouring points stay close
+        order = np.argsort(targets) if kind == "risk_aversion" else np.arange(len(targets))
+        for i in order:
+            if kind == "return":
+                solution = self.solve(np.zeros(self.n), targets[i])
+            else:
+                solution = self.solve(-self.mu / targets[i], -np.inf)
+            if solution is None:
+                self.logger.warning("Frontier point %s=%s did not solve", kind, targets[i])
+                continue
+            weights[i] = solution
+            solved[i] = True
+
+        metrics = self.engine.evaluate(np.nan_to_num(weights))
+        mask = np.where(solved, 1.0, np.nan)
+        return FrontierResult(
+            label=label,
+            kind=kind,
+            targets=targets,
+            returns=metrics.expected_return * mask,
+            volatilities=metrics.volatility * mask,
+            sharpes=metrics.sharpe * mask,
+            weights=weights,
+            solved=solved,
+            tickers=self.tickers,
+        )
+
+    def efficient_return(self, targets=None, points: int = 100, label: str = "") -> FrontierResult:
+        if targets is None:
+            low, high = self.return_range()
+            targets = np.linspace(low, high, points)
+        return self.sweep("return", targets, label)
+
+    def efficient_risk_aversion(self, gammas=None, points: int = 100, label: str = "") -> FrontierResult:
+        if gammas is None:
+            gammas = np.logspace(-1, 3, points)
+        return self.sweep("risk_aversion", gammas, label)
+
+    # ------------------------------------------------------------------
+    # independent sweeps
+    # ------------------------------------------------------------------
+    @staticmethod
+    def run_spec(spec: SweepSpec) -> FrontierResult:
+        sweep = FrontierSweep(spec.mu, spec.cov, spec.bounds, spec.risk_free_rate, **spec.solver_options)
+        if spec.kind == "return":
+            return sweep.efficient_return(spec.targets, spec.points, spec.label)
+        return sweep.efficient_risk_aversion(spec.targets, spec.points, spec.label)
+
+    @staticmethod
+    def sweep_many(specs: list, max_workers: int = None) -> list:
+        '''
+        Runs independent sweeps, across a process pool when max_workers > 1
+        '''
+        if max_workers is None or max_workers <= 1 or len(specs) <= 1:
+            return [FrontierSweep.run_spec(spec) for spec in specs]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(FrontierSweep.run_spec, specs))
+
+
+def shrinkage_variants(prices: pd.DataFrame, frequency: int = 252, factors: int = None) -> dict:
+    '''
+    Common covariance estimates of the same prices, keyed by name, for multi variant sweeps
+    factors adds a statistical factor model with that many components
+    '''
+    returns = prices.pct_change().dropna(how="all")
+    variants = {
+        "sample": riskModels.sample_cov(returns, frequency),
+        "ledoit_wolf": riskModels.ledoit_wolf(returns, frequency),
+        "oracle_approximating": riskModels.oas(returns, frequency),
+        "shrunk_0.2": riskModels.shrunk_covariance(returns, 0.2, frequency),
+    }
+    if factors:
+        variants[f"factor_{factors}"] = riskModels.FactorModel.from_returns(returns, factors, frequency)
+    return variants
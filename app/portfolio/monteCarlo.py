@@ -0,0 +1,350 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import math
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio import riskModels
+from app.portfolio.riskModels import FactorModel, TRADING_DAYS
+from app.portfolio.solvers import CholeskyCache
+
+# shared so engines built on the same covariance factor it once
+cholesky = CholeskyCache()
+
+DRAWDOWN_BINS = 1000
+
+
+@dataclass
+class ScenarioSet:
+    '''
+    Everything needed to regenerate any chunk of daily asset return paths, small enough to pickle per task
+    Chunk i is always drawn from SeedSequence(seed, spawn_key=(i,)), so a path does not depend on
+    which process draws it or how the chunks are split between tasks
+        normal      mu + L z with L the Cholesky factor of the daily covariance
+        factor      mu + B F^1/2 z + d^1/2 e, O(n k) per draw, from a FactorModel
+        bootstrap   blocks of consecutive historical days, keeps fat tails and short range dependence
+    '''
+    method: str
+    mu: np.ndarray
+    horizon: int
+    chunk_paths: int
+    seed: int = 0
+    factor: np.ndarray = None
+    exposures: np.ndarray = None
+    specific: np.ndarray = None
+    history: np.ndarray = None
+    block: int = 5
+
+    @property
+    def n_assets(self) -> int:
+        return len(self.mu)
+
+    def chunk(self, index: int, paths: int = None) -> np.ndarray:
+        '''
+        Daily simple returns (paths x horizon x n) of chunk index
+        '''
+        paths = self.chunk_paths if paths is None else paths
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(index,)))
+        days = paths * self.horizon
+
+        if self.method == "normal":
+            draws = rng.standard_normal((days, self.n_assets)) @ self.factor.T
+        elif self.method == "factor":
+            draws = rng.standard_normal((days, self.exposures.shape[1])) @ self.exposures.T
+            draws += rng.standard_normal((days, self.n_assets)) * self.specific
+        elif self.method == "bootstrap":
+            blocks = -(-self.horizon // self.block)
+            starts = rng.integers(0, len(self.history) - self.block + 1, (paths, blocks))
+            rows = (starts[:, :, None] + np.arange(self.block)).reshape(paths, -1)[:, :self.horizon]
+            return self.history[rows]
+        else:
+            raise ValueError(f"Unknown scenario method: {self.method}")
+
+        draws += self.mu
+        return draws.reshape(paths, self.horizon, self.n_assets)
+
+
+@dataclass
+class TailAccumulator:
+    '''
+    Mergeable reduction of simulated horizon returns for m portfolios
+    Only the keep largest losses per portfolio are held, which is all an exact VaR and CVaR at the
+    lowest level needs, plus running moments and a histogram of maximum drawdowns
+    New losses are buffered and cut back to keep once they outgrow it, so the partition is amortized
+    over many chunks instead of paid per chunk
+    '''
+    portfolios: int
+    keep: int
+    count: int = 0
+    total: np.ndarray = None
+    squares: np.ndarray = None
+    losing: np.ndarray = None
+    drawdowns: np.ndarray = None
+    drawdown_total: np.ndarray = None
+    buffer: list = None
+    buffered: int = 0
+
+    def __post_init__(self):
+        m = self.portfolios
+        self.total = np.zeros(m) if self.total is None else self.total
+        self.squares = np.zeros(m) if self.squares is None else self.squares
+        self.losing = np.zeros(m, dtype=np.int64) if self.losing is None else self.losing
+        self.drawdowns = np.zeros((DRAWDOWN_BINS, m), dtype=np.int64) if self.drawdowns is None else self.drawdowns
+        self.drawdown_total = np.zeros(m) if self.drawdown_total is None else self.drawdown_total
+        self.buffer = [] if self.buffer is None else self.buffer
+
+    def push(self, losses: np.ndarray):
+        self.buffer.append(losses)
+        self.buffered += len(losses)
+        if self.buffered > 2 * self.keep:
+            self.compact()
+
+    def compact(self) -> np.ndarray:
+        # largest keep losses per column, unordered, partitioned in place so only the concatenation is extra
+        if not self.buffer:
+            return np.empty((0, self.portfolios))
+        losses = np.concatenate(self.buffer) if len(self.buffer) > 1 else self.buffer[0]
+        if len(losses) > self.keep:
+            self.buffer = None
+            np.negative(losses, out=losses)
+            losses.partition(self.keep - 1, axis=0)
+            losses = -losses[:self.keep]
+        self.buffer, self.buffered = [losses], len(losses)
+        return losses
+
+    def add(self, terminal: np.ndarray, drawdown: np.ndarray):
+        m = self.portfolios
+        self.count += len(terminal)
+        self.total += terminal.sum(axis=0)
+        self.squares += (terminal ** 2).sum(axis=0)
+        self.losing += (terminal < 0).sum(axis=0)
+        self.push(-terminal)
+        # one bincount over all portfolios, each offset into its own block of bins
+        bins = np.minimum((drawdown * DRAWDOWN_BINS).astype(np.int64), DRAWDOWN_BINS - 1) + np.arange(m) * DRAWDOWN_BINS
+        self.drawdowns += np.bincount(bins.ravel(), minlength=DRAWDOWN_BINS * m).reshape(m, DRAWDOWN_BINS).T
+        self.drawdown_total += drawdown.sum(axis=0)
+
+    def merge(self, other: "TailAccumulator") -> "TailAccumulator":
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        self.losing += other.losing
+        self.push(other.compact())
+        self.drawdowns += other.drawdowns
+        self.drawdown_total += other.drawdown_total
+        return self
+
+
+@dataclass
+class SimulationResult:
+    '''
+    Per portfolio metrics of the simulated horizon return, losses are positive numbers
+    var and cvar map each confidence level to a length m array, drawdown quantiles come from a
+    histogram with 0.1% bins
+    '''
+    paths: int
+    horizon: int
+    method: str
+    expected_return: np.ndarray
+    volatility: np.ndarray
+    loss_probability: np.ndarray
+    var: dict
+    cvar: dict
+    drawdown_mean: np.ndarray
+    drawdown_quantiles: dict
+    labels: list = field(default=None)
+
+    def to_frame(self) -> pd.DataFrame:
+        columns = {
+            "expected_return": self.expected_return,
+            "volatility": self.volatility,
+            "loss_probability": self.loss_probability,
+        }
+        for level in self.var:
+            columns[f"var_{level:g}"] = self.var[level]
+            columns[f"cvar_{level:g}"] = self.cvar[level]
+        columns["drawdown_mean"] = self.drawdown_mean
+        for level, values in self.drawdown_quantiles.items():
+            columns[f"drawdown_{level:g}"] = values
+        return pd.DataFrame(columns, index=self.labels)
+
+
+def tail_size(level: float, paths: int) -> int:
+    # rounded first, (1 - 0.99) * 20000 is 200.00000000000017 in floating point
+    return max(1, math.ceil(round((1 - level) * paths, 9)))
+
+
+def simulate_chunks(scenarios: ScenarioSet, weights: np.ndarray, chunks: list, keep: int, block_bytes: int) -> TailAccumulator:
+    '''
+    Pool task, draws the given chunks and reduces them for every weight vector
+    Weight vectors are taken in blocks so the (paths x horizon x block) portfolio arrays stay near block_bytes
+    '''
+    accumulator = TailAccumulator(len(weights), keep)
+    for index, paths in chunks:
+        returns = scenarios.chunk(index, paths)
+        flat = returns.reshape(-1, returns.shape[2])
+        # three live (paths x horizon x block) arrays: returns, wealth and running peak
+        step = max(1, block_bytes // (3 * 8 * returns.shape[0] * returns.shape[1]))
+
+        terminal = np.empty((len(returns), len(weights)))
+        drawdown = np.empty((len(returns), len(weights)))
+        for start in range(0, len(weights), step):
+            block = weights[start:start + step]
+            wealth = (flat @ block.T).reshape(len(returns), returns.shape[1], len(block))
+            wealth += 1
+            np.cumprod(wealth, axis=1, out=wealth)
+            peak = np.maximum.accumulate(wealth, axis=1)
+            np.maximum(peak, 1.0, out=peak)
+            terminal[:, start:start + step] = wealth[:, -1] - 1
+            drawdown[:, start:start + step] = (1 - wealth / peak).max(axis=1)
+        accumulator.add(terminal, drawdown)
+    accumulator.compact()
+    return accumulator
+
+
+class MonteCarloEngine:
+    '''
+    Simulated horizon returns, VaR, CVaR and drawdown distributions for many weight vectors at once
+    Paths are generated and reduced one fixed size chunk at a time, so memory stays bounded by
+    chunk_bytes plus the worst (1 - min(levels)) share of outcomes that exact VaR and CVaR need,
+    never by the paths themselves. Every weight vector
+    is scored against the same scenarios, and chunks spread over a spawn process pool
+    mu and cov are annualized as everywhere else, cov may be a FactorModel
+    '''
+
+    def __init__(
+        self,
+        mu,
+        cov=None,
+        horizon: int = TRADING_DAYS,
+        method: str = "normal",
+        returns: pd.DataFrame = None,
+        block: int = 5,
+        frequency: int = TRADING_DAYS,
+        chunk_bytes: int = 32 * 2**20,
+        seed: int = 0,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.tickers = list(mu.index) if isinstance(mu, pd.Series) else None
+        daily_mu = np.asarray(mu, dtype=np.float64) / frequency
+        n = len(daily_mu)
+        self.chunk_bytes = chunk_bytes
+        # sized from the scenario array alone, so the paths never depend on how many weights are scored
+        chunk_paths = max(1, chunk_bytes // (8 * horizon * n * 2))
+
+        if method == "bootstrap":
+            if returns is None:
+                raise ValueError("Bootstrap scenarios need historical returns")
+            history = returns[self.tickers] if self.tickers is not None else returns
+            history = np.nan_to_num(np.asarray(history, dtype=np.float64))
+            if len(history) < block:
+                raise ValueError(f"Need at least {block} days of history to draw blocks")
+            self.scenarios = ScenarioSet("bootstrap", daily_mu, horizon, chunk_paths, seed, history=np.ascontiguousarray(history), block=block)
+        elif isinstance(cov, FactorModel):
+            model = cov.reindex(self.tickers) if self.tickers is not None and cov.tickers is not None else cov
+            root = np.linalg.cholesky(model.factor_cov / frequency)
+            self.scenarios = ScenarioSet(
+                "factor", daily_mu, horizon, chunk_paths, seed,
+                exposures=model.loadings @ root, specific=np.sqrt(model.specific / frequency),
+            )
+        elif method == "normal":
+            if isinstance(cov, pd.DataFrame) and self.tickers is not None:
+                cov = cov.loc[self.tickers, self.tickers]
+            cov = np.ascontiguousarray(cov, dtype=np.float64)
+            # cho_factor leaves the upper triangle untouched, the scaling turns the annual factor daily
+            factor = np.tril(cholesky.get(cov)[0]) / np.sqrt(frequency)
+            self.scenarios = ScenarioSet("normal", daily_mu, horizon, chunk_paths, seed, factor=factor)
+        else:
+            raise ValueError(f"Unknown scenario method: {method}")
+
+    @classmethod
+    def from_returns(
+        cls, returns: pd.DataFrame, method: str = "bootstrap", frequency: int = TRADING_DAYS, risk_model: str = "sample", factors: int = 20, **kwargs
+    ):
+        # risk_model only matters for normal scenarios, a factor model draws through its loadings
+        mu = returns.mean() * frequency
+        options = {"factors": factors} if risk_model == "factor" else {}
+        cov = None if method == "bootstrap" else riskModels.estimate(returns, risk_model, frequency, **options)
+        return cls(mu, cov, method=method, returns=returns, frequency=frequency, **kwargs)
+
+    def as_matrix(self, weights) -> tuple:
+        labels = None
+        if isinstance(weights, pd.DataFrame):
+            labels = list(weights.index)
+            # rows built from weight dicts leave NaN where a ticker was not held
+            weights = (weights.reindex(columns=self.tickers) if self.tickers else weights).fillna(0.0)
+        elif isinstance(weights, (pd.Series, dict)) and self.tickers:
+            weights = pd.Series(weights).reindex(self.tickers, fill_value=0.0)
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        if weights.shape[1] != self.scenarios.n_assets:
+            raise ValueError(f"Expected weights of shape (k, {self.scenarios.n_assets}), got {weights.shape}")
+        if not np.isfinite(weights).all():
+            raise ValueError("Weights must be finite")
+        return np.ascontiguousarray(weights), labels
+
+    def simulate(self, weights, paths: int = 100_000, levels: tuple = (0.95, 0.99), max_workers: int = None) -> SimulationResult:
+        '''
+        Scores one weight vector or a (k x n) matrix against paths simulated horizons
+        Runs across a process pool when max_workers > 1
+        '''
+        if paths < 1:
+            raise ValueError(f"Expected at least one path, got {paths}")
+        if not levels or not all(0 < level < 1 for level in levels):
+            raise ValueError(f"Confidence levels must be strictly between 0 and 1, got {levels}")
+        weights, labels = self.as_matrix(weights)
+        chunk_paths = self.scenarios.chunk_paths
+        chunks = [(i, min(chunk_paths, paths - i * chunk_paths)) for i in range(-(-paths // chunk_paths))]
+        keep = tail_size(min(levels), paths)
+
+        if max_workers is None or max_workers <= 1 or len(chunks) <= 1:
+            accumulator = simulate_chunks(self.scenarios, weights, chunks, keep, self.chunk_bytes)
+        else:
+            # contiguous runs of chunks, a few per worker so a slow task does not hold up the rest
+            tasks = min(len(chunks), max_workers * 4)
+            bounds = np.linspace(0, len(chunks), tasks + 1).astype(int)
+            with ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [
+                    pool.submit(simulate_chunks, self.scenarios, weights, chunks[start:end], keep, self.chunk_bytes)
+                    for start, end in zip(bounds[:-1], bounds[1:])
+                ]
+                accumulator = TailAccumulator(len(weights), keep)
+                # in submission order so the merge is deterministic, popped so each tail is freed once merged
+                while futures:
+                    accumulator.merge(futures.pop(0).result())
+
+        return self.summarize(accumulator, levels, labels)
+
+    def summarize(self, accumulator: TailAccumulator, levels: tuple, labels: list) -> SimulationResult:
+        count = accumulator.count
+        mean = accumulator.total / count
+        variance = np.maximum(accumulator.squares / count - mean ** 2, 0.0) * count / max(count - 1, 1)
+        losses = -np.sort(-accumulator.compact(), axis=0)
+
+        var, cvar = {}, {}
+        for level in levels:
+            # the worst ceil((1 - level) N) outcomes, VaR is the best of them and CVaR their mean
+            k = tail_size(level, count)
+            var[level] = losses[k - 1]
+            cvar[level] = losses[:k].mean(axis=0)
+
+        cumulative = np.cumsum(accumulator.drawdowns, axis=0)
+        quantiles = {
+            level: (np.argmax(cumulative >= level * count, axis=0) + 1) / DRAWDOWN_BINS
+            for level in (0.5, 0.95, 0.99)
+        }
+        return SimulationResult(
+            paths=count,
+            horizon=self.scenarios.horizon,
+            method=self.scenarios.method,
+            expected_return=mean,
+            volatility=np.sqrt(variance),
+            loss_probability=accumulator.losing / count,
+            var=var,
+            cvar=cvar,
+            drawdown_mean=accumulator.drawdown_total / count,
+            drawdown_quantiles=quantiles,
+            labels=labels,
+        )
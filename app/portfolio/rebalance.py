@@ -0,0 +1,111 @@
+from collections import defaultdict
+from dataclasses import dataclass
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.data.marketDataStore import SnapshotHandle, attach
+from app.portfolio.allocation import DiscreteAllocator
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio.solvers import PortfolioSolver
+
+# module level so each pool process keeps its Cholesky cache across batches
+solver = PortfolioSolver()
+
+
+@dataclass
+class Estimate:
+    '''
+    Annualized mean and covariance of one universe over one date range, plus the latest prices
+    for discrete allocation. Estimated once per (universe, range) and shared by every job on it
+    '''
+    tickers: list
+    mu: np.ndarray
+    cov: np.ndarray
+    latest_prices: np.ndarray
+
+    def frames(self) -> tuple:
+        return (
+            pd.Series(self.mu, index=self.tickers),
+            pd.DataFrame(self.cov, index=self.tickers, columns=self.tickers),
+            pd.Series(self.latest_prices, index=self.tickers),
+        )
+
+
+def estimate(prices: pd.DataFrame) -> Estimate:
+    prices = prices.dropna(axis=1, how="all")
+    if prices.shape[1] == 0 or len(prices) < 2:
+        raise ValueError("Not enough price history to estimate returns")
+    engine = RiskEngine.from_prices(prices)
+    return Estimate(list(prices.columns), engine.mu, engine.cov, prices.ffill().iloc[-1].to_numpy(dtype=np.float64))
+
+
+def estimate_snapshot(handle: SnapshotHandle) -> SnapshotHandle:
+    '''
+    Estimates a published snapshot in place, its mean and covariance are written into the segment
+    so every worker reads them from there rather than from a pickled copy
+    '''
+    snapshot = attach(handle)
+    if len(snapshot.returns) < 1:
+        raise ValueError("Not enough price history to estimate returns")
+    engine = RiskEngine.from_returns(snapshot.returns_frame())
+    snapshot.mu[:] = engine.mu
+    snapshot.cov[:] = engine.cov
+    return handle
+
+
+def solve_batch(estimate, requests: list) -> list:
+    '''
+    Results for many rebalance requests (RebalanceRequest dicts) on one estimate, in request order
+    estimate is an Estimate or the SnapshotHandle of an estimated snapshot
+    Requests that differ only in account size or allocation mode share one solve, and every
+    account size of a mode is allocated in one DiscreteAllocator call
+    '''
+    if isinstance(estimate, SnapshotHandle):
+        snapshot = attach(estimate)
+        estimate = Estimate(snapshot.tickers, snapshot.mu, snapshot.cov, snapshot.latest)
+    mu, cov, latest_prices = estimate.frames()
+    groups = defaultdict(list)
+    for i, request in enumerate(requests):
+        groups[(request["objective"], request["target_return"], request["risk_free_rate"], tuple(request["weight_bounds"]))].append(i)
+
+    results = [None] * len(requests)
+    for (objective, target_return, risk_free_rate, bounds), members in groups.items():
+        try:
+            solved = solver.solve(objective, mu, cov, target_return=target_return, bounds=bounds, risk_free_rate=risk_free_rate)
+            weights = solved.clean_weights()
+            expected_return, volatility, sharpe = solved.performance(mu, cov, risk_free_rate)
+        except Exception as e:
+            for i in members:
+                results[i] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+
+        modes = defaultdict(list)
+        for i in members:
+            modes[requests[i]["allocation_mode"]].append(i)
+        for mode, accounts in modes.items():
+            try:
+                allocated = DiscreteAllocator(weights, latest_prices).allocate(
+                    [requests[i]["total_portfolio_value"] for i in accounts], mode=mode
+                )
+            except Exception as e:
+                for i in accounts:
+                    results[i] = {"error": f"{type(e).__name__}: {e}"}
+                continue
+            for account, i in enumerate(accounts):
+                results[i] = {
+                    "weights": dict(weights),
+                    "allocation": allocated.allocation(account),
+                    "leftover": float(allocated.leftover[account]),
+                    "expected_return": expected_return,
+                    "volatility": volatility,
+                    "sharpe": sharpe,
+                    "backend": solved.backend,
+                }
+    return results
+
+
+def warm_up() -> int:
+    # the imports above are paid when a pool process starts, not by the first job that lands on it
+    return os.getpid()
@@ -0,0 +1,123 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio import riskModels
+from app.portfolio.riskModels import FactorModel, TRADING_DAYS
+
+
+@dataclass
+class PortfolioMetrics:
+    '''
+    Annualized metrics for k portfolios, every field is a length k array
+    '''
+    expected_return: np.ndarray
+    variance: np.ndarray
+    volatility: np.ndarray
+    sharpe: np.ndarray
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            {
+                "expected_return": self.expected_return,
+                "variance": self.variance,
+                "volatility": self.volatility,
+                "sharpe": self.sharpe,
+            }
+        )
+
+
+class RiskEngine:
+    '''
+    Scores a (k x n) weight matrix against one annualized mean vector and covariance
+    Why: scoring candidate weights one np.dot at a time re-did the same work per portfolio
+    cov may be a FactorModel, variances are then O(n f) per portfolio and no n x n matrix is formed
+    '''
+
+    def __init__(self, mu, cov, risk_free_rate: float = 0.02, tickers: list = None):
+        if tickers is None and isinstance(mu, pd.Series):
+            tickers = list(mu.index)
+        if tickers is not None and isinstance(cov, pd.DataFrame):
+            cov = cov.loc[tickers, tickers]
+        if tickers is not None and isinstance(cov, FactorModel) and cov.tickers is not None:
+            cov = cov.reindex(tickers)
+        if tickers is not None and isinstance(mu, pd.Series):
+            mu = mu.loc[tickers]
+
+        self.tickers = tickers
+        self.mu = np.ascontiguousarray(mu, dtype=np.float64)
+        self.cov = cov if isinstance(cov, FactorModel) else np.ascontiguousarray(cov, dtype=np.float64)
+        self.risk_free_rate = risk_free_rate
+
+        if self.cov.shape != (len(self.mu), len(self.mu)):
+            raise ValueError(f"Covariance shape {self.cov.shape} does not match {len(self.mu)} assets")
+
+    @classmethod
+    def from_returns(
+        cls, returns: pd.DataFrame, frequency: int = TRADING_DAYS, risk_free_rate: float = 0.02, risk_model: str = "sample", **kwargs
+    ):
+        # same estimators as returns.mean() * 252 and returns.cov() * 252, computed once
+        # risk_model picks another covariance from riskModels.estimate, e.g. ledoit_wolf or factor
+        return cls(
+            returns.mean() * frequency,
+            riskModels.estimate(returns, risk_model, frequency, **kwargs),
+            risk_free_rate=risk_free_rate,
+            tickers=list(returns.columns),
+        )
+
+    @classmethod
+    def from_prices(
+        cls, prices: pd.DataFrame, frequency: int = TRADING_DAYS, risk_free_rate: float = 0.02, risk_model: str = "sample", **kwargs
+    ):
+        return cls.from_returns(prices.pct_change().dropna(how="all"), frequency, risk_free_rate, risk_model, **kwargs)
+
+    @property
+    def n_assets(self) -> int:
+        return len(self.mu)
+
+    def as_matrix(self, weights) -> np.ndarray:
+        if isinstance(weights, pd.DataFrame) and self.tickers is not None:
+            weights = weights.reindex(columns=self.tickers, fill_value=0.0)
+        elif isinstance(weights, (pd.Series, dict)) and self.tickers is not None:
+            weights = pd.Series(weights).reindex(self.tickers, fill_value=0.0)
+
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim == 1:
+            weights = weights[None, :]
+        if weights.ndim != 2 or weights.shape[1] != self.n_assets:
+            raise ValueError(f"Expected weights of shape (k, {self.n_assets}), got {weights.shape}")
+        return weights
+
+    def variance(self, weights, chunk_size: int = 65536) -> np.ndarray:
+        '''
+        Row wise w' S w computed as rowsum((W S) * W) in chunks to bound the temporary
+        '''
+        weights = self.as_matrix(weights)
+        out = np.empty(len(weights))
+        for start in range(0, len(weights), chunk_size):
+            block = weights[start:start + chunk_size]
+            if isinstance(self.cov, FactorModel):
+                out[start:start + chunk_size] = self.cov.variance(block)
+            else:
+                out[start:start + chunk_size] = np.einsum("ij,ij->i", block @ self.cov, block)
+        return out
+
+    def expected_return(self, weights) -> np.ndarray:
+        return self.as_matrix(weights) @ self.mu
+
+    def evaluate(self, weights, chunk_size: int = 65536) -> PortfolioMetrics:
+        weights = self.as_matrix(weights)
+        variance = np.maximum(self.variance(weights, chunk_size), 0.0)
+        volatility = np.sqrt(variance)
+        expected = weights @ self.mu
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(volatility > 0, (expected - self.risk_free_rate) / volatility, np.nan)
+
+        return PortfolioMetrics(
+            expected_return=expected,
+            variance=variance,
+            volatility=volatility,
+            sharpe=sharpe,
+        )
@@ -0,0 +1,263 @@
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_factor, cho_solve
+
+TRADING_DAYS = 252
+
+
+def prepare(returns: pd.DataFrame) -> tuple:
+    '''
+    Centered (T x n) returns and their tickers
+    Same convention as pypfopt CovarianceShrinkage: a missing return counts as zero before centering
+    '''
+    values = np.nan_to_num(np.asarray(returns, dtype=np.float64))
+    tickers = list(returns.columns) if isinstance(returns, pd.DataFrame) else None
+    return values - values.mean(axis=0), tickers
+
+
+def frame(cov: np.ndarray, tickers: list, **attrs) -> pd.DataFrame:
+    cov = pd.DataFrame(cov, index=tickers, columns=tickers)
+    cov.attrs.update(attrs)
+    return cov
+
+
+def sample_cov(returns: pd.DataFrame, frequency: int = TRADING_DAYS) -> pd.DataFrame:
+    # pairwise complete like RiskEngine.from_returns
+    return returns.cov() * frequency
+
+
+def shrink(cov: np.ndarray, shrinkage: float) -> np.ndarray:
+    # (1 - s) S + s mu I toward the average variance, written in place over S
+    mu = np.trace(cov) / len(cov)
+    cov *= 1 - shrinkage
+    cov.flat[::len(cov) + 1] += shrinkage * mu
+    return cov
+
+
+def shrunk_covariance(returns: pd.DataFrame, shrinkage: float = 0.2, frequency: int = TRADING_DAYS) -> pd.DataFrame:
+    # fixed intensity on the pairwise sample covariance, as pypfopt CovarianceShrinkage.shrunk_covariance
+    cov = shrink(returns.cov().to_numpy(dtype=np.float64, copy=True), shrinkage)
+    return frame(cov * frequency, list(returns.columns), shrinkage=shrinkage)
+
+
+def ledoit_wolf_shrinkage(X: np.ndarray) -> float:
+    '''
+    Ledoit-Wolf intensity toward the scaled identity, as in sklearn.covariance.ledoit_wolf_shrinkage
+    The fourth moment term sum((X^2)'(X^2)) collapses to sum_t (sum_i x_ti^2)^2, so only the
+    ||X'X||_F^2 term is O(T n^2), and it is taken from the smaller of X'X and XX'
+    '''
+    samples, features = X.shape
+    if features == 1:
+        return 0.0
+    squared = X ** 2
+    variances = squared.sum(axis=0) / samples
+    mu = variances.sum() / features
+    gram = X @ X.T if samples < features else X.T @ X
+    delta_ = (gram ** 2).sum() / samples ** 2
+    beta_ = (squared.sum(axis=1) ** 2).sum()
+    beta = (beta_ / samples - delta_) / (features * samples)
+    delta = (delta_ - 2 * mu * variances.sum() + features * mu ** 2) / features
+    beta = min(beta, delta)
+    return 0.0 if beta == 0 else beta / delta
+
+
+def ledoit_wolf(returns: pd.DataFrame, frequency: int = TRADING_DAYS) -> pd.DataFrame:
+    '''
+    Ledoit-Wolf shrunk covariance, the intensity is kept in .attrs["shrinkage"]
+    '''
+    X, tickers = prepare(returns)
+    shrinkage = ledoit_wolf_shrinkage(X)
+    return frame(shrink(X.T @ X / len(X), shrinkage) * frequency, tickers, shrinkage=shrinkage)
+
+
+def oas(returns: pd.DataFrame, frequency: int = TRADING_DAYS) -> pd.DataFrame:
+    '''
+    Oracle approximating shrinkage as in sklearn.covariance.oas, the intensity is kept in .attrs["shrinkage"]
+    '''
+    X, tickers = prepare(returns)
+    samples, features = X.shape
+    cov = X.T @ X / samples
+    if features == 1:
+        return frame(cov * frequency, tickers, shrinkage=0.0)
+
+    mu = np.trace(cov) / features
+    alpha = np.mean(cov ** 2)
+    numerator = alpha + mu ** 2
+    denominator = (samples + 1.0) * (alpha - mu ** 2 / features)
+    shrinkage = 1.0 if denominator == 0 else min(numerator / denominator, 1.0)
+    return frame(shrink(cov, shrinkage) * frequency, tickers, shrinkage=shrinkage)
+
+
+def top_components(X: np.ndarray, k: int, oversample: int = 10, power_iterations: int = 2, seed: int = 0) -> tuple:
+    '''
+    Leading k singular values and right singular vectors (n x k) of X
+    Randomized range finder with power iterations, O(T n k) instead of a full O(T n min(T, n)) SVD
+    '''
+    size = k + oversample
+    if size >= min(X.shape) // 2:
+        _, s, vt = np.linalg.svd(X, full_matrices=False)
+        return s[:k], vt[:k].T
+
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(X @ rng.standard_normal((X.shape[1], size)))
+    for _ in range(power_iterations):
+        # re-orthonormalized every pass so the small singular directions are not lost to rounding
+        Q, _ = np.linalg.qr(X.T @ Q)
+        Q, _ = np.linalg.qr(X @ Q)
+    _, s, vt = np.linalg.svd(Q.T @ X, full_matrices=False)
+    return s[:k], vt[:k].T
+
+
+class FactorModel:
+    '''
+    Covariance B F B' + diag(d) stored as n x k loadings B, a k x k factor covariance F and n
+    specific variances d, O(n k) memory instead of O(n^2)
+    Products, portfolio variances and solves (Woodbury, through a cached k x k capacitance factor)
+    never form the n x n matrix, so they cost O(n k) and O(n k^2) rather than O(n^2) and O(n^3)
+    Supports cov @ x, W @ cov and scalar * cov, so code written against a dense array keeps working
+    '''
+
+    # makes numpy hand W @ model and scalar * model to the reflected methods below
+    __array_ufunc__ = None
+
+    def __init__(self, loadings, factor_cov, specific, tickers: list = None):
+        self.loadings = np.ascontiguousarray(loadings, dtype=np.float64)
+        self.factor_cov = np.ascontiguousarray(factor_cov, dtype=np.float64)
+        self.specific = np.ascontiguousarray(specific, dtype=np.float64)
+        self.tickers = list(tickers) if tickers is not None else None
+        self.capacitance = None
+
+        n, k = self.loadings.shape
+        if self.factor_cov.shape != (k, k) or self.specific.shape != (n,):
+            raise ValueError(f"Factor model shapes do not match: loadings {self.loadings.shape}, "
+                             f"factor_cov {self.factor_cov.shape}, specific {self.specific.shape}")
+        if np.any(self.specific <= 0):
+            raise ValueError("Specific variances must be positive")
+
+    @classmethod
+    def from_returns(
+        cls,
+        returns: pd.DataFrame,
+        factors: int = 20,
+        frequency: int = TRADING_DAYS,
+        min_specific: float = 1e-3,
+        seed: int = 0,
+    ):
+        '''
+        Statistical factor model from the leading principal components of the returns
+        The components explain B B' with F = I, d is the variance they leave unexplained, floored at
+        min_specific of each asset's variance so the model stays positive definite
+        '''
+        X, tickers = prepare(returns)
+        samples = len(X)
+        if samples < 2:
+            raise ValueError("Not enough returns to fit a factor model")
+        k = max(1, min(factors, samples - 1, X.shape[1] - 1))
+
+        s, vectors = top_components(X, k, seed=seed)
+        loadings = vectors * (s / np.sqrt(samples - 1))
+        variance = (X ** 2).sum(axis=0) / (samples - 1)
+        specific = np.maximum(variance - (loadings ** 2).sum(axis=1), min_specific * np.maximum(variance, 1e-12))
+        return cls(loadings * np.sqrt(frequency), np.eye(k), specific * frequency, tickers)
+
+    # ------------------------------------------------------------------
+    # shape
+    # ------------------------------------------------------------------
+    @property
+    def n_assets(self) -> int:
+        return len(self.specific)
+
+    @property
+    def n_factors(self) -> int:
+        return self.loadings.shape[1]
+
+    def __len__(self) -> int:
+        return self.n_assets
+
+    @property
+    def shape(self) -> tuple:
+        return (self.n_assets, self.n_assets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.loadings.nbytes + self.factor_cov.nbytes + self.specific.nbytes
+
+    def subset(self, index) -> "FactorModel":
+        tickers = list(np.asarray(self.tickers, dtype=object)[index]) if self.tickers is not None else None
+        return FactorModel(self.loadings[index], self.factor_cov, self.specific[index], tickers)
+
+    def reindex(self, tickers: list) -> "FactorModel":
+        if self.tickers == list(tickers):
+            return self
+        position = {ticker: i for i, ticker in enumerate(self.tickers)}
+        return self.subset(np.array([position[ticker] for ticker in tickers], dtype=np.intp))
+
+    # ------------------------------------------------------------------
+    # algebra
+    # ------------------------------------------------------------------
+    def __matmul__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        specific = self.specific if x.ndim == 1 else self.specific[:, None]
+        return self.loadings @ (self.factor_cov @ (self.loadings.T @ x)) + specific * x
+
+    def __rmatmul__(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        return ((x @ self.loadings) @ self.factor_cov) @ self.loadings.T + x * self.specific
+
+    def __mul__(self, scale):
+        if not np.isscalar(scale):
+            return NotImplemented
+        return FactorModel(self.loadings, self.factor_cov * scale, self.specific * scale, self.tickers)
+
+    __rmul__ = __mul__
+
+    def variance(self, weights) -> np.ndarray:
+        '''
+        Row wise w' S w of a (k x n) weight matrix in O(k n f)
+        '''
+        weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+        exposures = weights @ self.loadings
+        return np.einsum("ij,ij->i", exposures @ self.factor_cov, exposures) + (weights ** 2) @ self.specific
+
+    def solve(self, rhs) -> np.ndarray:
+        '''
+        S^-1 rhs by the Woodbury identity
+            S^-1 = D^-1 - D^-1 B (F^-1 + B' D^-1 B)^-1 B' D^-1
+        '''
+        rhs = np.asarray(rhs, dtype=np.float64)
+        inverse = 1 / self.specific if rhs.ndim == 1 else (1 / self.specific)[:, None]
+        if self.capacitance is None:
+            scaled = self.loadings / self.specific[:, None]
+            capacitance = np.linalg.inv(self.factor_cov) + self.loadings.T @ scaled
+            self.capacitance = cho_factor(capacitance, lower=True, check_finite=False)
+        y = inverse * rhs
+        return y - inverse * (self.loadings @ cho_solve(self.capacitance, self.loadings.T @ y, check_finite=False))
+
+    def diagonal(self) -> np.ndarray:
+        return np.einsum("ij,ij->i", self.loadings @ self.factor_cov, self.loadings) + self.specific
+
+    def dense(self) -> np.ndarray:
+        cov = self.loadings @ self.factor_cov @ self.loadings.T
+        cov.flat[::self.n_assets + 1] += self.specific
+        return cov
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.dense(), index=self.tickers, columns=self.tickers)
+
+
+def estimate(returns: pd.DataFrame, method: str = "sample", frequency: int = TRADING_DAYS, **kwargs):
+    '''
+    Annualized covariance by name: sample, ledoit_wolf, oas, shrunk (shrinkage=) or factor (factors=)
+    factor returns a FactorModel, the rest a DataFrame
+    '''
+    if method == "sample":
+        return sample_cov(returns, frequency)
+    if method == "ledoit_wolf":
+        return ledoit_wolf(returns, frequency)
+    if method == "oas":
+        return oas(returns, frequency)
+    if method == "shrunk":
+        return shrunk_covariance(returns, frequency=frequency, **kwargs)
+    if method == "factor":
+        return FactorModel.from_returns(returns, frequency=frequency, **kwargs)
+    raise ValueError(f"Unknown risk model: {method}")
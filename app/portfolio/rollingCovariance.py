@@ -0,0 +1,290 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio.riskEngine import TRADING_DAYS
+
+
+class RollingCovariance:
+    '''
+    Running mean and covariance of daily returns updated one observation at a time
+    Modes:
+        expanding   window=None, halflife=None   Welford update, matches returns.cov()
+        rolling     window=N                     Welford update plus downdate of the oldest row
+        exponential halflife=H                   exponentially weighted mean and covariance
+    Every update is an O(n^2) rank one change, so a new trading day never needs the full history
+    Missing values are handled pairwise like returns.cov(): every pair of assets keeps its own
+    observation count and means over the days both have a return, so a ticker listed later than
+    the others neither drops their earlier history nor gets it mixed into its own estimates
+    '''
+
+    def __init__(
+        self,
+        n_assets: int,
+        window: int = None,
+        halflife: float = None,
+        frequency: int = TRADING_DAYS,
+        tickers: list = None,
+        resync_every: int = None,
+    ):
+        if window is not None and halflife is not None:
+            raise ValueError("Use either a rolling window or an exponential halflife, not both")
+        if window is not None and window < 2:
+            raise ValueError("Rolling window needs at least 2 observations")
+
+        self.n_assets = n_assets
+        self.window = window
+        self.halflife = halflife
+        self.alpha = None if halflife is None else 1 - np.exp(np.log(0.5) / halflife)
+        self.frequency = frequency
+        self.tickers = list(tickers) if tickers is not None else None
+        # rolling downdates accumulate rounding error, rebuild from the buffer this often
+        self.resync_every = resync_every or (window or 0)
+
+        self.reset()
+
+    def reset(self):
+        # count is rows applied, counts[i, j] the rows where both i and j had a return, means[i, j]
+        # the mean of i over those rows and m2[i, j] their co-moment
+        self.count = 0
+        self.counts = np.zeros((self.n_assets, self.n_assets))
+        self.means = np.zeros((self.n_assets, self.n_assets))
+        self.m2 = np.zeros((self.n_assets, self.n_assets))
+        self.buffer = np.empty((self.window, self.n_assets)) if self.window else None
+        self.head = 0
+        self.since_resync = 0
+        self.last_price = None
+        self.last_date = None
+
+    @classmethod
+    def from_returns(cls, returns: pd.DataFrame, **kwargs):
+        estimator = cls(returns.shape[1], tickers=list(returns.columns), **kwargs)
+        estimator.update_many(returns.to_numpy(dtype=np.float64))
+        if len(returns):
+            estimator.last_date = pd.Timestamp(returns.index[-1])
+        return estimator
+
+    @classmethod
+    def from_prices(cls, prices: pd.DataFrame, **kwargs):
+        estimator = cls(prices.shape[1], tickers=list(prices.columns), **kwargs)
+        estimator.refresh(prices)
+        return estimator
+
+    # ------------------------------------------------------------------
+    # updates
+    # ------------------------------------------------------------------
+    def update(self, x) -> bool:
+        '''
+        Applies one return observation, returns False if the row was skipped for having no returns
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        if not np.isfinite(x).any():
+            return False
+
+        if self.alpha is not None:
+            self.update_exponential(x)
+            return True
+
+        if self.window and self.count == self.window:
+            oldest = self.buffer[self.head].copy()
+            self.remove(oldest)
+
+        self.add(x)
+
+        if self.window:
+            self.buffer[self.head] = x
+            self.head = (self.head + 1) % self.window
+            self.since_resync += 1
+            if self.resync_every and self.since_resync >= self.resync_every and self.count == self.window:
+                self.resync()
+        return True
+
+    def update_many(self, rows) -> int:
+        return sum(self.update(row) for row in np.atleast_2d(rows))
+
+    @staticmethod
+    def pairs(x) -> tuple:
+        # the pairs observed in this row, and the row with missing values zeroed
+        valid = np.isfinite(x)
+        return np.outer(valid, valid), np.where(valid, x, 0.0)
+
+    def add(self, x):
+        # Welford per pair: m2[i, j] += (x_i - old mean of i) * (x_j - new mean of j), over observed pairs
+        pairs, x = self.pairs(x)
+        self.count += 1
+        self.counts += pairs
+        delta = np.where(pairs, x[:, None] - self.means, 0.0)
+        self.means += np.divide(delta, self.counts, out=np.zeros_like(delta), where=pairs)
+        self.m2 += delta * np.where(pairs, x[None, :] - self.means.T, 0.0)
+
+    def remove(self, x):
+        pairs, x = self.pairs(x)
+        self.count -= 1
+        self.counts -= pairs
+        delta = np.where(pairs, x[:, None] - self.means, 0.0)
+        self.means -= np.divide(delta, self.counts, out=np.zeros_like(delta), where=pairs & (self.counts > 0))
+        self.m2 -= delta * np.where(pairs, x[None, :] - self.means.T, 0.0)
+        # a pair whose last shared row left the window starts again from nothing
+        empty = pairs & (self.counts == 0)
+        self.means[empty] = 0.0
+        self.m2[empty] = 0.0
+
+    def update_exponential(self, x):
+        pairs, x = self.pairs(x)
+        first = pairs & (self.counts == 0)
+        delta = np.where(pairs, x[:, None] - self.means, 0.0)
+        decayed = (1 - self.alpha) * (self.m2 + self.alpha * delta * delta.T)
+        self.means = np.where(first, x[:, None], self.means + self.alpha * delta)
+        self.m2 = np.where(first, 0.0, np.where(pairs, decayed, self.m2))
+        self.counts += pairs
+        self.count += 1
+
+    def resync(self):
+        # exact recompute from the window buffer, rows are in ring order but the moments are order free
+        rows = self.buffer[: self.count]
+        valid = np.isfinite(rows)
+        observed = valid.astype(np.float64)
+        # shifting by each column's mean first keeps the raw moment sums free of cancellation
+        shift = np.nanmean(np.where(valid.any(axis=0), rows, 0.0), axis=0)
+        centered = np.where(valid, rows - shift, 0.0)
+        self.counts = observed.T @ observed
+        sums = centered.T @ observed
+        shifted = np.divide(sums, self.counts, out=np.zeros_like(sums), where=self.counts > 0)
+        self.m2 = centered.T @ centered - self.counts * shifted * shifted.T
+        self.means = np.where(self.counts > 0, shifted + shift[:, None], 0.0)
+        self.since_resync = 0
+
+    def push_prices(self, prices, date=None) -> bool:
+        '''
+        Feeds one row of closing prices, the return against the previous row is applied
+        '''
+        prices = np.asarray(prices, dtype=np.float64)
+        applied = False
+        if self.last_price is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                applied = self.update(prices / self.last_price - 1)
+        self.last_price = prices
+        if date is not None:
+            self.last_date = pd.Timestamp(date)
+        return applied
+
+    def refresh(self, prices: pd.DataFrame, rtol: float = 1e-5) -> int:
+        '''
+        Pushes only the price rows newer than the last date seen, returns how many were applied
+        If the row at the last date seen no longer matches, the history was re-adjusted upstream
+        (a split or dividend) and the estimate is rebuilt from prices on the new basis
+        '''
+        if self.tickers is not None:
+            prices = prices[self.tickers]
+        if self.last_date is not None and self.last_price is not None and self.last_date in prices.index:
+            seen = prices.loc[self.last_date].to_numpy(dtype=np.float64)
+            if not np.allclose(seen, self.last_price, rtol=rtol, atol=0, equal_nan=True):
+                self.reset()
+        if self.last_date is not None:
+            prices = prices.loc[prices.index > self.last_date]
+
+        applied = 0
+        for date, row in zip(prices.index, prices.to_numpy(dtype=np.float64)):
+            applied += self.push_prices(row, date)
+        return applied
+
+    # ------------------------------------------------------------------
+    # estimates
+    # ------------------------------------------------------------------
+    def mean(self, annualize: bool = True):
+        # each asset's own mean is over every row it has a return in
+        mean = np.diagonal(self.means) * (self.frequency if annualize else 1)
+        return pd.Series(mean, index=self.tickers) if self.tickers else mean
+
+    def covariance(self, annualize: bool = True):
+        if self.alpha is not None:
+            cov = np.where(self.counts > 0, self.m2, np.nan)
+        else:
+            # pairs seen on fewer than two rows have no estimate, like returns.cov()
+            cov = np.divide(self.m2, self.counts - 1, out=np.full_like(self.m2, np.nan), where=self.counts >= 2)
+        # the rank one updates are not exactly symmetric in floating point
+        cov = (cov + cov.T) / 2 * (self.frequency if annualize else 1)
+        return pd.DataFrame(cov, index=self.tickers, columns=self.tickers) if self.tickers else cov
+
+    # ------------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------------
+    def state_dict(self) -> dict:
+        return {
+            "n_assets": self.n_assets,
+            "window": -1 if self.window is None else self.window,
+            "halflife": np.nan if self.halflife is None else self.halflife,
+            "frequency": self.frequency,
+            "tickers": np.array(self.tickers if self.tickers else [], dtype=str),
+            "resync_every": self.resync_every,
+            "count": self.count,
+            "counts": self.counts,
+            "mean": self.means,
+            "m2": self.m2,
+            "buffer": self.buffer if self.buffer is not None else np.empty((0, self.n_assets)),
+            "head": self.head,
+            "since_resync": self.since_resync,
+            "last_price": self.last_price if self.last_price is not None else np.empty(0),
+            "last_date": np.datetime64(self.last_date, "ns") if self.last_date is not None else np.datetime64("NaT", "ns"),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict):
+        window = int(state["window"])
+        halflife = float(state["halflife"])
+        tickers = [str(t) for t in state["tickers"]]
+
+        estimator = cls(
+            int(state["n_assets"]),
+            window=None if window < 0 else window,
+            halflife=None if np.isnan(halflife) else halflife,
+            frequency=int(state["frequency"]),
+            tickers=tickers or None,
+            resync_every=int(state["resync_every"]),
+        )
+        estimator.count = int(state["count"])
+        mean = np.array(state["mean"], dtype=np.float64)
+        if mean.ndim == 1:
+            # states saved before pairwise counts only ever held complete rows
+            estimator.counts = np.full((len(mean), len(mean)), float(estimator.count))
+            estimator.means = np.repeat(mean[:, None], len(mean), axis=1)
+        else:
+            estimator.counts = np.array(state["counts"], dtype=np.float64)
+            estimator.means = mean
+        estimator.m2 = np.array(state["m2"], dtype=np.float64)
+        if estimator.window:
+            estimator.buffer = np.array(state["buffer"], dtype=np.float64)
+        estimator.head = int(state["head"])
+        estimator.since_resync = int(state["since_resync"])
+        estimator.last_price = np.array(state["last_price"], dtype=np.float64) if len(state["last_price"]) else None
+        last_date = np.datetime64(state["last_date"][()], "ns")
+        estimator.last_date = None if np.isnat(last_date) else pd.Timestamp(last_date)
+        return estimator
+
+    def save(self, path: str):
+        path = path if path.endswith(".npz") else path + ".npz"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, **self.state_dict())
+
+    @classmethod
+    def load(cls, path: str):
+        path = path if path.endswith(".npz") else path + ".npz"
+        with np.load(path, allow_pickle=False) as state:
+            return cls.from_state({key: state[key] for key in state.files})
+
+    @classmethod
+    def load_or_create(cls, path: str, tickers: list, **kwargs):
+        '''
+        Loads a saved estimator if it tracks the same tickers and settings, otherwise starts cold
+        '''
+        path = path if path.endswith(".npz") else path + ".npz"
+        if os.path.exists(path):
+            estimator = cls.load(path)
+            expected = {"window": None, "halflife": None, "frequency": TRADING_DAYS, **kwargs}
+            same_settings = all(getattr(estimator, key) == value for key, value in expected.items())
+            if estimator.tickers == list(tickers) and same_settings:
+                return estimator
+        return cls(len(tickers), tickers=tickers, **kwargs)
@@ -0,0 +1,518 @@
+from dataclasses import dataclass, field
+from itertools import combinations, islice
+import logging
+import math
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import Bounds, LinearConstraint, milp, minimize
+
+from app.portfolio.riskModels import FactorModel
+from app.portfolio.solvers import PortfolioSolver, SolverResult
+
+
+@dataclass
+class Qubo:
+    '''
+    Minimize x'Qx + offset over binary x, with Q symmetric and linear terms on the diagonal (x_i^2 = x_i)
+    Q is the objective plus penalty (1'x - k)^2, which is zero on every feasible selection, so the
+    objective matrix is kept too for solvers that enforce the cardinality directly
+    '''
+    objective: np.ndarray
+    cardinality: int
+    penalty: float
+    tickers: list = None
+    matrix: np.ndarray = field(init=False, repr=False)
+    offset: float = field(init=False)
+
+    def __post_init__(self):
+        n = len(self.objective)
+        self.objective = (self.objective + self.objective.T) / 2
+        self.matrix = self.objective + self.penalty
+        self.matrix.flat[::n + 1] -= 2 * self.penalty * self.cardinality
+        self.offset = self.penalty * self.cardinality ** 2
+
+    @property
+    def n(self) -> int:
+        return len(self.objective)
+
+    def energy(self, states) -> np.ndarray:
+        states = np.atleast_2d(np.asarray(states, dtype=np.float64))
+        return np.einsum("ij,ij->i", states @ self.matrix, states) + self.offset
+
+    def feasible(self, states) -> np.ndarray:
+        return np.atleast_2d(states).sum(axis=1) == self.cardinality
+
+    def max_flip(self) -> float:
+        # largest change of x'Qx from flipping one bit, anywhere
+        return float(np.max(np.abs(np.diag(self.matrix)) + 2 * (np.abs(self.matrix).sum(axis=1) - np.abs(np.diag(self.matrix)))))
+
+
+def mean_variance_qubo(mu, cov, k: int, risk_aversion: float = 1.0, penalty: float = None, tickers: list = None) -> Qubo:
+    '''
+    Equal weight selection of k assets as a QUBO, w = x / k in the quadratic utility
+        minimize risk_aversion / 2 w'Sw - mu'w      subject to 1'x = k
+    The default penalty is the largest change one flip can make to the objective: any selection of
+    the wrong size then has a flip toward size k that lowers the energy, so no minimum is infeasible
+    '''
+    mu = np.asarray(mu, dtype=np.float64)
+    cov = np.asarray(cov, dtype=np.float64)
+    n = len(mu)
+    if not 0 < k <= n:
+        raise ValueError(f"Cardinality must be between 1 and {n}, got {k}")
+
+    objective = risk_aversion / 2 * cov / k ** 2
+    objective.flat[::n + 1] -= mu / k
+    if penalty is None:
+        diagonal = np.abs(np.diag(objective))
+        penalty = float(np.max(diagonal + 2 * (np.abs(objective).sum(axis=1) - diagonal))) * 1.01 + 1e-12
+    return Qubo(objective, k, penalty, tickers)
+
+
+@dataclass
+class SelectionResult:
+    '''
+    Chosen subset and its energy, objective is the equal weight utility without the penalty term
+    '''
+    selected: np.ndarray
+    tickers: list
+    energy: float
+    objective: float
+    feasible: bool
+    backend: str
+    seconds: float
+    info: dict = field(default_factory=dict)
+
+
+class AnnealingSolver:
+    '''
+    Vectorized Metropolis search over a Qubo, every chain advances one bit at a time together
+        tempering   replicas on a fixed geometric temperature ladder, neighbours swap states after each sweep
+        annealing   independent chains cooled from hot to cold over the sweeps
+    Flip costs come from the local fields g = Qx, dE_i = (1 - 2 x_i)(2 g_i) + Q_ii, and an accepted
+    flip of bit i is a rank one update of g with row i of Q, so a sweep is O(chains n^2)
+    Each sweep is n single flips then n random swaps of a held and an unheld asset
+    The hottest temperature accepts the largest possible flip half the time, the coldest accepts
+    the smallest typical uphill swap 1% of the time
+    '''
+
+    def __init__(self, sweeps: int = 200, replicas: int = 16, restarts: int = 4, method: str = "tempering", seed: int = 0):
+        if method not in ("tempering", "annealing"):
+            raise ValueError(f"Unknown annealing method: {method}")
+        self.sweeps = sweeps
+        self.replicas = replicas
+        self.restarts = restarts
+        self.method = method
+        self.seed = seed
+
+    def betas(self, qubo: Qubo, rng) -> tuple:
+        # cold is set on swaps between random feasible selections, single flips there all pay the penalty
+        Q = qubo.objective
+        states = np.zeros((self.restarts * self.replicas, qubo.n))
+        np.put_along_axis(states, rng.random(states.shape).argsort(axis=1)[:, :qubo.cardinality], 1.0, axis=1)
+        fields = states @ Q
+        diagonal = np.diag(Q)
+        deltas = 2 * (fields[:, None, :] - fields[:, :, None]) + diagonal[:, None] + diagonal[None, :] - 2 * Q
+        deltas = np.abs(deltas[(states[:, :, None] > 0) & (states[:, None, :] == 0)])
+        scale = qubo.max_flip()
+        deltas = deltas[deltas > 1e-12 * scale]
+        smallest = np.quantile(deltas, 0.05) if len(deltas) else scale
+        return math.log(2) / scale, math.log(100) / smallest
+
+    def solve(self, qubo: Qubo, start: np.ndarray = None) -> tuple:
+        '''
+        Returns (best state, its energy, sweeps run)
+        '''
+        rng = np.random.default_rng(self.seed)
+        Q = qubo.matrix
+        n = qubo.n
+        diagonal = np.diag(Q).copy()
+        chains = self.replicas * self.restarts
+
+        states = (rng.random((chains, n)) < qubo.cardinality / n).astype(np.float64)
+        if start is not None:
+            states[:] = start
+        hot, cold = self.betas(qubo, rng)
+        if self.method == "tempering":
+            # slot j of every restart sits at ladder[j], states move between slots instead of temperatures
+            ladder = np.geomspace(hot, cold, self.replicas)
+            beta = np.tile(ladder, self.restarts)
+            schedule = None
+        else:
+            schedule = np.geomspace(hot, cold, self.sweeps)
+
+        fields = states @ Q
+        energy = np.einsum("ij,ij->i", fields, states) + qubo.offset
+        best_energy = energy.min()
+        best = states[energy.argmin()].copy()
+        rows = np.arange(chains)
+
+        for sweep in range(self.sweeps):
+            if schedule is not None:
+                beta = schedule[sweep]
+            thresholds = np.log(rng.random((n, chains)))
+            for i in range(n):
+                direction = 1 - 2 * states[:, i]
+                delta = direction * 2 * fields[:, i] + diagonal[i]
+                accept = -beta * delta > thresholds[i]
+                if not accept.any():
+                    continue
+                step = np.where(accept, direction, 0.0)
+                states[:, i] += step
+                fields += np.outer(step, Q[i])
+                energy += np.where(accept, delta, 0.0)
+
+            # swaps trade a held asset for another without crossing the (1'x - k)^2 barrier that
+            # single flips have to climb, dE = dE_i + dE_j - 2 Q_ij for dropping i and adding j
+            keys = rng.random((n, chains, n))
+            thresholds = np.log(rng.random((n, chains)))
+            for step in range(n):
+                held = states > 0
+                drop = np.where(held, keys[step], -1.0).argmax(axis=1)
+                add = np.where(held, -1.0, keys[step]).argmax(axis=1)
+                delta = 2 * (fields[rows, add] - fields[rows, drop]) + diagonal[drop] + diagonal[add] - 2 * Q[drop, add]
+                accept = (-beta * delta > thresholds[step]) & held[rows, drop] & ~held[rows, add]
+                if not accept.any():
+                    continue
+                moved = rows[accept]
+                states[moved, drop[accept]] = 0.0
+                states[moved, add[accept]] = 1.0
+                fields[moved] += Q[add[accept]] - Q[drop[accept]]
+                energy[accept] += delta[accept]
+
+            lowest = energy.argmin()
+            if energy[lowest] < best_energy:
+                best_energy = energy[lowest]
+                best = states[lowest].copy()
+
+            if schedule is None and self.replicas > 1:
+                # alternate even and odd neighbour pairs, accept with min(1, exp((b_j - b_j+1)(E_j - E_j+1)))
+                slots = np.arange(sweep % 2, self.replicas - 1, 2)
+                if len(slots):
+                    left = (np.arange(self.restarts)[:, None] * self.replicas + slots).ravel()
+                    right = left + 1
+                    exchange = (beta[left] - beta[right]) * (energy[left] - energy[right])
+                    swap = exchange >= np.log(rng.random(len(left)))
+                    left, right = left[swap], right[swap]
+                    states[left], states[right] = states[right], states[left].copy()
+                    fields[left], fields[right] = fields[right], fields[left].copy()
+                    energy[left], energy[right] = energy[right], energy[left].copy()
+
+        return best.astype(np.int8), float(qubo.energy(best)[0]), self.sweeps
+
+
+class QaoaSolver:
+    '''
+    Statevector simulation of QAOA on a Qubo, for experiments
+    Each of the p layers applies exp(-i gamma C), C the diagonal of energies, then a mixer
+        xy  the quantum alternating operator ansatz used for portfolio selection: starts from the
+            Dicke state over all k subsets and mixes with XY partial swaps around a ring of qubits,
+            which preserve the number of ones, so only the C(n, k) feasible amplitudes are simulated
+            and C is the objective alone
+        x   textbook QAOA from |+>^n with the transverse field mixer, all 2^n amplitudes, the
+            cardinality only enters through the QUBO penalty
+    The angles are tuned classically (COBYLA) to minimize <C>, growing the circuit one layer at a
+    time, then shots are sampled from the final state and the best sample is returned
+    '''
+
+    def __init__(
+        self,
+        layers: int = 3,
+        mixer: str = "xy",
+        restarts: int = 4,
+        shots: int = 1024,
+        max_states: int = 2**20,
+        maxiter: int = 300,
+        seed: int = 0,
+    ):
+        if mixer not in ("xy", "x"):
+            raise ValueError(f"Unknown QAOA mixer: {mixer}")
+        self.layers = layers
+        self.mixer = mixer
+        self.restarts = restarts
+        self.shots = shots
+        self.max_states = max_states
+        self.maxiter = maxiter
+        self.seed = seed
+
+    @staticmethod
+    def bitstrings(n: int) -> np.ndarray:
+        # row s holds the bits of s with qubit 0 as the most significant, matching reshape((2,) * n)
+        return ((np.arange(2 ** n)[:, None] >> np.arange(n - 1, -1, -1)) & 1).astype(np.int8)
+
+    @staticmethod
+    def subsets(n: int, k: int) -> np.ndarray:
+        indices = np.array(list(combinations(range(n), k)), dtype=np.intp).reshape(-1, k)
+        states = np.zeros((len(indices), n), dtype=np.int8)
+        np.put_along_axis(states, indices, 1, axis=1)
+        return states
+
+    @staticmethod
+    def ring_partners(states: np.ndarray) -> list:
+        '''
+        For each ring edge (a, a + 1 mod n), the rows where the two bits differ and the row with them exchanged
+        '''
+        n = states.shape[1]
+        codes = states.astype(np.int64) @ (1 << np.arange(n, dtype=np.int64))
+        order = np.argsort(codes)
+        edges = []
+        for a in range(n if n > 2 else 1):
+            b = (a + 1) % n
+            rows = np.flatnonzero(states[:, a] != states[:, b])
+            swapped = codes[rows] ^ ((1 << a) | (1 << b))
+            edges.append((rows, order[np.searchsorted(codes, swapped, sorter=order)]))
+        return edges
+
+    def evolve(self, costs: np.ndarray, gammas, betas, edges: list = None) -> np.ndarray:
+        state = np.full(len(costs), len(costs) ** -0.5, dtype=np.complex128)
+        n = int(np.log2(len(costs))) if edges is None else None
+        for gamma, beta in zip(gammas, betas):
+            state *= np.exp(-1j * gamma * costs)
+            c, s = np.cos(beta), -1j * np.sin(beta)
+            if edges is None:
+                for qubit in range(n):
+                    view = state.reshape(2 ** qubit, 2, -1)
+                    zero, one = view[:, 0].copy(), view[:, 1]
+                    view[:, 0] = c * zero + s * one
+                    view[:, 1] = s * zero + c * one
+            else:
+                # exp(-i beta (XX + YY) / 2) rotates each |01>, |10> pair and leaves |00>, |11> alone
+                for rows, partners in edges:
+                    state[rows] = c * state[rows] + s * state[partners]
+        return state
+
+    def solve(self, qubo: Qubo) -> tuple:
+        '''
+        Returns (best sampled state, its energy, info) where info has the tuned angles, the expected
+        energy and the probability the final state puts on the optimum
+        '''
+        size = math.comb(qubo.n, qubo.cardinality) if self.mixer == "xy" else 2 ** qubo.n
+        if size > self.max_states:
+            raise ValueError(f"QAOA simulation needs {size:,} amplitudes, more than max_states {self.max_states:,}")
+        rng = np.random.default_rng(self.seed)
+        if self.mixer == "xy":
+            states = self.subsets(qubo.n, qubo.cardinality)
+            edges = self.ring_partners(states)
+        else:
+            states, edges = self.bitstrings(qubo.n), None
+        energies = qubo.energy(states)
+        # standardized so angles of order one are meaningful whatever the scale of the objective
+        costs = (energies - energies.mean()) / (energies.std() or 1.0)
+        p = self.layers
+        # one layer from a few random starts, then each deeper circuit starts from the previous angles
+        # linearly interpolated onto one more layer, which random starts at full depth rarely beat
+        evaluations = 0
+        best_run = None
+        for depth in range(1, p + 1):
+            def expectation(angles, depth=depth):
+                return float(np.abs(self.evolve(costs, angles[:depth], angles[depth:], edges)) ** 2 @ costs)
+
+            if best_run is None:
+                starts = [np.array([0.5, 0.5])] + [rng.uniform(-np.pi / 2, np.pi / 2, 2) for _ in range(self.restarts - 1)]
+            else:
+                grid = np.linspace(0, 1, depth)
+                previous = np.linspace(0, 1, depth - 1)
+                gammas, betas = best_run.x[:depth - 1], best_run.x[depth - 1:]
+                starts = [np.concatenate([np.interp(grid, previous, gammas), np.interp(grid, previous, betas)])]
+            runs = [minimize(expectation, start, method="COBYLA", options={"maxiter": self.maxiter}) for start in starts]
+            evaluations += sum(run.nfev for run in runs)
+            best_run = min(runs, key=lambda run: run.fun)
+
+        probabilities = np.abs(self.evolve(costs, best_run.x[:p], best_run.x[p:], edges)) ** 2
+        probabilities /= probabilities.sum()
+        samples = rng.choice(len(probabilities), size=self.shots, p=probabilities)
+        chosen = samples[np.argmin(energies[samples])]
+        ground = np.isclose(energies, energies.min(), rtol=0, atol=1e-12 * max(1.0, abs(energies.min())))
+        info = {
+            "mixer": self.mixer,
+            "gammas": best_run.x[:p],
+            "betas": best_run.x[p:],
+            "amplitudes": len(probabilities),
+            "expected_energy": float(probabilities @ energies),
+            "optimum_probability": float(probabilities[ground].sum()),
+            "evaluations": int(evaluations),
+        }
+        return states[chosen], float(energies[chosen]), info
+
+
+def exhaustive(qubo: Qubo, block: int = 65536) -> tuple:
+    '''
+    Exact minimum over all C(n, k) feasible selections, in blocks so memory stays O(block n)
+    '''
+    best, best_energy = None, np.inf
+    chosen = combinations(range(qubo.n), qubo.cardinality)
+    rows = np.arange(block)
+    while True:
+        indices = np.array(list(islice(chosen, block)), dtype=np.intp)
+        if not len(indices):
+            return best, best_energy
+        states = np.zeros((len(indices), qubo.n))
+        states[rows[:len(indices), None], indices] = 1.0
+        energies = np.einsum("ij,ij->i", states @ qubo.objective, states)
+        lowest = energies.argmin()
+        if energies[lowest] < best_energy:
+            best, best_energy = states[lowest].astype(np.int8), float(energies[lowest])
+
+
+def mccormick_milp(qubo: Qubo, time_limit: float = None) -> tuple:
+    '''
+    Exact minimum through the McCormick linearization y_ij = x_i x_j for i < j, solved by HiGHS
+        minimize sum_i Q_ii x_i + sum_i<j 2 Q_ij y_ij      subject to 1'x = k
+        y_ij >= x_i + x_j - 1 where Q_ij > 0, y_ij <= x_i and y_ij <= x_j where Q_ij < 0
+    Only the bound that can bind at the optimum is added for each pair
+    Returns (state, objective energy, MIP gap)
+    '''
+    Q = qubo.objective
+    n = qubo.n
+    i, j = np.triu_indices(n, 1)
+    coupling = 2 * Q[i, j]
+    pairs = len(i)
+    c = np.concatenate([np.diag(Q), coupling])
+
+    positive = np.flatnonzero(coupling > 0)
+    negative = np.flatnonzero(coupling < 0)
+    rows, cols, values, lower, upper = [], [], [], [], []
+
+    def add(count, entries, low, high):
+        start = len(lower)
+        for columns, value in entries:
+            rows.append(start + np.arange(count))
+            cols.append(columns)
+            values.append(np.full(count, value))
+        lower.extend([low] * count)
+        upper.extend([high] * count)
+
+    # x_i + x_j - y_ij <= 1
+    add(len(positive), [(i[positive], 1.0), (j[positive], 1.0), (n + positive, -1.0)], -np.inf, 1.0)
+    # y_ij - x_i <= 0 and y_ij - x_j <= 0
+    add(len(negative), [(n + negative, 1.0), (i[negative], -1.0)], -np.inf, 0.0)
+    add(len(negative), [(n + negative, 1.0), (j[negative], -1.0)], -np.inf, 0.0)
+    # 1'x = k
+    rows.append(np.full(n, len(lower)))
+    cols.append(np.arange(n))
+    values.append(np.ones(n))
+    lower.append(qubo.cardinality)
+    upper.append(qubo.cardinality)
+
+    A = sparse.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(len(lower), n + pairs))
+    integrality = np.concatenate([np.ones(n), np.zeros(pairs)])
+    options = {"time_limit": time_limit} if time_limit else {}
+    result = milp(c, constraints=LinearConstraint(A, lower, upper), integrality=integrality, bounds=Bounds(0, 1), options=options)
+    if result.x is None:
+        raise RuntimeError(f"MILP selection failed: {result.message}")
+    state = np.round(result.x[:n]).astype(np.int8)
+    return state, float(qubo.energy(state)[0]), getattr(result, "mip_gap", 0.0)
+
+
+class AssetSelector:
+    '''
+    Cardinality constrained selection: pick exactly k of n assets for the mean-variance objective,
+    then hand the subset to the continuous optimizer. pypfopt has no cardinality constraint short of a
+    mixed integer cvxpy solver, this searches the equal weight QUBO instead
+        tempering   parallel tempering (default), scales to hundreds of assets
+        annealing   simulated annealing
+        qaoa        statevector QAOA, experiments on up to max_qubits assets
+        exhaustive  every k subset, exact for small n
+        milp        McCormick linearization through scipy HiGHS, exact
+    mu and cov are annualized like everywhere else, cov may be a FactorModel
+    '''
+
+    BACKENDS = ("tempering", "annealing", "qaoa", "exhaustive", "milp")
+
+    def __init__(self, mu, cov, risk_aversion: float = 1.0, penalty: float = None, solver: PortfolioSolver = None):
+        self.logger = logging.getLogger(__name__)
+        self.tickers = list(mu.index) if isinstance(mu, pd.Series) else None
+        if isinstance(cov, FactorModel):
+            cov = cov.reindex(self.tickers) if self.tickers and cov.tickers is not None else cov
+        elif isinstance(cov, pd.DataFrame) and self.tickers:
+            cov = cov.loc[self.tickers, self.tickers]
+        self.mu = mu
+        self.cov = cov
+        self.risk_aversion = risk_aversion
+        self.penalty = penalty
+        self.solver = solver or PortfolioSolver()
+
+    def qubo(self, k: int) -> Qubo:
+        cov = self.cov.dense() if isinstance(self.cov, FactorModel) else self.cov
+        return mean_variance_qubo(self.mu, cov, k, self.risk_aversion, self.penalty, self.tickers)
+
+    @staticmethod
+    def repair(qubo: Qubo, state: np.ndarray) -> np.ndarray:
+        # greedy single flips toward size k, only needed when a heuristic stops on a penalized state
+        state = state.astype(np.float64)
+        while state.sum() != qubo.cardinality:
+            adding = state.sum() < qubo.cardinality
+            candidates = np.flatnonzero(state == (0 if adding else 1))
+            delta = (1 - 2 * state[candidates]) * 2 * (state @ qubo.objective)[candidates] + np.diag(qubo.objective)[candidates]
+            flip = candidates[np.argmin(delta)]
+            state[flip] = 1 - state[flip]
+        return state.astype(np.int8)
+
+    def select(self, k: int, backend: str = "tempering", **options) -> SelectionResult:
+        '''
+        options go to the backend, e.g. sweeps= and replicas= for tempering or layers= for qaoa
+        '''
+        qubo = self.qubo(k)
+        t0 = time.perf_counter()
+        info = {}
+        if backend in ("tempering", "annealing"):
+            state, _, info["sweeps"] = AnnealingSolver(method=backend, **options).solve(qubo)
+        elif backend == "qaoa":
+            state, _, info = QaoaSolver(**options).solve(qubo)
+        elif backend == "exhaustive":
+            state, _ = exhaustive(qubo, **options)
+        elif backend == "milp":
+            state, _, info["mip_gap"] = mccormick_milp(qubo, **options)
+        else:
+            raise ValueError(f"Unknown selection backend: {backend}")
+        seconds = time.perf_counter() - t0
+
+        feasible = bool(qubo.feasible(state)[0])
+        if not feasible:
+            self.logger.warning("%s stopped on a selection of %d assets instead of %d, repairing", backend, int(state.sum()), k)
+            state = self.repair(qubo, state)
+        selected = np.flatnonzero(state)
+        return SelectionResult(
+            selected=selected,
+            tickers=[self.tickers[i] for i in selected] if self.tickers else None,
+            energy=float(qubo.energy(state)[0]),
+            objective=float(state @ qubo.objective @ state),
+            feasible=feasible,
+            backend=backend,
+            seconds=seconds,
+            info=info,
+        )
+
+    def optimize(
+        self,
+        k: int,
+        objective: str = "max_sharpe",
+        backend: str = "tempering",
+        bounds: tuple = (0.0, 1.0),
+        risk_free_rate: float = 0.02,
+        target_return: float = None,
+        **options,
+    ) -> tuple:
+        '''
+        Selects k assets, then solves the continuous problem over just those assets
+        Returns (selection, SolverResult) with weights over all n assets, zero outside the selection
+        '''
+        selection = self.select(k, backend, **options)
+        index = selection.selected
+        if isinstance(self.mu, pd.Series):
+            mu = self.mu.iloc[index]
+        else:
+            mu = np.asarray(self.mu, dtype=np.float64)[index]
+        if isinstance(self.cov, FactorModel):
+            cov = self.cov.subset(index)
+        elif isinstance(self.cov, pd.DataFrame):
+            cov = self.cov.iloc[index, index]
+        else:
+            cov = np.asarray(self.cov, dtype=np.float64)[np.ix_(index, index)]
+
+        result = self.solver.solve(objective, mu, cov, target_return=target_return, bounds=bounds, risk_free_rate=risk_free_rate)
+        weights = np.zeros(len(np.asarray(self.mu)))
+        weights[index] = result.weights
+        return selection, SolverResult(weights, f"{backend}+{result.backend}", result.iterations, self.tickers)
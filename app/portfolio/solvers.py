@@ -0,0 +1,401 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import cho_factor, cho_solve, LinAlgError
+from scipy.optimize import linprog
+
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio.riskModels import FactorModel
+
+
+class InfeasibleProblem(ValueError):
+    pass
+
+
+@dataclass
+class SolverResult:
+    '''
+    Weights from whichever backend handled the problem
+    '''
+    weights: np.ndarray
+    backend: str
+    iterations: int = 0
+    tickers: list = None
+
+    def clean_weights(self, cutoff: float = 1e-4, rounding: int = 5) -> OrderedDict:
+        # same cleaning rule as pypfopt BaseOptimizer.clean_weights
+        weights = np.where(np.abs(self.weights) < cutoff, 0.0, self.weights)
+        if rounding is not None:
+            weights = np.round(weights, rounding)
+        tickers = self.tickers if self.tickers is not None else range(len(weights))
+        return OrderedDict(zip(tickers, weights.tolist()))
+
+    def performance(self, mu, cov, risk_free_rate: float = 0.02, verbose: bool = False) -> tuple:
+        metrics = RiskEngine(mu, cov, risk_free_rate=risk_free_rate).evaluate(self.weights)
+        performance = (float(metrics.expected_return[0]), float(metrics.volatility[0]), float(metrics.sharpe[0]))
+        if verbose:
+            print(f"Expected annual return: {100 * performance[0]:.1f}%")
+            print(f"Annual volatility: {100 * performance[1]:.1f}%")
+            print(f"Sharpe Ratio: {performance[2]:.2f}")
+        return performance
+
+
+class CholeskyCache:
+    '''
+    Cholesky factors keyed by a digest of the covariance bytes, bounded LRU
+    Why: repeated solves against the same covariance should factor it once
+    '''
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self.factors = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(cov: np.ndarray) -> str:
+        return hashlib.blake2b(np.ascontiguousarray(cov).view(np.uint8), digest_size=16).hexdigest() + str(cov.shape)
+
+    def get(self, cov: np.ndarray):
+        key = self.digest(cov)
+        if key in self.factors:
+            self.hits += 1
+            self.factors.move_to_end(key)
+            return self.factors[key]
+
+        self.misses += 1
+        try:
+            factor = cho_factor(cov, lower=True, check_finite=False)
+        except LinAlgError:
+            # sample covariances can be semidefinite, a tiny ridge keeps the factorization defined
+            ridge = 1e-10 * np.trace(cov) / len(cov)
+            factor = cho_factor(cov + ridge * np.eye(len(cov)), lower=True, check_finite=False)
+
+        self.factors[key] = factor
+        if len(self.factors) > self.max_entries:
+            self.factors.popitem(last=False)
+        return factor
+
+
+class KKTSolver:
+    '''
+    Closed form mean-variance solutions from the KKT system of
+        minimize w'Sw  subject to  A w = b
+    w = S^-1 A' (A S^-1 A')^-1 b, with S^-1 applied through a cached Cholesky factor, or through
+    Woodbury in O(n k^2) when S is a FactorModel
+    Only valid without inequality constraints, i.e. when shorting is unrestricted
+    '''
+
+    def __init__(self, cache: CholeskyCache = None):
+        self.cache = cache or CholeskyCache()
+
+    def inverse(self, cov, rhs: np.ndarray) -> np.ndarray:
+        if isinstance(cov, FactorModel):
+            return cov.solve(rhs)
+        return cho_solve(self.cache.get(cov), rhs, check_finite=False)
+
+    def solve_equality(self, cov: np.ndarray, A: np.ndarray, b: np.ndarray) -> np.ndarray:
+        sinv_at = self.inverse(cov, A.T)
+        nu = np.linalg.solve(A @ sinv_at, b)
+        return sinv_at @ nu
+
+    def min_volatility(self, cov: np.ndarray) -> np.ndarray:
+        return self.solve_equality(cov, np.ones((1, len(cov))), np.ones(1))
+
+    def efficient_return(self, mu: np.ndarray, cov: np.ndarray, target_return: float) -> np.ndarray:
+        A = np.vstack([np.ones(len(mu)), mu])
+        return self.solve_equality(cov, A, np.array([1.0, target_return]))
+
+    def max_sharpe(self, mu: np.ndarray, cov: np.ndarray, risk_free_rate: float = 0.02) -> np.ndarray:
+        direction = self.inverse(cov, mu - risk_free_rate)
+        total = direction.sum()
+        if total <= 0:
+            raise InfeasibleProblem("No fully invested portfolio has a positive excess return")
+        return direction / total
+
+
+class ActiveSetSolver:
+    '''
+    Primal active set method for
+        minimize w'Sw  subject to  A w = b,  lower <= w <= upper
+    A primal-dual active set pass is tried first. If it does not settle, the primal method takes over:
+    the working set holds variables pinned at a bound, and each iteration solves the equality
+    constrained problem over the free variables, then either steps to the first blocking bound
+    or releases the pinned variable with the most negative multiplier
+    '''
+
+    def __init__(self, max_iter: int = 1000, tol: float = 1e-10):
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def feasible_start(self, A, b, lower, upper) -> np.ndarray:
+        '''
+        Any LP vertex is feasible but pins most variables, so it is pulled as far as the bounds
+        allow toward the projection of an evenly spread portfolio onto A w = b. The active set then
+        only has to pin the variables that really end up at a bound
+        '''
+        n = A.shape[1]
+        bounds = list(zip(np.where(np.isfinite(lower), lower, None), np.where(np.isfinite(upper), upper, None)))
+        vertex = linprog(np.zeros(n), A_eq=A, b_eq=b, bounds=bounds, method="highs")
+        if not vertex.success:
+            raise InfeasibleProblem(f"No portfolio satisfies the constraints: {vertex.message}")
+        vertex = np.clip(vertex.x, lower, upper)
+
+        spread = np.clip(np.full(n, 1.0 / n), lower, upper)
+        center = spread - A.T @ np.linalg.lstsq(A @ A.T, A @ spread - b, rcond=None)[0]
+        direction = center - vertex
+        with np.errstate(divide="ignore", invalid="ignore"):
+            to_lower = np.where(direction < 0, (lower - vertex) / direction, np.inf)
+            to_upper = np.where(direction > 0, (upper - vertex) / direction, np.inf)
+        return vertex + min(1.0, to_lower.min(), to_upper.min()) * direction
+
+    def primal_dual_guess(self, cov, A, b, lower, upper, max_iter: int = 25):
+        '''
+        Primal-dual active set iteration: pin every variable that violates its bound or whose
+        multiplier says it should stay pinned, resolve, repeat until the pinned sets stop changing
+        Usually settles in a handful of solves, returns None when it cycles or ends infeasible
+        '''
+        n = len(cov)
+        at_lower = np.zeros(n, dtype=bool)
+        at_upper = np.zeros(n, dtype=bool)
+        base = np.zeros(n)
+
+        for iteration in range(1, max_iter + 1):
+            base = np.where(at_lower, lower, np.where(at_upper, upper, 0.0))
+            w, nu = self.solve_free(cov, A, b, base, ~(at_lower | at_upper))
+            gradient = 2 * cov @ w - A.T @ nu
+
+            next_lower = np.where(at_lower, gradient > 0, w < lower)
+            next_upper = np.where(at_upper, -gradient > 0, w > upper) & ~next_lower
+            if np.array_equal(next_lower, at_lower) and np.array_equal(next_upper, at_upper):
+                inside = np.all(w >= lower - self.tol) and np.all(w <= upper + self.tol)
+                balanced = np.allclose(A @ w, b, atol=1e-9)
+                return (np.clip(w, lower, upper), iteration) if inside and balanced else None
+            at_lower, at_upper = next_lower, next_upper
+        return None
+
+    def solve(self, cov, A, b, lower, upper, start: np.ndarray = None) -> tuple:
+        n = len(cov)
+        lower = np.broadcast_to(np.asarray(lower, dtype=np.float64), n)
+        upper = np.broadcast_to(np.asarray(upper, dtype=np.float64), n)
+
+        guess = self.primal_dual_guess(cov, A, b, lower, upper)
+        if guess is not None:
+            return guess
+
+        w = self.feasible_start(A, b, lower, upper) if start is None else np.array(start, dtype=np.float64)
+
+        at_lower = np.isclose(w, lower, atol=self.tol)
+        at_upper = np.isclose(w, upper, atol=self.tol) & ~at_lower
+
+        for iteration in range(1, self.max_iter + 1):
+            free = ~(at_lower | at_upper)
+            candidate, nu = self.solve_free(cov, A, b, w, free)
+
+            step = candidate - w
+            if np.abs(step).max(initial=0.0) <= self.tol * max(1.0, np.abs(w).max()):
+                # stationary on this working set, check the multipliers of pinned variables
+                gradient = 2 * cov @ w - A.T @ nu
+                multipliers = np.where(at_lower, gradient, np.where(at_upper, -gradient, np.inf))
+                worst = int(np.argmin(multipliers))
+                if multipliers[worst] >= -self.tol:
+                    return w, iteration
+                at_lower[worst] = at_upper[worst] = False
+                continue
+
+            # longest step toward the candidate that keeps every free variable inside its bounds
+            with np.errstate(divide="ignore", invalid="ignore"):
+                to_lower = np.where(free & (step < 0), (lower - w) / step, np.inf)
+                to_upper = np.where(free & (step > 0), (upper - w) / step, np.inf)
+            ratios = np.minimum(to_lower, to_upper)
+            blocking = int(np.argmin(ratios))
+            alpha = min(1.0, ratios[blocking])
+
+            w = w + alpha * step
+            if alpha < 1.0:
+                if to_lower[blocking] <= to_upper[blocking]:
+                    w[blocking], at_lower[blocking] = lower[blocking], True
+                else:
+                    w[blocking], at_upper[blocking] = upper[blocking], True
+
+        raise InfeasibleProblem(f"Active set solver did not converge in {self.max_iter} iterations")
+
+    def solve_free(self, cov, A, b, w, free) -> tuple:
+        '''
+        Minimizes over the free variables with pinned ones held fixed, returns (weights, multipliers)
+        '''
+        if isinstance(cov, FactorModel):
+            return self.solve_free_factor(cov, A, b, w, free)
+        pinned = ~free
+        A_free = A[:, free]
+        rhs_eq = b - A[:, pinned] @ w[pinned]
+        k = int(free.sum())
+        m = len(b)
+
+        kkt = np.zeros((k + m, k + m))
+        kkt[:k, :k] = 2 * cov[np.ix_(free, free)]
+        kkt[:k, k:] = -A_free.T
+        kkt[k:, :k] = A_free
+        rhs = np.concatenate([-2 * cov[np.ix_(free, pinned)] @ w[pinned], rhs_eq])
+
+        try:
+            solution = np.linalg.solve(kkt, rhs)
+        except np.linalg.LinAlgError:
+            solution = np.linalg.lstsq(kkt, rhs, rcond=None)[0]
+
+        candidate = w.copy()
+        candidate[free] = solution[:k]
+        return candidate, solution[k:]
+
+    def solve_free_factor(self, cov: FactorModel, A, b, w, free) -> tuple:
+        '''
+        solve_free on a factor model through the Schur complement of the KKT system
+            2 S_ff w_f + 2 S_fp w_p - A_f' nu = 0,  A_f w_f = b - A_p w_p
+        with S_ff^-1 applied by Woodbury, O(n k^2) per working set instead of O(n^3)
+        '''
+        pinned = ~free
+        candidate = w.copy()
+        if not free.any():
+            return candidate, np.zeros(len(b))
+
+        A_free = A[:, free]
+        rhs_eq = b - A[:, pinned] @ w[pinned]
+        inner = cov.subset(free)
+        # only the factor part couples free and pinned variables, the specific part is diagonal
+        cross = cov.loadings[free] @ (cov.factor_cov @ (cov.loadings[pinned].T @ w[pinned]))
+
+        sinv_at = inner.solve(A_free.T)
+        sinv_cross = inner.solve(cross)
+        try:
+            half_nu = np.linalg.solve(A_free @ sinv_at, rhs_eq + A_free @ sinv_cross)
+        except np.linalg.LinAlgError:
+            half_nu = np.linalg.lstsq(A_free @ sinv_at, rhs_eq + A_free @ sinv_cross, rcond=None)[0]
+
+        candidate[free] = sinv_at @ half_nu - sinv_cross
+        return candidate, 2 * half_nu
+
+
+class PortfolioSolver:
+    '''
+    Routes mean-variance problems to the cheapest backend that can solve them
+        kkt         no bounds, only the budget / target return equalities
+        active_set  box bounds (long only, caps)
+        pypfopt     anything else, e.g. extra constraints or objectives
+    cov may be a FactorModel, kkt and active_set then work on its loadings and never form S
+    '''
+
+    def __init__(self, cache: CholeskyCache = None):
+        self.logger = logging.getLogger(__name__)
+        self.kkt = KKTSolver(cache)
+        self.active_set = ActiveSetSolver()
+
+    @staticmethod
+    def normalize_bounds(bounds, n: int):
+        if bounds is None:
+            return None
+        lower, upper = bounds
+        lower = np.broadcast_to(np.asarray(-np.inf if lower is None else lower, dtype=np.float64), n)
+        upper = np.broadcast_to(np.asarray(np.inf if upper is None else upper, dtype=np.float64), n)
+        if not (np.isfinite(lower).any() or np.isfinite(upper).any()):
+            return None
+        return lower, upper
+
+    def solve(
+        self,
+        objective: str,
+        mu,
+        cov,
+        target_return: float = None,
+        bounds: tuple = (0.0, 1.0),
+        risk_free_rate: float = 0.02,
+        constraints: list = None,
+    ) -> SolverResult:
+        '''
+        objective is one of min_volatility, efficient_return or max_sharpe
+        constraints takes pypfopt style callables and always routes to the pypfopt fallback
+        '''
+        tickers = list(mu.index) if isinstance(mu, pd.Series) else None
+        mu_array = np.asarray(mu, dtype=np.float64)
+        if isinstance(cov, FactorModel):
+            cov_array = cov.reindex(tickers) if tickers and cov.tickers is not None else cov
+        else:
+            cov_array = np.ascontiguousarray(cov.loc[tickers, tickers] if tickers and isinstance(cov, pd.DataFrame) else cov, dtype=np.float64)
+        n = len(mu_array)
+        box = self.normalize_bounds(bounds, n)
+
+        if constraints or objective not in ("min_volatility", "efficient_return", "max_sharpe"):
+            return self.fallback(objective, mu, cov, target_return, bounds, risk_free_rate, constraints, tickers)
+
+        if box is None:
+            if objective == "min_volatility":
+                weights = self.kkt.min_volatility(cov_array)
+            elif objective == "efficient_return":
+                weights = self.kkt.efficient_return(mu_array, cov_array, target_return)
+            else:
+                weights = self.kkt.max_sharpe(mu_array, cov_array, risk_free_rate)
+            return SolverResult(weights, "kkt", 1, tickers)
+
+        lower, upper = box
+        if objective == "min_volatility":
+            weights, iterations = self.active_set.solve(cov_array, np.ones((1, n)), np.ones(1), lower, upper)
+        elif objective == "efficient_return":
+            # pypfopt uses mu'w >= target, binding on the efficient part of the frontier
+            unconstrained, _ = self.active_set.solve(cov_array, np.ones((1, n)), np.ones(1), lower, upper)
+            if mu_array @ unconstrained >= target_return:
+                weights, iterations = unconstrained, 0
+            else:
+                A = np.vstack([np.ones(n), mu_array])
+                weights, iterations = self.active_set.solve(cov_array, A, np.array([1.0, target_return]), lower, upper)
+        elif np.all(lower == 0) and np.all(upper >= 1):
+            weights, iterations = self.max_sharpe_long_only(mu_array, cov_array, risk_free_rate)
+        else:
+            # capped max sharpe does not survive the y = w / k homogenization, leave it to cvxpy
+            return self.fallback(objective, mu, cov, target_return, bounds, risk_free_rate, constraints, tickers)
+
+        return SolverResult(weights, "active_set", iterations, tickers)
+
+    def max_sharpe_long_only(self, mu, cov, risk_free_rate) -> tuple:
+        '''
+        minimize y'Sy subject to (mu - rf)'y = 1, y >= 0, then w = y / sum(y)
+        '''
+        excess = mu - risk_free_rate
+        best = int(np.argmax(excess))
+        if excess[best] <= 0:
+            raise InfeasibleProblem("At least one asset must have an expected return above the risk free rate")
+
+        start = np.zeros(len(mu))
+        start[best] = 1 / excess[best]
+        y, iterations = self.active_set.solve(cov, excess[None, :], np.ones(1), 0.0, np.inf, start=start)
+        return y / y.sum(), iterations
+
+    def fallback(self, objective, mu, cov, target_return, bounds, risk_free_rate, constraints, tickers) -> SolverResult:
+        from pypfopt.efficient_frontier import EfficientFrontier
+
+        self.logger.info("Falling back to PyPortfolioOpt for %s", objective)
+        if isinstance(cov, FactorModel):
+            # cvxpy needs the dense matrix
+            cov = pd.DataFrame(cov.dense(), index=cov.tickers or tickers, columns=cov.tickers or tickers)
+        ef = EfficientFrontier(mu, cov, weight_bounds=bounds if bounds is not None else (None, None))
+        for constraint in constraints or []:
+            ef.add_constraint(constraint)
+
+        if objective == "efficient_return":
+            ef.efficient_return(target_return)
+        elif objective == "max_sharpe":
+            ef.max_sharpe(risk_free_rate=risk_free_rate)
+        else:
+            getattr(ef, objective)()
+        return SolverResult(np.asarray(ef.weights, dtype=np.float64), "pypfopt", 0, tickers)
+
+    def min_volatility(self, mu, cov, **kwargs) -> SolverResult:
+        return self.solve("min_volatility", mu, cov, **kwargs)
+
+    def efficient_return(self, mu, cov, target_return: float, **kwargs) -> SolverResult:
+        return self.solve("efficient_return", mu, cov, target_return=target_return, **kwargs)
+
+    def max_sharpe(self, mu, cov, **kwargs) -> SolverResult:
+        return self.solve("max_sharpe", mu, cov, **kwargs)
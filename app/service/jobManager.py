@@ -0,0 +1,256 @@
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from uuid import uuid4
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+
+from app.data.marketDataStore import MarketDataStore, SnapshotHandle
+from app.data.priceLoader import PriceLoader
+from app.models import JobStatus, RebalanceRequest
+from app.portfolio import rebalance
+
+TERMINAL = ("done", "failed")
+
+
+@dataclass
+class Job:
+    id: str
+    request: RebalanceRequest
+    key: tuple
+    status: str = "queued"
+    created: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    batch_size: int = 0
+    result: dict = None
+    error: str = None
+    changed: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def snapshot(self) -> JobStatus:
+        return JobStatus(
+            id=self.id, status=self.status, created=self.created, started=self.started, finished=self.finished,
+            batch_size=self.batch_size, result=self.result, error=self.error,
+        )
+
+
+class JobManager:
+    '''
+    Runs rebalance requests as jobs on a process pool
+        batching    jobs for the same universe and date range that arrive within batch_window
+                    seconds run as one batch, prices are loaded and the covariance estimated once
+        reuse       estimates are kept for estimate_ttl seconds, a later batch on the same universe
+                    and range goes straight to the solve, and concurrent batches wait for one estimate
+        sharing     returns, latest prices and the estimate sit in a MarketDataStore snapshot that the
+                    workers attach to, tasks only carry its handle
+        solving     a batch is split across the pool, requests differing only in account size share a solve
+    Status changes are pushed to watchers so results can be streamed instead of polled
+    '''
+
+    def __init__(
+        self,
+        loader: PriceLoader,
+        max_workers: int = None,
+        batch_window: float = 0.05,
+        estimate_ttl: float = 3600,
+        max_estimates: int = 64,
+        max_jobs: int = 10_000,
+        store: MarketDataStore = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.loader = loader
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.batch_window = batch_window
+        self.estimate_ttl = estimate_ttl
+        self.max_estimates = max_estimates
+        self.max_jobs = max_jobs
+        # prices and estimates live in shared memory, tasks carry only a snapshot handle
+        self.store = store or MarketDataStore()
+
+        # spawn, the service runs threads (to_thread loads, uvicorn) that fork would copy mid flight
+        self.pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self.jobs = OrderedDict()
+        self.pending = defaultdict(list)
+        self.estimates = OrderedDict()
+        self.locks = defaultdict(asyncio.Lock)
+        self.tasks = set()
+        self.stats = {"submitted": 0, "batches": 0, "loads": 0, "estimates": 0, "estimate_hits": 0, "solved": 0, "failed": 0}
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.pool, rebalance.warm_up) for _ in range(self.max_workers)))
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.store.close()
+
+    # ------------------------------------------------------------------
+    # jobs
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(request: RebalanceRequest) -> tuple:
+        return (tuple(sorted(set(request.tickers))), request.start, request.end or datetime.today().strftime("%Y-%m-%d"))
+
+    def submit(self, request: RebalanceRequest) -> Job:
+        job = Job(id=str(uuid4()), request=request, key=self.key(request))
+        self.jobs[job.id] = job
+        self.prune()
+        self.stats["submitted"] += 1
+
+        # the first job for a key opens its batch window, the rest join it
+        self.pending[job.key].append(job)
+        if len(self.pending[job.key]) == 1:
+            asyncio.get_running_loop().call_later(self.batch_window, self.flush, job.key)
+        return job
+
+    def get(self, job_id: str) -> Job:
+        return self.jobs.get(job_id)
+
+    async def watch(self, job_id: str):
+        '''
+        Async iterator over a job's status, the current one first, until it is done or failed
+        '''
+        job = self.jobs[job_id]
+        while True:
+            # taken before the snapshot, an update made while the caller handles it sets this event
+            changed = job.changed
+            snapshot = job.snapshot()
+            yield snapshot
+            if snapshot.status in TERMINAL:
+                return
+            await changed.wait()
+
+    async def wait(self, job_id: str) -> JobStatus:
+        async for snapshot in self.watch(job_id):
+            pass
+        return snapshot
+
+    def update(self, job: Job, **changes):
+        for name, value in changes.items():
+            setattr(job, name, value)
+        # every watcher holds the old event, a fresh one waits for the next change
+        job.changed.set()
+        job.changed = asyncio.Event()
+
+    def prune(self):
+        # finished jobs are dropped oldest first once max_jobs is exceeded
+        for job_id in list(self.jobs):
+            if len(self.jobs) <= self.max_jobs:
+                return
+            if self.jobs[job_id].status in TERMINAL:
+                del self.jobs[job_id]
+
+    # ------------------------------------------------------------------
+    # batches
+    # ------------------------------------------------------------------
+    def flush(self, key: tuple):
+        jobs = self.pending.pop(key, [])
+        if jobs:
+            task = asyncio.get_running_loop().create_task(self.run_batch(key, jobs))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run_batch(self, key: tuple, jobs: list):
+        self.stats["batches"] += 1
+        now = time.time()
+        for job in jobs:
+            self.update(job, status="running", started=now, batch_size=len(jobs))
+
+        handle = None
+        try:
+            handle = await self.estimate(key)
+            loop = asyncio.get_running_loop()
+            chunks = self.chunks(jobs)
+            results = await asyncio.gather(*(
+                loop.run_in_executor(self.pool, rebalance.solve_batch, handle, [job.request.model_dump() for job in chunk])
+                for chunk in chunks
+            ))
+        except Exception as e:
+            self.logger.error("Batch for %d tickers %s..%s failed: %r", len(key[0]), key[1], key[2], e)
+            for job in jobs:
+                self.fail(job, f"{type(e).__name__}: {e}")
+            return
+        finally:
+            if handle is not None:
+                self.store.release(handle)
+
+        finished = time.time()
+        for chunk, chunk_results in zip(chunks, results):
+            for job, result in zip(chunk, chunk_results):
+                if "error" in result:
+                    self.fail(job, result["error"])
+                else:
+                    self.stats["solved"] += 1
+                    self.update(job, status="done", finished=finished, result=result)
+
+    def chunks(self, jobs: list) -> list:
+        # whole solve groups go to one worker so the requests in them still share their solve
+        groups = defaultdict(list)
+        for job in jobs:
+            request = job.request
+            groups[(request.objective, request.target_return, request.risk_free_rate, tuple(request.weight_bounds))].append(job)
+        chunks = [[] for _ in range(min(self.max_workers, len(groups)))]
+        for members in sorted(groups.values(), key=len, reverse=True):
+            min(chunks, key=len).extend(members)
+        return chunks
+
+    def fail(self, job: Job, error: str):
+        self.stats["failed"] += 1
+        self.update(job, status="failed", finished=time.time(), error=error)
+
+    async def estimate(self, key: tuple) -> SnapshotHandle:
+        '''
+        The estimated snapshot for a universe and range, held for the caller until store.release
+        Loaded, published and estimated once even when batches overlap
+        '''
+        async with self.locks[key]:
+            cached = self.estimates.get(key)
+            if cached is not None and time.monotonic() - cached[0] < self.estimate_ttl:
+                self.estimates.move_to_end(key)
+                self.stats["estimate_hits"] += 1
+                self.store.acquire(cached[1])
+                return cached[1]
+            if cached is not None:
+                # workers reading the expired version keep it until their batch releases it
+                del self.estimates[key]
+                self.store.retire(cached[1])
+
+            tickers, start, end = key
+            self.stats["loads"] += 1
+            prices = await asyncio.to_thread(self.loader.load, list(tickers), start, end)
+            handle = await asyncio.to_thread(self.store.publish, prices)
+            self.store.acquire(handle)
+            try:
+                self.stats["estimates"] += 1
+                await asyncio.get_running_loop().run_in_executor(self.pool, rebalance.estimate_snapshot, handle)
+            except Exception:
+                self.store.release(handle)
+                self.store.retire(handle)
+                raise
+
+            self.estimates[key] = (time.monotonic(), handle)
+            while len(self.estimates) > self.max_estimates:
+                evicted, (_, old) = self.estimates.popitem(last=False)
+                self.store.retire(old)
+                if not self.locks[evicted].locked():
+                    del self.locks[evicted]
+            return handle
+
+    def report(self) -> dict:
+        statuses = defaultdict(int)
+        for job in self.jobs.values():
+            statuses[job.status] += 1
+        return {
+            **self.stats,
+            "jobs": dict(statuses),
+            "pending_batches": len(self.pending),
+            "cached_estimates": len(self.estimates),
+            "workers": self.max_workers,
+            "store": self.store.report(),
+        }
@@ -7,8 +7,44 @@ class ConfigSettings(BaseSettings):
     
     GEMINI_MODEL: str = Field('gemini-2.5-flash',description="Name of model for Gemini to use")
     
+    GEMINI_RPM : float = Field(60,description="Requests per minute allowed per Gemini model")
+
+    GEMINI_TPM : float = Field(1_000_000,description="Tokens per minute allowed per Gemini model")
+
+    GEMINI_MAX_IN_FLIGHT : int = Field(8,description="Gemini calls allowed to run at the same time per model")
+
+    GEMINI_CACHE_TTL : float = Field(3600,description="Seconds a cached Gemini response stays valid")
+
+    GEMINI_CACHE_MAX_ENTRIES : int = Field(1024,description="Gemini responses kept in memory before LRU eviction")
+
+    GEMINI_CACHE_DIR : str | None = Field(None,description="Directory for the on-disk Gemini response cache, memory only when unset")
+
     POLYGON_API_KEY : str = Field(...,description="API key for Polygon API Access")
 
+    PRICE_CACHE_DIR : str = Field('.cache/prices',description="Directory for the on-disk OHLCV cache")
+
+    PRICE_CACHE_MAX_BYTES : int = Field(1 << 30,description="Size limit of the OHLCV cache before LRU eviction")
+
+    GRAPH_CACHE_PATH : str = Field('.cache/optimizer.sqlite',description="SQLite file for the optimizer's cached node results")
+
+    GRAPH_CACHE_TTL : int = Field(86400,description="Seconds a cached optimizer node result stays valid")
+
+    JOB_WORKERS : int | None = Field(None,description="Processes in the optimization job pool, one per CPU when unset")
+
+    JOB_BATCH_WINDOW : float = Field(0.05,description="Seconds jobs for the same universe and range are collected into one batch")
+
+    JOB_ESTIMATE_TTL : float = Field(3600,description="Seconds an estimated mean and covariance is reused by later jobs")
+
+    LOG_LEVEL : str = Field('INFO',description="Level of the root logger, payloads of prompts, responses and tool results log at DEBUG")
+
+    TELEMETRY_FILE : str | None = Field(None,description="JSONL file sampled spans are appended to, none when unset")
+
+    TELEMETRY_SPAN_SAMPLE : float = Field(1.0,description="Share of traces whose spans are kept and exported, metrics always count every span")
+
+    TELEMETRY_PAYLOAD_SAMPLE : float = Field(0.1,description="Share of calls whose payload is logged when DEBUG logging is on")
+
+    TELEMETRY_PAYLOAD_CHARS : int = Field(2000,description="Characters of a logged payload kept before truncation")
+
     model_config = SettingsConfigDict(env_file='.env',env_file_encoding="utf-8")
 
 Settings = ConfigSettings()
\ No newline at end of file
@@ -0,0 +1,315 @@
+import atexit
+from bisect import bisect_left
+from collections import defaultdict, deque
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# seconds, upper bounds of the span duration histogram like the Prometheus client defaults plus a long tail for LLM calls
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+current = contextvars.ContextVar("span", default=None)
+
+
+def text_bytes(text) -> int:
+    # str.isascii is O(1) in CPython, so ASCII JSON is measured without encoding a copy
+    if isinstance(text, (bytes, bytearray)):
+        return len(text)
+    text = text if isinstance(text, str) else str(text)
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+class Payload:
+    '''
+    Deferred, truncated rendering of a large value for %-style log calls
+    Nothing is serialized unless a handler actually formats the record
+    '''
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = 2000):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else json.dumps(self.value, default=str, separators=(",", ":"))
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text)} chars)"
+
+
+class Span:
+    '''
+    One timed operation, nested under whichever span is current in the calling context
+    Use as a (async) context manager, or call end() for work that finishes in a callback
+    '''
+    __slots__ = ("telemetry", "name", "attributes", "trace_id", "span_id", "parent_id", "sampled", "start", "wall", "error", "token", "ended")
+
+    def __init__(self, telemetry, name: str, parent, attributes: dict):
+        self.telemetry = telemetry
+        self.name = name
+        self.attributes = attributes
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        # the whole trace is kept or dropped together, decided at its root
+        self.sampled = parent.sampled if parent else random.random() < telemetry.span_sample
+        self.start = time.perf_counter()
+        self.wall = time.time_ns()
+        self.error = None
+        self.token = None
+        self.ended = False
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def end(self, error: BaseException = None):
+        if self.ended:
+            return
+        self.ended = True
+        if error is not None:
+            self.error = repr(error)
+        self.telemetry.finish(self, time.perf_counter() - self.start)
+
+    def __enter__(self) -> "Span":
+        self.token = current.set(self)
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        current.reset(self.token)
+        self.end(error)
+        return False
+
+    async def __aenter__(self) -> "Span":
+        return self.__enter__()
+
+    async def __aexit__(self, kind, error, traceback):
+        return self.__exit__(kind, error, traceback)
+
+    def to_dict(self, seconds: float) -> dict:
+        # OTLP JSON span field names, so a collector's file receiver can pick the export up
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.wall,
+            "endTimeUnixNano": self.wall + int(seconds * 1e9),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+        }
+
+
+class Telemetry:
+    '''
+    Process wide spans, counters and timing histograms for the pipeline hot paths
+        span            timed block, its duration lands in span_seconds{span=name} and sampled
+                        traces are kept in a bounded buffer and optionally appended to a JSONL file
+        count / observe counters (tokens, bytes, records) and histograms keyed by name and labels
+        prometheus      text exposition format for a /metrics endpoint
+        log_payload     sampled, lazily formatted payload logging for large prompts and responses
+    Metric updates take one lock, so they are safe from worker threads
+    '''
+
+    def __init__(self, namespace: str = "portfolio", recent: int = 2048, span_sample: float = 1.0, payload_sample: float = 1.0, payload_chars: int = 2000):
+        self.logger = logging.getLogger(__name__)
+        self.namespace = namespace
+        self.span_sample = span_sample
+        self.payload_sample = payload_sample
+        self.payload_chars = payload_chars
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.spans = deque(maxlen=recent)
+        self.export = None
+
+    # ------------------------------------------------------------------
+    # spans
+    # ------------------------------------------------------------------
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, current.get(), attributes)
+
+    def context(self, span: Span) -> contextvars.Context:
+        '''
+        Copy of the current context with span current, for work handed to a thread pool, which
+        run_in_executor would otherwise start without any parent span
+        '''
+        context = contextvars.copy_context()
+        context.run(current.set, span)
+        return context
+
+    def traced(self, name: str, fn=None, **attributes):
+        '''
+        Wraps a sync or async callable in a span, usable as a decorator or traced(name, fn)
+        functools.wraps keeps the signature and annotations LangGraph reads off node functions
+        '''
+        if fn is None:
+            return lambda fn: self.traced(name, fn, **attributes)
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                with self.span(name, **attributes):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, **attributes):
+                    return fn(*args, **kwargs)
+        return wrapper
+
+    def finish(self, span: Span, seconds: float):
+        self.observe("span_seconds", seconds, span=span.name)
+        if span.error:
+            self.count("span_errors_total", span=span.name)
+        if not span.sampled:
+            return
+        record = span.to_dict(seconds)
+        with self.lock:
+            self.spans.append(record)
+            if self.export is not None:
+                self.export.write(json.dumps(record, default=str, separators=(",", ":")) + "\n")
+
+    def export_to(self, path: str):
+        '''
+        Appends every sampled span to path as one JSON object per line
+        Writes are buffered, close() (registered at exit by configure) flushes the tail
+        '''
+        with self.lock:
+            if self.export is not None:
+                self.export.close()
+            self.export = open(path, "a", buffering=1 << 16) if path else None
+
+    def close(self):
+        with self.lock:
+            if self.export is not None:
+                self.export.close()
+                self.export = None
+
+    # ------------------------------------------------------------------
+    # metrics
+    # ------------------------------------------------------------------
+    @staticmethod
+    def key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def count(self, name: str, value: float = 1.0, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name: str, value: float, **labels):
+        key = self.key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # per bucket counts, then the sum and the count of observations
+                histogram = self.histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+            bucket = bisect_left(BUCKETS, value)
+            if bucket < len(BUCKETS):
+                histogram[bucket] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def prometheus(self) -> str:
+        '''
+        Counters and histograms in the Prometheus text exposition format (version 0.0.4)
+        '''
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(value) for key, value in self.histograms.items()}
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for (other, labels), value in sorted(counters.items()):
+                if other == name:
+                    lines.append(f"{metric}{format_labels(labels)} {value:g}")
+        for name in sorted({name for name, _ in histograms}):
+            metric = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for (other, labels), histogram in sorted(histograms.items()):
+                if other != name:
+                    continue
+                cumulative = 0
+                for bound, observed in zip(BUCKETS, histogram):
+                    cumulative += observed
+                    lines.append(f"{metric}_bucket{format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{metric}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram[-1]}")
+                lines.append(f"{metric}_sum{format_labels(labels)} {histogram[-2]:g}")
+                lines.append(f"{metric}_count{format_labels(labels)} {histogram[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> dict:
+        with self.lock:
+            spans = {
+                dict(labels)["span"]: {"count": histogram[-1], "seconds": histogram[-2]}
+                for (name, labels), histogram in self.histograms.items()
+                if name == "span_seconds"
+            }
+            counters = {f"{name}{format_labels(labels)}": value for (name, labels), value in self.counters.items()}
+        return {"spans": spans, "counters": counters, "recent_spans": len(self.spans)}
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.spans.clear()
+
+    # ------------------------------------------------------------------
+    # payload logging
+    # ------------------------------------------------------------------
+    def log_payload(self, logger: logging.Logger, message: str, value, level: int = logging.DEBUG):
+        '''
+        logger.log(level, message, payload) for a sampled share of calls, the payload is only
+        serialized and truncated if the record is emitted
+        '''
+        if not logger.isEnabledFor(level) or (self.payload_sample < 1.0 and random.random() >= self.payload_sample):
+            return
+        logger.log(level, message, Payload(value, self.payload_chars))
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# shared so every client, node and server in the process reports into one registry
+telemetry = Telemetry()
+
+configured = False
+
+
+def configure(level: str = None, export_path: str = None, span_sample: float = None, payload_sample: float = None, payload_chars: int = None):
+    '''
+    One logging and telemetry setup for the process, defaults come from Settings
+    Only the first call has an effect, so every entry point and client can call it
+    '''
+    global configured
+    if configured:
+        return
+    configured = True
+    from app.settings import Settings
+
+    logging.basicConfig(level=(level or Settings.LOG_LEVEL).upper(), format=LOG_FORMAT)
+    telemetry.span_sample = Settings.TELEMETRY_SPAN_SAMPLE if span_sample is None else span_sample
+    telemetry.payload_sample = Settings.TELEMETRY_PAYLOAD_SAMPLE if payload_sample is None else payload_sample
+    telemetry.payload_chars = Settings.TELEMETRY_PAYLOAD_CHARS if payload_chars is None else payload_chars
+    path = export_path or Settings.TELEMETRY_FILE
+    if path:
+        telemetry.export_to(path)
+        atexit.register(telemetry.close)
@@ -0,0 +1,3 @@
+def estimate_tokens(*texts) -> int:
+    # roughly four characters per token for English text and JSON
+    return sum(len(str(text)) for text in texts if text) // 4 + 1
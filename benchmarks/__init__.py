@@ -0,0 +1,9 @@
+'''
+Benchmarks for the pipeline hot paths, run from the repository root as python -m benchmarks.<name>
+app.settings is built at import and requires the API keys, the stubs, fixtures and fake endpoints
+used here never check them, so placeholders are set before any benchmark imports app
+'''
+import os
+
+os.environ.setdefault("POLYGON_API_KEY", "benchmark")
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
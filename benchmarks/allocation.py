@@ -0,0 +1,55 @@
+'''
+Discrete allocation for a batch of account sizes, greedy + repair against pypfopt lp_portfolio
+Run from the repository root: python -m benchmarks.allocation
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio.allocation import DiscreteAllocator
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=300)
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--exact-accounts", type=int, default=5, help="accounts solved with the MILP for comparison")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tickers = [f"T{i}" for i in range(args.tickers)]
+    weights = dict(zip(tickers, rng.dirichlet(np.full(args.tickers, 0.5))))
+    prices = pd.Series(np.exp(rng.uniform(np.log(5), np.log(2000), args.tickers)), index=tickers)
+    values = np.geomspace(15_000, 5_000_000, args.accounts)
+
+    allocator = DiscreteAllocator(weights, prices)
+
+    t0 = time.perf_counter()
+    greedy = allocator.allocate(values, mode="greedy", repair_iterations=0)
+    greedy_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    repaired = allocator.allocate(values, mode="greedy")
+    repaired_time = time.perf_counter() - t0
+
+    sample = np.linspace(0, args.accounts - 1, args.exact_accounts).astype(int)
+    t0 = time.perf_counter()
+    exact = allocator.allocate(values[sample], mode="exact")
+    exact_time = (time.perf_counter() - t0) / len(sample) * args.accounts
+
+    print(f"{args.tickers} tickers, {args.accounts} accounts from {values[0]:,.0f} to {values[-1]:,.0f}")
+    print(f"greedy          : {greedy_time:8.3f}s")
+    print(f"greedy + repair : {repaired_time:8.3f}s")
+    print(f"lp_portfolio    : ~{exact_time:7.1f}s (extrapolated from {len(sample)} accounts)")
+    print(f"{'account':>12} {'greedy rmse':>12} {'repair rmse':>12} {'exact rmse':>12} {'leftover g/r/e':>20}")
+    for row, account in enumerate(sample):
+        print(
+            f"{values[account]:12,.0f} {greedy.tracking_error[account]:12.5f} {repaired.tracking_error[account]:12.5f} "
+            f"{exact.tracking_error[row]:12.5f} {greedy.leftover[account]:8.0f}/{repaired.leftover[account]:.0f}/{exact.leftover[row]:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
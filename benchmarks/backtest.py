@@ -0,0 +1,146 @@
+'''
+Walk-forward max Sharpe backtest on a synthetic 10 year universe
+    per day     reference loop, returns.cov() per rebalance window and pandas holdings drifted one
+                day at a time, the way the static optimizer script would be extended
+    vectorized  Backtester, batched window estimates and all segment paths at once
+    grid        a parameter grid through run_many (solves shared across cost levels) and through
+                run_parallel on a process pool
+Both engines use the same solver, solve time is reported separately so the engine cost is visible
+Run from the repository root: python -m benchmarks.backtest
+'''
+import argparse
+import itertools
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio.backtest import Backtester, BacktestParams, run_parallel
+from app.portfolio.riskEngine import RiskEngine
+from app.portfolio.solvers import PortfolioSolver
+
+
+class TimedSolver(PortfolioSolver):
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = 0.0
+        self.calls = 0
+
+    def solve(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return super().solve(*args, **kwargs)
+        finally:
+            self.seconds += time.perf_counter() - t0
+            self.calls += 1
+
+
+def synthetic_prices(assets, days, seed):
+    # one market factor plus idiosyncratic noise, a block of late listings
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0003, 0.01, (days + 1, 1))
+    steps = rng.normal(0.0002, rng.uniform(0.01, 0.025, assets), (days + 1, assets)) + market * rng.uniform(0.5, 1.5, assets)
+    prices = pd.DataFrame(
+        100 * np.exp(np.cumsum(steps, axis=0)),
+        index=pd.bdate_range("2014-01-01", periods=days + 1),
+        columns=[f"T{i:03d}" for i in range(assets)],
+    )
+    late = rng.choice(assets, assets // 20, replace=False)
+    for column, listed in zip(late, rng.integers(0, days // 2, len(late))):
+        prices.iloc[:listed, column] = np.nan
+    return prices
+
+
+def per_day(prices, params, solver):
+    returns = prices.dropna(axis=1, how="all").pct_change().dropna(how="all")
+    holdings = pd.Series(0.0, index=returns.columns)
+    pending_cost = 0.0
+    net = []
+    for t, date in enumerate(returns.index):
+        day = returns.iloc[t].fillna(0.0)
+        invested = holdings.sum()
+        grown = holdings * (1 + day)
+        gross = grown.sum() / invested - 1 if invested else 0.0
+        net.append((1 + gross) * (1 - pending_cost) - 1)
+        pending_cost = 0.0
+        holdings = grown
+
+        if t >= params.lookback - 1 and (t - params.lookback + 1) % params.rebalance_every == 0 and t < len(returns) - 1:
+            window = returns.iloc[t - params.lookback + 1:t + 1].dropna(axis=1)
+            engine = RiskEngine.from_returns(window)
+            mu = pd.Series(engine.mu, index=engine.tickers)
+            cov = pd.DataFrame(engine.cov, index=engine.tickers, columns=engine.tickers)
+            result = solver.solve(params.objective, mu, cov, bounds=params.bounds, risk_free_rate=params.risk_free_rate)
+            target = pd.Series(result.weights, index=engine.tickers).reindex(returns.columns, fill_value=0.0)
+            drifted = holdings / holdings.sum() if holdings.sum() else holdings
+            pending_cost = (target - drifted).abs().sum() * params.cost_bps / 10_000
+            holdings = target
+    return np.array(net)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=500)
+    parser.add_argument("--years", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    prices = synthetic_prices(args.assets, args.years * 252, seed=0)
+    params = BacktestParams(lookback=252, rebalance_every=21, cost_bps=10)
+    print(f"{args.years}y x {args.assets} assets, lookback {params.lookback}, rebalance every {params.rebalance_every} days")
+
+    solver = TimedSolver()
+    t0 = time.perf_counter()
+    reference = per_day(prices, params, solver)
+    slow = time.perf_counter() - t0
+    slow_solve = solver.seconds
+    print(f"{'per day':<12} {slow:7.2f}s total {slow - slow_solve:7.2f}s engine {slow_solve:7.2f}s in {solver.calls} solves")
+
+    solver = TimedSolver()
+    t0 = time.perf_counter()
+    backtester = Backtester.from_prices(prices, solver=solver)
+    result = backtester.run(params)
+    fast = time.perf_counter() - t0
+    print(f"{'vectorized':<12} {fast:7.2f}s total {fast - solver.seconds:7.2f}s engine {solver.seconds:7.2f}s in {solver.calls} solves"
+          f"   engine {(slow - slow_solve) / (fast - solver.seconds):.0f}x")
+
+    error = np.abs(np.cumprod(1 + result.returns) - np.cumprod(1 + reference)).max()
+    print(f"{'max equity difference':<22} {error:.2e}")
+    print(f"{'summary':<12} { {k: round(v, 4) if isinstance(v, float) else v for k, v in result.summary().items()} }")
+    assert error < 1e-6
+
+    grid = [
+        BacktestParams(lookback=lookback, rebalance_every=every, cost_bps=cost)
+        for lookback, every, cost in itertools.product([126, 252], [21, 63], [0, 10, 25])
+    ]
+    schedules = len({p.schedule_key for p in grid})
+    print(f"grid of {len(grid)} configurations over {schedules} schedules")
+
+    solver = TimedSolver()
+    t0 = time.perf_counter()
+    for p in grid:
+        Backtester.from_prices(prices, solver=solver).run(p)
+    one_by_one = time.perf_counter() - t0
+    print(f"{'one by one':<12} {one_by_one:7.2f}s {solver.calls:>5} solves")
+
+    solver = TimedSolver()
+    t0 = time.perf_counter()
+    shared = Backtester.from_prices(prices, solver=solver).run_many(grid)
+    many = time.perf_counter() - t0
+    print(f"{'run_many':<12} {many:7.2f}s {solver.calls:>5} solves   {one_by_one / many:.1f}x")
+
+    t0 = time.perf_counter()
+    pooled = run_parallel(prices, grid, max_workers=args.workers)
+    parallel = time.perf_counter() - t0
+    print(f"{'run_parallel':<12} {parallel:7.2f}s {args.workers:>5} workers {one_by_one / parallel:.1f}x")
+
+    for a, b in zip(shared, pooled):
+        assert a.params == b.params and np.allclose(a.returns, b.returns)
+
+
+if __name__ == "__main__":
+    main()
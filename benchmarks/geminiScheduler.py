@@ -0,0 +1,130 @@
+'''
+GeminiClient under concurrent load against a local fake of the Gemini endpoint
+    blocking       the old client, sync generate_content inside async methods, so gather runs one at a time
+    unthrottled    the SDK's async client fired all at once, past the endpoint's requests per minute limit
+    scheduled      GeminiClient behind LLMScheduler, within the limit, plus a run with a limit set too high
+                   so the endpoint's 429s are retried with backoff
+Run from the repository root: python -m benchmarks.geminiScheduler, correctness is covered in tests/test_llmScheduler.py
+'''
+import argparse
+import asyncio
+import time
+
+from google import genai
+from google.genai import errors, types
+
+from app.agents.geminiClient import GeminiClient
+from app.agents.llmScheduler import LLMScheduler, ModelLimits
+from app.models import GenerateRequest
+from benchmarks.geminiStub import geminiStub
+
+MODEL = "gemini-2.5-flash"
+
+
+def sdk_client(url: str) -> genai.Client:
+    return genai.Client(api_key="benchmark", http_options={"base_url": url})
+
+
+async def blocking(client, prompt):
+    # the old GeminiClient.generate_completion, sync call inside an async method
+    return client.models.generate_content(
+        model=MODEL, contents=prompt, config=types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=0))
+    )
+
+
+async def unthrottled(client, prompt):
+    return await client.aio.models.generate_content(
+        model=MODEL, contents=prompt, config=types.GenerateContentConfig(thinking_config=types.ThinkingConfig(thinking_budget=0))
+    )
+
+
+async def timed(label, stub, calls):
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    elapsed = time.perf_counter() - t0
+    failed = [r for r in results if isinstance(r, Exception)]
+    limited = sum(isinstance(r, errors.APIError) and r.code == 429 for r in failed)
+    ok = len(results) - len(failed)
+    print(
+        f"{label:<28} {elapsed:7.2f}s {ok / elapsed:7.1f} req/s {ok:>4} ok {len(failed):>4} failed"
+        f" ({limited} 429) {stub.stats['rate_limited']:>4} 429s served, peak {stub.stats['peak_in_flight']} in flight"
+    )
+    return results, elapsed
+
+
+def reset(stub):
+    stub.calls.clear()
+    stub.order.clear()
+    stub.stats.update(requests=0, rate_limited=0, peak_in_flight=0)
+
+
+async def throughput(url, stub, requests, in_flight):
+    print(f"\n{requests} requests, {stub.latency * 1000:.0f}ms per call, no endpoint limit")
+    stub.rpm = None
+    prompts = [f"prompt {i}" for i in range(requests)]
+
+    reset(stub)
+    client = sdk_client(url)
+    _, slow = await timed("blocking sync client", stub, [blocking(client, p) for p in prompts])
+
+    reset(stub)
+    gemini = GeminiClient(
+        scheduler=LLMScheduler(default=ModelLimits(rpm=10_000, max_in_flight=in_flight)), client=sdk_client(url)
+    )
+    _, fast = await timed(f"scheduled, {in_flight} in flight", stub, [gemini.generate_completion(GenerateRequest(prompt=p)) for p in prompts])
+    print(f"{'speedup':<28} {slow / fast:7.1f}x")
+
+
+async def rate_limited(url, stub, requests, rpm, window, in_flight):
+    print(f"\n{requests} requests, endpoint allows {rpm} per {window:.0f}s window")
+    stub.rpm = rpm
+    stub.window = window
+    prompts = [f"prompt {i}" for i in range(requests)]
+
+    reset(stub)
+    client = sdk_client(url)
+    await timed("unthrottled async", stub, [unthrottled(client, p) for p in prompts])
+
+    # the scheduler's window is shortened to the stub's so the run takes seconds
+    await asyncio.sleep(window)
+    reset(stub)
+    gemini = GeminiClient(
+        scheduler=LLMScheduler(default=ModelLimits(rpm=rpm, window=window, max_in_flight=in_flight)), client=sdk_client(url)
+    )
+    background = [gemini.generate_completion(GenerateRequest(prompt=p)) for p in prompts]
+    urgent = [gemini.generate_completion(GenerateRequest(prompt=f"urgent {i}", priority=0)) for i in range(3)]
+    await timed("scheduled at the limit", stub, background + urgent)
+    # the urgent calls were submitted last but jump the queue of waiting requests
+    positions = [stub.order.index(f"urgent {i}") for i in range(3) if f"urgent {i}" in stub.order]
+    print(f"{'urgent calls served at':<28} {positions} of {len(stub.order)}")
+
+    await asyncio.sleep(window)
+    reset(stub)
+    scheduler = LLMScheduler(default=ModelLimits(rpm=rpm * 2, window=window, max_in_flight=in_flight), backoff=window / 8, max_backoff=window)
+    gemini = GeminiClient(scheduler=scheduler, client=sdk_client(url))
+    await timed("scheduled, limit set too high", stub, [gemini.generate_completion(GenerateRequest(prompt=p)) for p in prompts])
+    print(f"{'scheduler':<28} {scheduler.report()}")
+
+
+async def run(args):
+    stub = geminiStub(latency=args.latency)
+    url, server = stub.serve()
+    try:
+        await throughput(url, stub, args.requests, args.in_flight)
+        await rate_limited(url, stub, args.requests, args.rpm, args.window, args.in_flight)
+    finally:
+        server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=48)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--in-flight", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=30, help="requests the fake endpoint allows per window")
+    parser.add_argument("--window", type=float, default=4.0, help="length of the fake endpoint's rate limit window, seconds")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
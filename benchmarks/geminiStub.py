@@ -0,0 +1,85 @@
+'''
+Local stand-in for the Gemini generateContent endpoint
+Runs under uvicorn on its own thread, answers every call after a fixed latency and enforces a
+server side requests per minute limit per model with 429 RESOURCE_EXHAUSTED, like the real API
+The SDK is pointed at it with genai.Client(api_key=..., http_options={"base_url": url})
+'''
+import asyncio
+import collections
+import threading
+import time
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks.mcpStub import free_port
+
+
+class geminiStub:
+
+    def __init__(self, latency: float = 0.2, rpm: float = None, window: float = 60.0):
+        self.latency = latency
+        self.rpm = rpm
+        self.window = window
+        self.calls = collections.defaultdict(collections.deque)
+        self.stats = {"requests": 0, "rate_limited": 0, "in_flight": 0, "peak_in_flight": 0}
+        self.order = []
+
+    def limited(self, model: str) -> bool:
+        if self.rpm is None:
+            return False
+        now = time.monotonic()
+        calls = self.calls[model]
+        while calls and now - calls[0] >= self.window:
+            calls.popleft()
+        if len(calls) >= self.rpm:
+            return True
+        calls.append(now)
+        return False
+
+    async def generate(self, request):
+        model = request.path_params["model"].split(":")[0]
+        body = await request.json()
+        self.stats["requests"] += 1
+        if self.limited(model):
+            self.stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"code": 429, "message": "Resource has been exhausted (e.g. check quota).", "status": "RESOURCE_EXHAUSTED"}},
+                status_code=429,
+            )
+
+        self.stats["in_flight"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.stats["in_flight"] -= 1
+
+        text = body["contents"][0]["parts"][0]["text"] if body.get("contents") else ""
+        self.order.append(text)
+        prompt_tokens = len(text) // 4 + 1
+        return JSONResponse({
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": f"echo: {text}"}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 8, "totalTokenCount": prompt_tokens + 8},
+            "modelVersion": model,
+        })
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[Route("/{version}/models/{model:path}", self.generate, methods=["POST"])])
+
+    def serve(self):
+        '''
+        Starts the stub in the background, returns (base url, uvicorn server)
+        '''
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(self.app(), host="127.0.0.1", port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        return f"http://127.0.0.1:{port}", server
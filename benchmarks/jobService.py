@@ -0,0 +1,119 @@
+'''
+Many rebalance requests against the job API, compared with solving them one at a time the way
+the static optimizer script does (load prices, estimate, solve, allocate per request)
+Requests spread over a few universes, prices come from a synthetic FixtureSource with a fixed
+latency per upstream call, and every job is followed over its server sent event stream
+Run from the repository root: python -m benchmarks.jobService
+'''
+import argparse
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from app.data.priceLoader import FixtureSource, PriceLoader
+from app.main import create_app
+from app.models import RebalanceRequest
+from app.portfolio import rebalance
+from benchmarks.mcpStub import free_port
+
+START, END = "2019-01-01", "2024-01-01"
+
+
+def make_requests(count, universes, seed):
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        objective = rng.choice(["max_sharpe", "min_volatility"])
+        requests.append(RebalanceRequest(
+            tickers=rng.sample(universes, 1)[0],
+            start=START,
+            end=END,
+            objective=objective,
+            total_portfolio_value=rng.choice([5_000, 15_000, 50_000, 250_000]),
+        ))
+    return requests
+
+
+def one_at_a_time(loader, requests):
+    results = []
+    for request in requests:
+        estimate = rebalance.estimate(loader.load(request.tickers, request.start, request.end))
+        results.append(rebalance.solve_batch(estimate, [request.model_dump()])[0])
+    return results
+
+
+async def follow(client, job_id):
+    # reads the event stream until the job reports done or failed
+    async with client.stream("GET", f"/jobs/{job_id}/events") as response:
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                event = json.loads(line[len("data: "):])
+        return event
+
+
+async def through_service(url, requests):
+    async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+        # clients arrive independently, one POST each
+        submitted = await asyncio.gather(*(client.post("/jobs", json=r.model_dump()) for r in requests))
+        jobs = [response.json()["id"] for response in submitted]
+        final = await asyncio.gather(*(follow(client, job_id) for job_id in jobs))
+        stats = (await client.get("/stats")).json()
+    return final, stats
+
+
+def serve(app):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}", server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--universes", type=int, default=4)
+    parser.add_argument("--assets", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    tickers = [f"T{i:03d}" for i in range(args.assets * args.universes)]
+    universes = [tickers[i * args.assets:(i + 1) * args.assets] for i in range(args.universes)]
+    requests = make_requests(args.requests, universes, seed=7)
+    print(f"{args.requests} requests over {args.universes} universes of {args.assets} assets, {args.latency * 1000:.0f}ms per price load")
+
+    source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+    t0 = time.perf_counter()
+    expected = one_at_a_time(PriceLoader(source), requests)
+    sequential = time.perf_counter() - t0
+    print(f"{'one at a time':<22} {sequential:7.2f}s {source.calls:>4} price loads {len(requests):>4} estimates")
+
+    source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+    url, server = serve(create_app(loader=PriceLoader(source), max_workers=args.workers))
+    try:
+        t0 = time.perf_counter()
+        final, stats = asyncio.run(through_service(url, requests))
+        elapsed = time.perf_counter() - t0
+    finally:
+        server.should_exit = True
+    print(f"{'job service':<22} {elapsed:7.2f}s {source.calls:>4} price loads {stats['estimates']:>4} estimates   {sequential / elapsed:.1f}x")
+    print(f"{'service stats':<22} {stats}")
+
+    assert all(job["status"] == "done" for job in final)
+    for job, result in zip(final, expected):
+        assert job["result"]["weights"] == result["weights"] and job["result"]["allocation"] == result["allocation"]
+    assert stats["estimates"] == args.universes
+
+
+if __name__ == "__main__":
+    main()
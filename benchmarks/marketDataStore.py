@@ -0,0 +1,129 @@
+'''
+Market data handed to process pool workers as a pickled DataFrame, compared with a MarketDataStore
+snapshot that the workers attach to
+    per task     the returns frame is pickled into every task, the way solve_batch received an Estimate
+    per worker   the frame is pickled once into each worker through the pool initializer
+    shared       tasks carry a SnapshotHandle, workers map the one segment the publisher wrote
+Each task scores a block of random weight vectors against the full returns matrix. Reports the
+time to the first result, the total time, and worker memory split into private (RssAnon) and
+shared (RssShmem) pages
+Run from the repository root: python -m benchmarks.marketDataStore
+'''
+import argparse
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.data.marketDataStore import MarketDataStore, attach
+
+# the frame a per worker pool was initialized with
+worker_frame = None
+
+
+def init_worker(frame):
+    global worker_frame
+    worker_frame = frame
+
+
+def memory() -> dict:
+    # kB of private and shared resident pages of this process
+    fields = {}
+    with open("/proc/self/status") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if name in ("RssAnon", "RssShmem"):
+                fields[name] = int(value.split()[0])
+    return fields
+
+
+def score(returns: np.ndarray, seed: int, portfolios: int) -> np.ndarray:
+    weights = np.random.default_rng(seed).dirichlet(np.ones(returns.shape[1]), portfolios).T
+    daily = returns @ weights
+    return daily.mean(axis=0) / daily.std(axis=0)
+
+
+def task_pickled(frame, seed, portfolios):
+    return score(frame.to_numpy(), seed, portfolios), memory()
+
+
+def task_worker(seed, portfolios):
+    return score(worker_frame.to_numpy(), seed, portfolios), memory()
+
+
+def task_shared(handle, seed, portfolios):
+    return score(attach(handle).returns, seed, portfolios), memory()
+
+
+def run(workers, submit, tasks, initializer=None, initargs=()):
+    context = multiprocessing.get_context("spawn")
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=initializer, initargs=initargs) as pool:
+        futures = [submit(pool, seed) for seed in range(tasks)]
+        futures[0].result()
+        first = time.perf_counter() - t0
+        results = [future.result() for future in futures]
+    total = time.perf_counter() - t0
+    scores = np.concatenate([r[0] for r in results])
+    # the last report of each worker is its high water mark, take the largest
+    peak = {name: max(r[1][name] for r in results) for name in ("RssAnon", "RssShmem")}
+    return first, total, scores, peak
+
+
+def synthetic_returns(assets, days, seed):
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2014-01-01", periods=days + 1)
+    steps = rng.normal(0.0004, rng.uniform(0.01, 0.03, assets), (days + 1, assets))
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)), index=dates, columns=[f"T{i:04d}" for i in range(assets)])
+    return prices, prices.pct_change().dropna(how="all")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=2520)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--tasks", type=int, default=16)
+    parser.add_argument("--portfolios", type=int, default=32)
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.WARNING)
+
+    prices, returns = synthetic_returns(args.assets, args.days, seed=0)
+    print(f"{args.days} days x {args.assets} assets ({returns.values.nbytes / 2**20:.0f} MiB of returns), "
+          f"{args.workers} workers, {args.tasks} tasks of {args.portfolios} portfolios")
+
+    store = MarketDataStore()
+    t0 = time.perf_counter()
+    handle = store.publish(prices)
+    published = time.perf_counter() - t0
+    print(f"{'publish':<12} {published:7.3f}s {handle.nbytes / 2**20:7.0f} MiB segment")
+
+    cases = {
+        "per task": lambda: run(args.workers, lambda pool, seed: pool.submit(task_pickled, returns, seed, args.portfolios), args.tasks),
+        "per worker": lambda: run(
+            args.workers, lambda pool, seed: pool.submit(task_worker, seed, args.portfolios), args.tasks, init_worker, (returns,)
+        ),
+        "shared": lambda: run(args.workers, lambda pool, seed: pool.submit(task_shared, handle, seed, args.portfolios), args.tasks),
+    }
+
+    print(f"{'':<12} {'first':>8} {'total':>8} {'private MiB':>12} {'shared MiB':>11}")
+    outcomes = {}
+    try:
+        for name, case in cases.items():
+            first, total, scores, peak = case()
+            outcomes[name] = scores
+            print(f"{name:<12} {first:7.3f}s {total:7.3f}s {peak['RssAnon'] / 1024:12.0f} {peak['RssShmem'] / 1024:11.0f}")
+    finally:
+        store.retire(handle)
+
+    for name, scores in outcomes.items():
+        assert np.array_equal(scores, outcomes["per task"]), name
+    assert store.report()["live"] == 0
+    print(f"{'store':<12} {store.report()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+'''
+One executor turn with a batch of tool calls against one call per turn, the way a 50 ticker
+get_data request used to run, using a stub MCP server and a fake LLM with a fixed response time
+Run from the repository root: python -m benchmarks.mcpBatch
+'''
+import argparse
+import asyncio
+import json
+import time
+
+from app.mcp.client.contextManager import FAILURES_HEADER
+from app.mcp.client.mcpExecutor import mcpExecutor
+from app.models import ChatResponse
+from benchmarks.mcpStub import serve_stub
+
+
+class FakeLLM:
+    '''
+    Answers every chat request with the next scripted response after a fixed delay
+    '''
+
+    def __init__(self, responses, latency):
+        self.responses = iter(responses)
+        self.latency = latency
+        self.calls = 0
+
+    async def chat_completion(self, request):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return ChatResponse(response=next(self.responses))
+
+
+def new_state(servers):
+    return {
+        "servers": servers, "tools": [], "errors": [], "execution_log": [],
+        "messages": [{"role": "user", "parts": [{"text": "Fetch data for every holding"}]}],
+        "arguments": {}, "context": [], "problemStatus": False,
+    }
+
+
+async def turns(executor, state, count):
+    for _ in range(count):
+        await executor.getArguments(state)
+        await executor.executeTool(state)
+    return state
+
+
+async def run(server, tickers, llm_latency, per_server):
+    calls = [{"tool": "s0_tool_0", "args": {"ticker": ticker, "limit": "5"}} for ticker in tickers]
+
+    # one call per model turn
+    single = [json.dumps({"tool": call["tool"], "args": call["args"]}) for call in calls]
+    executor = mcpExecutor(FakeLLM(single, llm_latency), max_calls_per_server=per_server)
+    state = await executor.initialize(new_state([server]))
+    t0 = time.perf_counter()
+    state = await turns(executor, state, len(calls))
+    sequential = time.perf_counter() - t0
+    print(f"{'one call per turn':<24} {sequential:7.2f}s {executor.llm.calls:>4} LLM turns {len(state['context']):>4} results")
+
+    # the whole batch in one turn, with bad and malformed calls that should not sink the rest
+    batch = calls + [{"tool": "s0_tool_0", "args": {"limit": 5}}, {"tool": "missing_tool", "args": {}}, {"args": {"ticker": "X"}}]
+    executor = mcpExecutor(FakeLLM([json.dumps({"completed": False, "calls": batch})], llm_latency), max_calls_per_server=per_server)
+    state = await executor.initialize(new_state([server]))
+    t0 = time.perf_counter()
+    state = await turns(executor, state, 1)
+    batched = time.perf_counter() - t0
+    parts = [part["text"] for part in state["messages"][-1]["parts"]]
+    failed = len(parts) - 1 - parts.index(FAILURES_HEADER)
+    print(f"{'batched turn':<24} {batched:7.2f}s {executor.llm.calls:>4} LLM turns {len(state['context']):>4} results {failed:>3} failed")
+    print(f"{'speedup':<24} {sequential / batched:7.1f}x")
+
+    assert len(state["context"]) == len(tickers) and failed == 3
+    assert sorted(json.loads(r)["ticker"] for r in state["context"]) == sorted(tickers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every MCP request")
+    parser.add_argument("--per-server", type=int, default=8)
+    args = parser.parse_args()
+
+    server, stub = serve_stub("s0", 1, args.latency)
+    tickers = [f"T{i:03d}" for i in range(args.tickers)]
+    print(f"{args.tickers} tickers, {args.llm_latency * 1000:.0f}ms per LLM turn, {args.latency * 1000:.0f}ms per MCP request")
+    asyncio.run(run(server, tickers, args.llm_latency, args.per_server))
+    stub.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
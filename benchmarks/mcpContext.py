@@ -0,0 +1,116 @@
+'''
+Prompt size and LLM time over a long tool session, raw history against the context manager
+Each turn calls one tool that returns a year of daily bars, and the fake LLM's response time grows
+with the prompt it is sent, the way a real model's prefill does
+Run from the repository root: python -m benchmarks.mcpContext
+'''
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from mcp.server.fastmcp import FastMCP
+
+from app.mcp.client.contextManager import collapse, contextManager, message_text
+from app.mcp.client.mcpExecutor import mcpExecutor
+from app.models import ChatResponse
+from app.tokens import estimate_tokens
+from benchmarks.mcpStub import serve_stub
+
+
+class FakeLLM:
+    '''
+    Answers with the next scripted response after base + per_token * prompt tokens seconds
+    '''
+
+    def __init__(self, responses, base, per_token):
+        self.responses = iter(responses)
+        self.base = base
+        self.per_token = per_token
+        self.prompts = []
+
+    async def chat_completion(self, request):
+        tokens = estimate_tokens(request.system_prompt, *(message_text(m) for m in request.messages))
+        self.prompts.append(tokens)
+        await asyncio.sleep(self.base + self.per_token * tokens)
+        return ChatResponse(response=next(self.responses))
+
+
+def history_server(points):
+    mcp = FastMCP("history", log_level="WARNING")
+
+    @mcp.tool()
+    def get_history(ticker: str) -> str:
+        '''Daily closes for a ticker'''
+        return json.dumps({"ticker": ticker, "t": list(range(points)), "c": [100.0 + i / 7 for i in range(points)]})
+
+    return mcp
+
+
+def new_state(servers):
+    return {
+        "servers": servers, "tools": [], "errors": [], "execution_log": [],
+        "messages": [{"role": "user", "parts": [{"text": "Collect the history of every holding one at a time"}]}],
+        "arguments": {}, "context": [], "problemStatus": False,
+    }
+
+
+async def session(server, tickers, args, **options):
+    responses = [json.dumps({"completed": False, "calls": [{"tool": "get_history", "args": {"ticker": t}}]}) for t in tickers]
+    executor = mcpExecutor(FakeLLM(responses, args.base, args.per_token), **options)
+    state = await executor.initialize(new_state([server]))
+    t0 = time.perf_counter()
+    for _ in tickers:
+        await executor.getArguments(state)
+        await executor.executeTool(state)
+    return time.perf_counter() - t0, executor.llm.prompts, state
+
+
+async def run(args):
+    logging.getLogger("app").setLevel(logging.WARNING)
+    server, uv = serve_stub("history", mcp=history_server(args.points), latency=0)
+    tickers = [f"T{i:02d}" for i in range(args.turns)]
+    try:
+        # inlining everything with no budget is the old behaviour
+        raw_time, raw, raw_state = await session(server, tickers, args, context_budget=10**9, inline_chars=10**9)
+        managed_time, managed, state = await session(server, tickers, args, context_budget=args.budget)
+    finally:
+        uv.should_exit = True
+
+    print(f"{args.turns} turns, one {len(raw_state['context'][0]) / 1024:.1f} KiB result per turn, budget {args.budget} tokens")
+    print(f"{'turn':>6} {'raw tokens':>12} {'managed tokens':>16}")
+    for turn in range(0, args.turns, max(1, args.turns // 8)):
+        print(f"{turn + 1:>6} {raw[turn]:>12} {managed[turn]:>16}")
+    print(f"{'total':>6} {sum(raw):>12} {sum(managed):>16}")
+    print(f"{'raw history':<24} {raw_time:7.2f}s")
+    print(f"{'context manager':<24} {managed_time:7.2f}s   {raw_time / managed_time:.1f}x faster")
+    print(f"{'last turn log':<24} {state['execution_log'][-1]}")
+
+    assert max(managed) <= args.budget
+    assert state["context"] == raw_state["context"]
+
+    # multi line results and failures collapse as units, to their reference and label only
+    manager, scratch = contextManager(), {"context": []}
+    csv = "date,close\n" + "\n".join(f"2024-01-{d:02d},{100 + d}" for d in range(1, 20))
+    message = manager.results_message(
+        [manager.record(scratch, "get_csv(AAPL)", csv), manager.record(scratch, "get_history(T00)", raw_state["context"][0])],
+        [manager.failure("get_history(T99)", json.dumps({"error": "unknown ticker\nT99"}))],
+    )
+    assert message_text(collapse(message)).splitlines()[1:] == [
+        "get_csv(AAPL) -> context[0]", "get_history(T00) -> context[1]", "Earlier failed calls:", "get_history(T99) -> failed",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--points", type=int, default=252)
+    parser.add_argument("--budget", type=int, default=2_000)
+    parser.add_argument("--base", type=float, default=0.05)
+    parser.add_argument("--per-token", type=float, default=0.00002, help="seconds of model time per prompt token")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+'''
+Cold and warm mcpExecutor.initialize against several local stub MCP servers
+    sequential  one server after another, the previous per-run handshake loop
+    concurrent  every server brought up at once by the session manager
+    warm        a second run reusing the cached sessions and tool lists
+Run from the repository root: python -m benchmarks.mcpSessions
+'''
+import argparse
+import asyncio
+import time
+
+from app.mcp.client.mcpExecutor import mcpExecutor
+from app.mcp.client.sessionManager import sessionManager
+from benchmarks.mcpStub import serve_stub
+
+
+def new_state(servers):
+    return {
+        "servers": servers, "tools": [], "errors": [], "execution_log": [],
+        "messages": [], "arguments": {}, "context": [], "problemStatus": False,
+    }
+
+
+async def sequential(executor, servers):
+    # one fresh manager per server so nothing is shared, mirrors the per-run loop it replaced
+    tools = []
+    for server in servers:
+        manager = sessionManager(executor.transport)
+        await manager.get(server)
+        tools += manager.tools([server])
+    return tools
+
+
+async def timed(coro):
+    t0 = time.perf_counter()
+    result = await coro
+    return result, time.perf_counter() - t0
+
+
+async def run(servers, tools_per_server):
+    executor = mcpExecutor(None)
+    expected = len(servers) * tools_per_server
+
+    tools, elapsed = await timed(sequential(executor, servers))
+    print(f"{'sequential cold':<22} {elapsed * 1000:9.1f}ms {len(tools):>5} tools")
+    state, elapsed = await timed(executor.initialize(new_state(servers)))
+    print(f"{'concurrent cold':<22} {elapsed * 1000:9.1f}ms {len(state['tools']):>5} tools")
+    state, elapsed = await timed(executor.initialize(new_state(servers)))
+    print(f"{'warm':<22} {elapsed * 1000:9.1f}ms {len(state['tools']):>5} tools")
+    assert len(tools) == len(state["tools"]) == expected
+
+    # a session the server no longer knows is re-established transparently
+    server = servers[0]
+    executor.sessions.sessions[server].headers["Mcp-Session-Id"] = "expired"
+    result, elapsed = await timed(executor.make_request("tools/call", {"name": "s0_tool_0", "arguments": {"ticker": "AAPL"}}, server))
+    assert "AAPL" in result, result
+    print(f"{'rejected session call':<22} {elapsed * 1000:9.1f}ms {executor.sessions.report()}")
+    await executor.transport.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", type=int, default=8)
+    parser.add_argument("--tools", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every HTTP request")
+    args = parser.parse_args()
+
+    stubs = [serve_stub(f"s{i}", args.tools, args.latency) for i in range(args.servers)]
+    servers = [url for url, _ in stubs]
+    print(f"{args.servers} stub servers x {args.tools} tools, {args.latency * 1000:.0f}ms per request")
+    asyncio.run(run(servers, args.tools))
+    for _, server in stubs:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+'''
+Local streamable HTTP MCP servers for the client benchmarks
+Each stub runs a FastMCP app under uvicorn on its own thread, with tools_per_server echo tools
+and a fixed latency added to every HTTP request to stand in for the network
+'''
+import asyncio
+import socket
+import threading
+import time
+
+import uvicorn
+from mcp.server.fastmcp import FastMCP
+
+
+class LatencyMiddleware:
+
+    def __init__(self, app, latency: float):
+        self.app = app
+        self.latency = latency
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.latency:
+            await asyncio.sleep(self.latency)
+        await self.app(scope, receive, send)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_stub(name: str, tools_per_server: int, prefix: str = None) -> FastMCP:
+    mcp = FastMCP(name, log_level="WARNING")
+    prefix = prefix or name
+
+    for i in range(tools_per_server):
+        def echo(ticker: str, start: str = None, end: str = None, limit: int = 10, i=i) -> dict:
+            return {"tool": i, "ticker": ticker, "start": start, "end": end, "limit": limit}
+
+        mcp.add_tool(echo, name=f"{prefix}_tool_{i}", description=f"Echo tool {i} of {name}")
+    return mcp
+
+
+def serve_stub(name: str, tools_per_server: int = 10, latency: float = 0.02, prefix: str = None, mcp: FastMCP = None):
+    '''
+    Starts a stub server in the background, returns (url, uvicorn server)
+    '''
+    mcp = mcp or build_stub(name, tools_per_server, prefix)
+    port = free_port()
+    config = uvicorn.Config(
+        LatencyMiddleware(mcp.streamable_http_app(), latency), host="127.0.0.1", port=port, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://127.0.0.1:{port}/mcp", server
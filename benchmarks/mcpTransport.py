@@ -0,0 +1,122 @@
+'''
+Streamable HTTP handling of mcpTransport against a stub MCP server that answers over SSE
+    parser      throughput of sseParser over a stream fed in random chunks
+    buffered    the previous make_request path, httpx defaults and response.json() on the body
+    streamed    sessionManager.stream, messages handed out as their events complete
+Run from the repository root: python -m benchmarks.mcpTransport, correctness is covered in tests/test_mcpTransport.py
+'''
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from uuid import uuid4
+
+import httpx
+
+from mcp.server.fastmcp import Context, FastMCP
+
+from app.mcp.client.mcpTransport import mcpTransport, sseParser
+from app.mcp.client.sessionManager import sessionManager
+from benchmarks.mcpStub import serve_stub
+
+
+def build_server() -> FastMCP:
+    mcp = FastMCP("transport", log_level="WARNING")
+
+    @mcp.tool()
+    async def report(rows: int, steps: int = 5, ctx: Context = None) -> str:
+        # progress events first, then one large result
+        for step in range(steps):
+            await ctx.report_progress(step + 1, steps, f"step {step + 1}")
+            await asyncio.sleep(0.05)
+        return json.dumps({"rows": [[i, i * 0.5, f"row{i}"] for i in range(rows)]})
+
+    return mcp
+
+
+def time_parser():
+    events = [{"event": "message", "data": json.dumps({"id": i, "text": "x" * random.randint(0, 5000)}), "id": str(i)} for i in range(200)]
+    stream = "".join(f": keepalive\r\nid: {e['id']}\r\ndata: {e['data']}\r\n\r\n" for e in events)
+    t0 = time.perf_counter()
+    for trial in range(50):
+        parser, parsed, i = sseParser(), [], 0
+        while i < len(stream):
+            j = i + random.randint(1, 4096)
+            parsed += parser.feed(stream[i:j])
+            i = j
+        parsed += parser.flush()
+    elapsed = time.perf_counter() - t0
+    print(f"{'parser':<10} {len(events)} events x 50 random chunkings, {50 * len(stream) / 2**20 / elapsed:.0f} MiB/s")
+
+
+async def buffered(server, session, payload):
+    # the previous path: default client, whole body in memory, then response.json()
+    async with httpx.AsyncClient() as client:
+        response = await client.post(server, headers=session.headers, json=payload)
+        try:
+            return response.json()
+        except json.JSONDecodeError as e:
+            return {"error": f"response.json() on {response.headers['content-type']}: {e}"}
+
+
+async def streamed(sessions, server, payload, marks):
+    t0 = time.perf_counter()
+    async for message in sessions.stream(server, payload):
+        marks.append((time.perf_counter() - t0, message.get("method", "response")))
+        if message.get("id") == payload["id"]:
+            return message
+
+
+async def run(server, rows, calls):
+    transport = mcpTransport(max_connections=32, max_keepalive_connections=32)
+    sessions = sessionManager(transport)
+    session = await sessions.get(server)
+    request_id = str(uuid4())
+    payload = {
+        "jsonrpc": "2.0",
+        "id": request_id,
+        "method": "tools/call",
+        "params": {"name": "report", "arguments": {"rows": rows}, "_meta": {"progressToken": request_id}},
+    }
+
+    result = await buffered(server, session, payload)
+    print(f"{'buffered':<10} {str(result)[:110]}")
+
+    marks = []
+    tracemalloc.start()
+    message = await streamed(sessions, server, payload, marks)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    text = message["result"]["content"][0]["text"]
+    first = marks[0]
+    print(
+        f"{'streamed':<10} {len(marks)} messages, first {first[1]} after {first[0] * 1000:.0f}ms, "
+        f"result {len(text) / 2**20:.1f} MiB after {marks[-1][0] * 1000:.0f}ms, peak {peak / 2**20:.1f} MiB"
+    )
+
+    # many small concurrent calls over the pooled client
+    small = lambda: {"jsonrpc": "2.0", "id": str(uuid4()), "method": "tools/call", "params": {"name": "report", "arguments": {"rows": 10, "steps": 1}}}
+    t0 = time.perf_counter()
+    responses = await asyncio.gather(*(sessions.request(server, small()) for _ in range(calls)))
+    elapsed = time.perf_counter() - t0
+    failed = sum("result" not in r for r in responses)
+    print(f"{'pooled':<10} {calls} concurrent calls in {elapsed:.2f}s, {failed} failed, http2={transport.http2}")
+    await transport.aclose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--calls", type=int, default=100)
+    args = parser.parse_args()
+
+    time_parser()
+    server, stub = serve_stub("transport", latency=0.0, mcp=build_server())
+    asyncio.run(run(server, args.rows, args.calls))
+    stub.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+'''
+Optimizer workflow, the old strict chain against the compiled graph
+    chain      every node in order, one ticker's history after another
+    cold       the graph with per ticker history branches and plot beside variables, empty node cache
+    warm       a new Optimizer (a new process) over the same SQLite node cache
+Prices come from a synthetic FixtureSource with a fixed latency per upstream call
+Run from the repository root: python -m benchmarks.optimizerGraph
+'''
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+from app.agents.graphCache import SqliteCache
+from app.agents.optimizer import Optimizer
+from app.data.priceLoader import FixtureSource, PriceLoader
+from app.models import GenerateResponse
+
+START, END = "2019-01-01", "2024-01-01"
+
+
+class FakeLLM:
+
+    async def generate_completion(self, request):
+        await asyncio.sleep(0.05)
+        return GenerateResponse(response=START)
+
+
+def new_optimizer(source, cache_path, output_dir):
+    return Optimizer(llm=FakeLLM(), loader=PriceLoader(source), cache=SqliteCache(cache_path), output_dir=output_dir)
+
+
+async def chain(optimizer, tickers):
+    # the same nodes run one after another, the way the unconnected chain was laid out
+    state = {"ticker": tickers, "servers": [], "startDate": None, "endDate": END, "history": {}, "errors": [], "executionlog": []}
+    state.update(await optimizer.initialize(state))
+    for ticker in tickers:
+        update = await optimizer.history({"ticker": ticker, "startDate": state["startDate"], "endDate": state["endDate"]})
+        state["history"].update(update.get("history", {}))
+    for node in (optimizer.plot, optimizer.variables, optimizer.optimize):
+        state.update(await node(state))
+    return state
+
+
+async def run(args):
+    logging.getLogger("app").setLevel(logging.WARNING)
+    tickers = [f"T{i:03d}" for i in range(args.tickers)]
+
+    with tempfile.TemporaryDirectory() as root:
+        cache_path = os.path.join(root, "optimizer.sqlite")
+        print(f"{args.tickers} tickers, {args.latency * 1000:.0f}ms per history fetch")
+
+        source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+        t0 = time.perf_counter()
+        expected = await chain(new_optimizer(source, os.path.join(root, "chain.sqlite"), root), tickers)
+        sequential = time.perf_counter() - t0
+        print(f"{'strict chain':<24} {sequential:7.2f}s {source.calls:>4} upstream calls")
+
+        source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+        optimizer = new_optimizer(source, cache_path, root)
+        t0 = time.perf_counter()
+        cold = await optimizer.run(tickers, endDate=END)
+        elapsed = time.perf_counter() - t0
+        print(f"{'graph, cold cache':<24} {elapsed:7.2f}s {source.calls:>4} upstream calls   {sequential / elapsed:.1f}x")
+
+        source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+        optimizer = new_optimizer(source, cache_path, root)
+        t0 = time.perf_counter()
+        warm = await optimizer.run(tickers, endDate=END)
+        elapsed = time.perf_counter() - t0
+        print(f"{'graph, warm cache':<24} {elapsed:7.2f}s {source.calls:>4} upstream calls   {sequential / elapsed:.1f}x")
+        print(f"{'node cache':<24} {optimizer.cache.report()}")
+
+        assert not cold["errors"] and not warm["errors"]
+        assert cold["weights"] == warm["weights"] == expected["weights"]
+        assert source.calls == 0 and os.path.exists(warm["plots"]["history"])
+
+        # a different range is a different key
+        source = FixtureSource.synthetic(tickers, START, END, latency=args.latency)
+        optimizer = new_optimizer(source, cache_path, root)
+        await optimizer.run(tickers, endDate="2023-06-01")
+        assert source.calls == len(tickers)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+'''
+Load test of the polygonMCP get_data tool against a local fake Polygon aggregates endpoint
+Compares the previous handler, which called the RESTClient on the event loop, with the pooled backend
+for N concurrent distinct tickers and N concurrent callers of the same ticker, then the response size
+of N get_data calls against one columnar get_bulk_data call
+The fake endpoint shares the CPU with the server, so on a single core the pooled run is bounded by
+JSON encode/decode rather than by the simulated latency
+Run from the repository root: python -m benchmarks.polygonLoad
+'''
+import argparse
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import tempfile
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from polygon.rest import RESTClient
+
+from app.data.priceCache import PriceCache
+from app.mcp.server.polygon import polygonMCP
+
+AGGS_PATH = re.compile(r"^/v2/aggs/ticker/([^/]+)/range/1/day/([^/]+)/([^/?]+)")
+TRADES_PATH = re.compile(r"^/v3/trades/([^/?]+)")
+
+
+class FakePolygon(BaseHTTPRequestHandler):
+    '''
+    Answers /v2/aggs daily range requests with deterministic bars and /v3/trades with
+    trades_per_day ticks over one session, paged through next_url, after a fixed latency
+    '''
+    latency = 0.1
+    trades_per_day = 200000
+    requests = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        aggs = AGGS_PATH.match(self.path)
+        trades = TRADES_PATH.match(self.path)
+        if not aggs and not trades:
+            self.send_error(404)
+            return
+        with FakePolygon.lock:
+            FakePolygon.requests += 1
+        time.sleep(self.latency)
+        body = self.aggs(*aggs.groups()) if aggs else self.trades(trades.group(1))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def trades(self, ticker):
+        query = parse_qs(urlparse(self.path).query)
+        limit = int(query.get("limit", ["1000"])[0])
+        cursor = int(query.get("cursor", ["0"])[0])
+        day = pd.Timestamp(query.get("timestamp", ["2024-06-03"])[0], tz="America/New_York")
+        count = max(min(limit, self.trades_per_day - cursor), 0)
+
+        rng = np.random.default_rng(cursor)
+        session = 6.5 * 3600 * 10**9
+        timestamps = day.value + 9.5 * 3600 * 10**9 + (np.arange(cursor, cursor + count) * session // self.trades_per_day)
+        prices = 100 + np.cumsum(rng.normal(0, 0.01, count))
+        sizes = rng.integers(1, 500, count)
+        results = [
+            {"sip_timestamp": int(ts), "price": round(float(p), 4), "size": int(s), "exchange": 4, "id": str(cursor + i)}
+            for i, (ts, p, s) in enumerate(zip(timestamps, prices, sizes))
+        ]
+        payload = {"status": "OK", "results": results}
+        if cursor + count < self.trades_per_day:
+            payload["next_url"] = f"http://fake/v3/trades/{ticker}?cursor={cursor + count}&limit={limit}&timestamp={day.date()}"
+        return json.dumps(payload).encode()
+
+    def aggs(self, ticker, start, end):
+        days = pd.bdate_range(start, end, tz="America/New_York")
+        rng = np.random.default_rng(abs(hash(ticker)) % (1 << 32))
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+        results = [
+            {"o": c, "h": c * 1.01, "l": c * 0.99, "c": c, "v": 1e6, "vw": c, "n": 100, "t": int(ts.timestamp() * 1000)}
+            for c, ts in zip(close, days)
+        ]
+        return json.dumps({"status": "OK", "ticker": ticker, "resultsCount": len(results), "results": results}).encode()
+
+    def log_message(self, *args):
+        pass
+
+
+def add_blocking_tool(server):
+    # the handler as it was before the backend, the whole fetch runs on the event loop
+    async def get_data_blocking(ticker, start, end):
+        return server.get_daily(ticker, start, end)
+
+    server.mcp.add_tool(get_data_blocking)
+
+
+async def blocking_get_data(server, ticker, start, end):
+    return await server.mcp.call_tool("get_data_blocking", {"ticker": ticker, "start": start, "end": end})
+
+
+async def pooled_get_data(server, ticker, start, end):
+    return await server.mcp.call_tool("get_data", {"ticker": ticker, "start": start, "end": end})
+
+
+async def run(handler, server, tickers, start, end):
+    t0 = time.perf_counter()
+    await asyncio.gather(*(handler(server, ticker, start, end) for ticker in tickers))
+    return time.perf_counter() - t0
+
+
+def scenario(name, handler, tickers, base, workers, start, end):
+    with tempfile.TemporaryDirectory() as root:
+        client = RESTClient("benchmark", base=base, retries=0)
+        server = polygonMCP("benchmark", cache=PriceCache(root), client=client, max_workers=workers)
+        add_blocking_tool(server)
+        FakePolygon.requests = 0
+        elapsed = asyncio.run(run(handler, server, tickers, start, end))
+        server.backend.close()
+        print(
+            f"{name:<32} {len(tickers):>5} calls {elapsed:8.3f}s {len(tickers) / elapsed:9.1f} calls/s "
+            f"{FakePolygon.requests:>5} upstream {server.backend.stats['coalesced']:>5} coalesced"
+        )
+        return elapsed
+
+
+def payload(content) -> int:
+    return sum(len(item.text.encode()) for item in content)
+
+
+def bulk_scenario(tickers, base, workers, start, end):
+    '''
+    Same universe as len(tickers) get_data calls versus single get_bulk_data calls, measured on the text
+    the MCP client would append to the LLM history (tokens estimated at 4 bytes each)
+    '''
+    cases = [
+        ("get_data per ticker", None),
+        ("get_bulk_data close", {}),
+        ("get_bulk_data close, 52 points", {"max_points": 52}),
+        ("get_bulk_data ohlcv", {"fields": ["o", "h", "l", "c", "v"]}),
+        ("get_bulk_data ohlcv, 52 points", {"fields": ["o", "h", "l", "c", "v"], "max_points": 52}),
+    ]
+    bulk = {}
+    for name, options in cases:
+        with tempfile.TemporaryDirectory() as root:
+            server = polygonMCP("benchmark", cache=PriceCache(root), client=RESTClient("benchmark", base=base), max_workers=workers)
+            t0 = time.perf_counter()
+            if options is None:
+                results = asyncio.run(run_all(server, "get_data", [
+                    {"ticker": ticker, "start": start, "end": end} for ticker in tickers
+                ]))
+            else:
+                results = asyncio.run(run_all(server, "get_bulk_data", [
+                    {"tickers": tickers, "start": start, "end": end, **options}
+                ]))
+            elapsed = time.perf_counter() - t0
+            size = sum(payload(content) for content in results)
+            server.backend.close()
+        if options is not None:
+            bulk[name] = json.loads(results[0][0].text)
+        print(f"{name:<32} {len(results):>5} calls {elapsed:8.3f}s {size / 1024:9.1f} KiB  ~{size // 4:>8} tokens")
+
+    # downsampled bars still cover every day: volume adds up, highs and lows are the extremes, closes match
+    full, weekly = bulk["get_bulk_data ohlcv"]["data"], bulk["get_bulk_data ohlcv, 52 points"]["data"]
+    for ticker, columns in full.items():
+        values = {field: [value for value in column if value is not None] for field, column in columns.items()}
+        folded = {field: [value for value in column if value is not None] for field, column in weekly[ticker].items()}
+        assert abs(sum(folded["v"]) - sum(values["v"])) <= 1e-6 * sum(values["v"])
+        assert max(folded["h"]) == max(values["h"]) and min(folded["l"]) == min(values["l"])
+        assert folded["o"][0] == values["o"][0] and folded["c"][-1] == values["c"][-1]
+
+
+async def run_all(server, tool, calls):
+    return await asyncio.gather(*(server.mcp.call_tool(tool, arguments) for arguments in calls))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds the fake endpoint waits per request")
+    args = parser.parse_args()
+
+    FakePolygon.latency = args.latency
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakePolygon)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_address[1]}"
+
+    start, end = "2024-01-01", "2024-12-31"
+    distinct = [f"T{i:04d}" for i in range(args.calls)]
+    same = ["AAPL"] * args.calls
+    print(f"fake polygon at {base}, {args.latency * 1000:.0f}ms per request, {args.workers} workers")
+
+    blocking = scenario("blocking, distinct tickers", blocking_get_data, distinct, base, args.workers, start, end)
+    pooled = scenario("pooled, distinct tickers", pooled_get_data, distinct, base, args.workers, start, end)
+    print(f"{'speedup':<32} {blocking / pooled:>8.1f}x")
+    blocking = scenario("blocking, same ticker", blocking_get_data, same, base, args.workers, start, end)
+    pooled = scenario("pooled, same ticker", pooled_get_data, same, base, args.workers, start, end)
+    print(f"{'speedup':<32} {blocking / pooled:>8.1f}x")
+
+    print()
+    bulk_scenario(distinct, base, args.workers, start, end)
+
+    # both paths must hand back the same bars
+    with tempfile.TemporaryDirectory() as root:
+        server = polygonMCP("benchmark", cache=PriceCache(root), client=RESTClient("benchmark", base=base), max_workers=2)
+        add_blocking_tool(server)
+        blocking = asyncio.run(blocking_get_data(server, "MSFT", start, end))
+        pooled = asyncio.run(pooled_get_data(server, "MSFT", start, end))
+        assert [item.text for item in blocking] == [item.text for item in pooled]
+        bulk = json.loads(asyncio.run(run_all(server, "get_bulk_data", [{"tickers": ["MSFT"], "start": start, "end": end}]))[0][0].text)
+        assert bulk["data"]["MSFT"]["c"] == [round(json.loads(item.text)["close"], 4) for item in pooled]
+        server.backend.close()
+
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+'''
+Compares the old per ticker download loop in staticOptimizer against the batched PriceLoader
+Run from the repository root: python -m benchmarks.priceLoader
+'''
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.data.priceLoader import FixtureSource, PriceLoader
+
+
+def naive_loop(source, tickers, start, end):
+    # same shape as the original staticOptimizer loop, one call and one column insert per ticker
+    df = pd.DataFrame()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", pd.errors.PerformanceWarning)
+        for stock in tickers:
+            df[stock] = source.fetch([stock], start, end)[stock]["close"]
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tickers", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per upstream call")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+    start, end = "2013-01-01", "2025-01-01"
+    source = FixtureSource.synthetic(tickers, start, end, latency=args.latency)
+
+    t0 = time.perf_counter()
+    naive = naive_loop(source, tickers, start, end)
+    naive_time = time.perf_counter() - t0
+    naive_calls, source.calls = source.calls, 0
+
+    loader = PriceLoader(source, batch_size=args.batch_size, max_workers=args.workers)
+    t0 = time.perf_counter()
+    batched = loader.load(tickers, start, end)
+    batched_time = time.perf_counter() - t0
+
+    assert np.allclose(naive.to_numpy(), batched.reindex(naive.index).to_numpy(), equal_nan=True)
+
+    print(f"{args.tickers} tickers x {len(batched)} days, {args.latency * 1000:.0f}ms per call")
+    print(f"naive loop   : {naive_time:8.3f}s  ({naive_calls} calls)")
+    print(f"PriceLoader  : {batched_time:8.3f}s  ({source.calls} calls)")
+    print(f"speedup      : {naive_time / batched_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+'''
+GeminiClient response cache against a local fake of the Gemini endpoint
+    repeated runs       the optimizer's start date prompt sent once per run, with and without the cache
+    restart             a new client (a new process) over the same cache directory
+    concurrent          identical requests in flight together share one call
+    bypass, ttl, lru    use_cache=False, expiry and eviction
+Run from the repository root: python -m benchmarks.responseCache
+'''
+import argparse
+import asyncio
+import logging
+import tempfile
+import time
+
+from google import genai
+
+from app.agents.geminiClient import GeminiClient
+from app.agents.llmScheduler import LLMScheduler, ModelLimits
+from app.agents.responseCache import ResponseCache
+from app.models import ChatRequest, GenerateRequest
+from benchmarks.geminiStub import geminiStub
+
+
+def new_client(url, cache):
+    return GeminiClient(
+        scheduler=LLMScheduler(default=ModelLimits(rpm=10_000)),
+        client=genai.Client(api_key="benchmark", http_options={"base_url": url}),
+        cache=cache,
+    )
+
+
+async def runs(client, prompt, count, use_cache=True):
+    t0 = time.perf_counter()
+    for _ in range(count):
+        response = await client.generate_completion(GenerateRequest(prompt=prompt, use_cache=use_cache))
+    return time.perf_counter() - t0, response
+
+
+def line(label, elapsed, stub, before):
+    print(f"{label:<28} {elapsed * 1000:9.1f}ms {stub.stats['requests'] - before:>4} upstream calls")
+
+
+async def run(args):
+    # the client logs every prompt and response at INFO
+    logging.getLogger("app").setLevel(logging.WARNING)
+    stub = geminiStub(latency=args.latency)
+    url, server = stub.serve()
+    with open("app/prompts/optimizer_startDate.txt", "r") as file:
+        prompt = file.read()
+
+    try:
+        with tempfile.TemporaryDirectory() as root:
+            print(f"{args.runs} runs of the start date prompt, {args.latency * 1000:.0f}ms per call")
+            before = stub.stats["requests"]
+            slow, expected = await runs(new_client(url, ResponseCache(ttl=3600)), prompt, args.runs, use_cache=False)
+            line("no cache", slow, stub, before)
+
+            cache = ResponseCache(ttl=3600, root=root)
+            before = stub.stats["requests"]
+            fast, response = await runs(new_client(url, cache), prompt, args.runs)
+            line("memory + disk cache", fast, stub, before)
+            print(f"{'speedup':<28} {slow / fast:9.1f}x")
+            print(f"{'cache':<28} {cache.report()}")
+            assert response == expected and stub.stats["requests"] - before == 1
+
+            # a new process starts with an empty memory tier but the same directory
+            restarted = ResponseCache(ttl=3600, root=root)
+            before = stub.stats["requests"]
+            elapsed, response = await runs(new_client(url, restarted), prompt, 1)
+            line("restart, disk tier", elapsed, stub, before)
+            assert response == expected and restarted.stats["disk_hits"] == 1 and stub.stats["requests"] == before
+
+            # chat requests with the same inputs in flight together
+            cache = ResponseCache(ttl=3600)
+            client = new_client(url, cache)
+            request = ChatRequest(tools=[], messages=[{"role": "user", "parts": [{"text": "Pick a start date"}]}])
+            before = stub.stats["requests"]
+            t0 = time.perf_counter()
+            responses = await asyncio.gather(*(client.chat_completion(request) for _ in range(args.concurrent)))
+            line(f"{args.concurrent} concurrent identical", time.perf_counter() - t0, stub, before)
+            assert len({r.response for r in responses}) == 1 and stub.stats["requests"] - before == 1
+            assert cache.stats["coalesced"] == args.concurrent - 1
+
+            # a different system prompt is a different key
+            await client.chat_completion(request.model_copy(update={"system_prompt": "Answer in one word"}))
+            before = stub.stats["requests"]
+            await client.chat_completion(request.model_copy(update={"use_cache": False}))
+            assert stub.stats["requests"] - before == 1 and cache.stats["bypassed"] == 1
+
+            # expiry and eviction
+            cache = ResponseCache(ttl=0.2, max_entries=2)
+            client = new_client(url, cache)
+            for text in ("a", "b", "c", "a"):
+                await client.generate_completion(GenerateRequest(prompt=text))
+            assert cache.stats["evictions"] == 2 and cache.stats["misses"] == 4
+            await asyncio.sleep(0.25)
+            await client.generate_completion(GenerateRequest(prompt="a"))
+            assert cache.stats["expired"] == 1 and cache.stats["misses"] == 5
+            print(f"{'ttl and lru':<28} {cache.report()}")
+    finally:
+        server.should_exit = True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--concurrent", type=int, default=16)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
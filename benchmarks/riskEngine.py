@@ -0,0 +1,61 @@
+'''
+Scores k random long only portfolios with the RiskEngine against the per weight np.dot loop
+Run from the repository root: python -m benchmarks.riskEngine
+'''
+import argparse
+import time
+
+import numpy as np
+
+from app.portfolio.riskEngine import RiskEngine
+
+
+def naive_loop(weights, mu, cov, risk_free_rate=0.02):
+    # the staticOptimizer computation repeated once per candidate
+    out = np.empty((len(weights), 4))
+    for i, w in enumerate(weights):
+        variance = np.dot(w.T, np.dot(cov, w))
+        volatility = np.sqrt(variance)
+        annual_return = np.sum(mu * w)
+        out[i] = annual_return, variance, volatility, (annual_return - risk_free_rate) / volatility
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=50)
+    parser.add_argument("--naive-limit", type=int, default=20000, help="largest k timed for the naive loop")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0005, 0.015, (2500, args.assets)) + rng.normal(0, 0.01, (2500, 1))
+    mu = returns.mean(axis=0) * 252
+    cov = np.cov(returns, rowvar=False) * 252
+    engine = RiskEngine(mu, cov)
+
+    print(f"{args.assets} assets")
+    print(f"{'k':>9} {'naive (s)':>12} {'engine (s)':>12} {'speedup':>9}")
+    for k in (1_000, 10_000, 100_000, 1_000_000):
+        weights = rng.dirichlet(np.ones(args.assets), size=k)
+
+        t0 = time.perf_counter()
+        metrics = engine.evaluate(weights)
+        engine_time = time.perf_counter() - t0
+
+        if k <= args.naive_limit:
+            t0 = time.perf_counter()
+            naive = naive_loop(weights, mu, cov)
+            naive_time = time.perf_counter() - t0
+            timed_k, timed_time = k, naive_time
+            assert np.allclose(naive[:, 1], metrics.variance) and np.allclose(naive[:, 3], metrics.sharpe)
+            label = f"{naive_time:12.4f}"
+        else:
+            # extrapolate linearly from the largest timed run
+            naive_time = timed_time / timed_k * k
+            label = f"~{naive_time:11.2f}"
+
+        print(f"{k:>9} {label} {engine_time:12.4f} {naive_time / engine_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+'''
+Dense covariance estimates against a low rank factor model as the universe grows
+For each size, on synthetic returns driven by a few true factors:
+    fit         sample covariance, Ledoit-Wolf, OAS and a PCA factor model
+    memory      n x n floats against n x (k + 1)
+    variance    w'Sw for a block of random portfolios
+    solve       unconstrained (KKT) and long only (active set) minimum variance
+    quality     realized volatility of each minimum variance portfolio over the following year
+Dense solves are skipped above --dense-max assets
+Run from the repository root: python -m benchmarks.riskModels
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio import riskModels
+from app.portfolio.riskModels import FactorModel
+from app.portfolio.solvers import PortfolioSolver
+
+
+def synthetic_returns(assets, days, factors, seed):
+    rng = np.random.default_rng(seed)
+    exposures = rng.normal(0.0, 1.0, (assets, factors)) * np.linspace(1.0, 0.3, factors)
+    factor_returns = rng.normal(0.0, 0.008, (days, factors))
+    specific = rng.normal(0.0, 1.0, (days, assets)) * rng.uniform(0.008, 0.02, assets)
+    returns = factor_returns @ exposures.T + specific + 0.0003
+    return pd.DataFrame(returns, columns=[f"T{i:04d}" for i in range(assets)])
+
+
+def timed(call):
+    t0 = time.perf_counter()
+    value = call()
+    return value, time.perf_counter() - t0
+
+
+def realized(weights, future):
+    return float((future @ weights).std(ddof=1) * np.sqrt(252))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000, 5000])
+    parser.add_argument("--days", type=int, default=504)
+    parser.add_argument("--factors", type=int, default=10)
+    parser.add_argument("--components", type=int, default=20)
+    parser.add_argument("--portfolios", type=int, default=1000)
+    parser.add_argument("--dense-max", type=int, default=2000)
+    args = parser.parse_args()
+    solver = PortfolioSolver()
+
+    print(f"{args.days} days of history, {args.factors} true factors, {args.components} fitted components, "
+          f"one held out year for realized volatility")
+    for n in args.sizes:
+        returns = synthetic_returns(n, args.days + 252, args.factors, seed=n)
+        history, future = returns.iloc[:args.days], returns.iloc[args.days:].to_numpy()
+        X = history.to_numpy()
+
+        sample, t_sample = timed(lambda: np.cov(X, rowvar=False) * 252)
+        lw, t_lw = timed(lambda: riskModels.ledoit_wolf(history))
+        oas, t_oas = timed(lambda: riskModels.oas(history))
+        model, t_factor = timed(lambda: FactorModel.from_returns(history, args.components))
+        print(f"\n{n} assets")
+        print(f"  fit        sample {t_sample:6.2f}s  ledoit_wolf {t_lw:6.2f}s (shrinkage {lw.attrs['shrinkage']:.3f})  "
+              f"oas {t_oas:6.2f}s (shrinkage {oas.attrs['shrinkage']:.3f})  factor {t_factor:6.2f}s")
+        print(f"  memory     dense {sample.nbytes / 2**20:8.1f} MiB  factor {model.nbytes / 2**20:6.2f} MiB")
+
+        weights = np.random.default_rng(0).dirichlet(np.ones(n), args.portfolios)
+        dense_variance, t_dense = timed(lambda: np.einsum("ij,ij->i", weights @ lw.to_numpy(), weights))
+        factor_variance, t_fvar = timed(lambda: model.variance(weights))
+        dense_of_model = model.dense() if n <= args.dense_max else None
+        error = np.abs(factor_variance - np.einsum("ij,ij->i", weights @ dense_of_model, weights)).max() if dense_of_model is not None else float("nan")
+        print(f"  variance   {args.portfolios} portfolios dense {t_dense * 1000:8.1f}ms  factor {t_fvar * 1000:7.1f}ms  "
+              f"{t_dense / t_fvar:6.0f}x  (max error vs dense model {error:.1e})")
+
+        results = {}
+        for label, cov in (("sample", sample), ("ledoit_wolf", lw.to_numpy()), ("factor", model)):
+            if label != "factor" and n > args.dense_max:
+                continue
+            mu = np.zeros(n)
+            if isinstance(cov, np.ndarray):
+                # a fresh factorization per size, the solver caches by covariance bytes
+                solver.kkt.cache.factors.clear()
+            line = f"  {label:<11}"
+            for name, bounds in (("kkt", None), ("long only", (0.0, 1.0))):
+                try:
+                    result, seconds = timed(lambda: solver.solve("min_volatility", mu, cov, bounds=bounds))
+                except Exception as e:
+                    # a singular sample covariance (more assets than days) is where dense solves break down
+                    line += f" {name} failed: {type(e).__name__}  "
+                    continue
+                results[(label, name)] = seconds
+                line += f" {name} {seconds:7.3f}s  realized {realized(result.weights, future):6.3f}  "
+            print(line)
+        if ("ledoit_wolf", "kkt") in results:
+            print(f"  speedup    kkt {results[('ledoit_wolf', 'kkt')] / results[('factor', 'kkt')]:6.0f}x  "
+                  f"long only {results[('ledoit_wolf', 'long only')] / results[('factor', 'long only')]:6.1f}x  (ledoit_wolf vs factor)")
+
+        if dense_of_model is not None:
+            check = solver.solve("min_volatility", np.zeros(n), dense_of_model, bounds=(0.0, 1.0))
+            assert np.abs(check.weights - solver.solve("min_volatility", np.zeros(n), model, bounds=(0.0, 1.0)).weights).max() < 1e-8
+
+
+if __name__ == "__main__":
+    main()
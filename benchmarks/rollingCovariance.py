@@ -0,0 +1,46 @@
+'''
+Times a one day RollingCovariance update against a full sample_cov recompute
+Run from the repository root: python -m benchmarks.rollingCovariance, accuracy is covered in tests/test_rollingCovariance.py
+'''
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from pypfopt import risk_models
+
+from app.portfolio.rollingCovariance import RollingCovariance
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=200)
+    parser.add_argument("--days", type=int, default=3000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2013-01-01", periods=args.days)
+    steps = rng.normal(0.0004, 0.015, (args.days, args.assets)) + rng.normal(0, 0.01, (args.days, 1))
+    prices = pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)), index=dates, columns=[f"T{i}" for i in range(args.assets)])
+    expanding = RollingCovariance.from_prices(prices)
+
+    # cost of absorbing one new trading day
+    new_day = prices.iloc[-1].to_numpy() * (1 + rng.normal(0, 0.01, args.assets))
+    extended = pd.concat([prices, pd.DataFrame([new_day], index=[dates[-1] + pd.offsets.BDay()], columns=prices.columns)])
+
+    t0 = time.perf_counter()
+    risk_models.sample_cov(extended)
+    full = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    expanding.refresh(extended)
+    expanding.covariance()
+    incremental = time.perf_counter() - t0
+
+    print(f"{args.assets} assets x {args.days} days")
+    print(f"full sample_cov recompute : {full * 1000:8.2f}ms")
+    print(f"rank one update           : {incremental * 1000:8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
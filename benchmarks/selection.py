@@ -0,0 +1,87 @@
+'''
+Cardinality constrained asset selection, QUBO heuristics against exact solvers
+For each (assets, k) on a synthetic factor covariance:
+    exhaustive  every k subset, only while C(n, k) <= --exhaustive-max
+    milp        McCormick linearization through HiGHS, stopped at --milp-seconds
+    tempering   parallel tempering over the QUBO
+    annealing   simulated annealing over the QUBO
+    qaoa        statevector QAOA with the XY mixer, only while C(n, k) <= --qaoa-max amplitudes
+Gaps are in the equal weight objective against the best selection any backend found
+Then the selected subset feeds the continuous max Sharpe optimizer, compared with keeping the k
+largest weights of the unconstrained solution
+Run from the repository root: python -m benchmarks.selection
+'''
+import argparse
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+from app.portfolio.selection import AssetSelector
+from app.portfolio.solvers import PortfolioSolver
+
+
+def synthetic_universe(assets, seed):
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0.0, 1.0, (assets, 3)) * [0.15, 0.08, 0.05]
+    cov = loadings @ loadings.T + np.diag(rng.uniform(0.15, 0.35, assets) ** 2)
+    mu = 0.02 + 0.4 * np.sqrt(np.diag(cov)) * rng.uniform(0.2, 1.0, assets)
+    tickers = [f"T{i:03d}" for i in range(assets)]
+    return pd.Series(mu, tickers), pd.DataFrame(cov, tickers, tickers)
+
+
+def sharpe(weights, mu, cov, risk_free_rate=0.02):
+    return float((weights @ mu - risk_free_rate) / np.sqrt(weights @ cov @ weights))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=str, nargs="+", default=["12:4", "16:5", "24:8", "40:10", "60:15", "100:20"])
+    parser.add_argument("--risk-aversion", type=float, default=10.0)
+    parser.add_argument("--exhaustive-max", type=int, default=2_000_000)
+    parser.add_argument("--milp-seconds", type=float, default=60.0)
+    parser.add_argument("--qaoa-max", type=int, default=50_000)
+    parser.add_argument("--qaoa-layers", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("app").setLevel(logging.WARNING)
+    solver = PortfolioSolver()
+
+    print(f"risk aversion {args.risk_aversion}, equal weight objective risk_aversion / 2 w'Sw - mu'w with w = x / k")
+    for size in args.sizes:
+        n, k = map(int, size.split(":"))
+        mu, cov = synthetic_universe(n, seed=n)
+        selector = AssetSelector(mu, cov, risk_aversion=args.risk_aversion, solver=solver)
+
+        results = {}
+        if math.comb(n, k) <= args.exhaustive_max:
+            results["exhaustive"] = selector.select(k, "exhaustive")
+        results["milp"] = selector.select(k, "milp", time_limit=args.milp_seconds)
+        results["tempering"] = selector.select(k, "tempering")
+        results["annealing"] = selector.select(k, "annealing")
+        if math.comb(n, k) <= args.qaoa_max:
+            results["qaoa"] = selector.select(k, "qaoa", layers=args.qaoa_layers)
+
+        best = min(result.objective for result in results.values())
+        print(f"\n{n} assets, pick {k}  ({math.comb(n, k):,} subsets)")
+        for name, result in results.items():
+            line = f"  {name:<11} {result.seconds:8.2f}s  objective {result.objective:10.6f}  gap {result.objective - best:8.1e}"
+            if name == "milp":
+                line += f"  mip gap {result.info['mip_gap']:.1%}"
+            if name == "qaoa":
+                line += (f"  p={len(result.info['gammas'])}, optimum probability {result.info['optimum_probability']:.4f} "
+                         f"(uniform {1 / result.info['amplitudes']:.4f}), {result.info['evaluations']} circuit evaluations")
+            print(line)
+
+        # the selection as the universe for the continuous optimizer, against truncating the full solution
+        selection, chosen = selector.optimize(k, "max_sharpe")
+        full = solver.max_sharpe(mu, cov).weights
+        top = np.argsort(-full)[:k]
+        truncated = np.zeros(n)
+        truncated[top] = solver.max_sharpe(mu.iloc[top], cov.iloc[top, top]).weights
+        print(f"  max sharpe  unconstrained {sharpe(full, mu, cov):.4f} on {int((full > 1e-6).sum())} assets  "
+              f"selected subset {sharpe(chosen.weights, mu, cov):.4f}  top {k} of the full solution {sharpe(truncated, mu, cov):.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+'''
+Timing of the PortfolioSolver backends against PyPortfolioOpt's cvxpy path, with the weight differences
+Run from the repository root: python -m benchmarks.solvers, accuracy is covered in tests/test_solvers.py
+'''
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from pypfopt.efficient_frontier import EfficientFrontier
+from pypfopt.exceptions import OptimizationError
+
+from app.portfolio.riskModels import FactorModel
+from app.portfolio.solvers import PortfolioSolver
+
+
+def pypfopt_solve(objective, mu, cov, bounds, target_return, risk_free_rate):
+    ef = EfficientFrontier(mu, cov, weight_bounds=bounds)
+    if objective == "max_sharpe":
+        ef.max_sharpe(risk_free_rate=risk_free_rate)
+    elif objective == "efficient_return":
+        ef.efficient_return(target_return)
+    else:
+        ef.min_volatility()
+    return np.array(list(ef.weights))
+
+
+def timed(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = fn()
+    return result, (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--factors", type=int, default=5)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    rng = np.random.default_rng(1)
+    risk_free_rate = 0.02
+    print(f"{'n':>4} {'objective':<17} {'bounds':<10} {'backend':<10} {'max |dw|':>9} {'native':>9} {'pypfopt':>9} {'speedup':>8}")
+
+    for n in args.sizes:
+        returns = rng.normal(0.0006, 0.015, (2500, n)) + rng.normal(0, 0.01, (2500, 1))
+        tickers = [f"T{i}" for i in range(n)]
+        mu = pd.Series(returns.mean(axis=0) * 252, index=tickers)
+        cov = pd.DataFrame(np.cov(returns, rowvar=False) * 252, index=tickers, columns=tickers)
+        # the capped case aims for the equal weight return, which is always reachable under a 20% cap
+        targets = {(None, None): float(mu.quantile(0.8)), (0, 1): float(mu.quantile(0.8)), (0, 0.2): float(mu.mean())}
+        solver = PortfolioSolver()
+        # the same cases through a factor model, solved by Woodbury, against its dense matrix
+        model = FactorModel.from_returns(pd.DataFrame(returns, columns=tickers), args.factors)
+        dense = pd.DataFrame(model.dense(), index=tickers, columns=tickers)
+        woodbury = 0.0
+
+        cases = [
+            ("min_volatility", (None, None)),
+            ("efficient_return", (None, None)),
+            ("max_sharpe", (None, None)),
+            ("min_volatility", (0, 1)),
+            ("efficient_return", (0, 1)),
+            ("max_sharpe", (0, 1)),
+            ("efficient_return", (0, 0.2)),
+        ]
+        for objective, bounds in cases:
+            target = targets[bounds]
+            kwargs = {"target_return": target} if objective == "efficient_return" else {}
+            native, native_time = timed(
+                lambda: solver.solve(objective, mu, cov, bounds=bounds, risk_free_rate=risk_free_rate, **kwargs), args.repeats
+            )
+            factored = solver.solve(objective, mu, model, bounds=bounds, risk_free_rate=risk_free_rate, **kwargs)
+            expanded = solver.solve(objective, mu, dense, bounds=bounds, risk_free_rate=risk_free_rate, **kwargs)
+            woodbury = max(woodbury, np.abs(factored.weights - expanded.weights).max())
+            try:
+                reference, reference_time = timed(
+                    lambda: pypfopt_solve(objective, mu, cov, bounds, target, risk_free_rate), args.repeats
+                )
+            except OptimizationError as e:
+                print(f"{n:>4} {objective:<17} {str(bounds):<10} {native.backend:<10} pypfopt failed: {e.args[-1]}")
+                continue
+            error = np.abs(native.weights - reference).max()
+            print(
+                f"{n:>4} {objective:<17} {str(bounds):<10} {native.backend:<10} {error:9.1e} "
+                f"{native_time * 1000:7.2f}ms {reference_time * 1000:7.2f}ms {reference_time / native_time:7.1f}x"
+            )
+
+        print(f"     woodbury vs dense max |dw| {woodbury:.1e}")
+        print(f"     cholesky cache hits {solver.kkt.cache.hits}, misses {solver.kkt.cache.misses}")
+
+
+if __name__ == "__main__":
+    main()
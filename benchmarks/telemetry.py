@@ -0,0 +1,137 @@
+'''
+Observability overhead, the old eager logging against spans, counters and lazy payload logging
+    payloads    one f-string INFO log of a large chat payload per call, the way the clients logged,
+                against log_payload at DEBUG (dropped without serializing) and at DEBUG with sampling
+    spans       cost of one nested span, a counter update and a histogram observation
+    export      Prometheus text render time for the metrics left by an instrumented optimizer run,
+                with the span tree of that run and an excerpt of the /metrics body
+Run from the repository root: python -m benchmarks.telemetry
+'''
+import argparse
+import asyncio
+import io
+import logging
+import os
+import tempfile
+import time
+
+from app.data.priceLoader import FixtureSource
+from app.telemetry import LOG_FORMAT, telemetry
+from benchmarks.optimizerGraph import END, START, new_optimizer
+
+
+def chat_payload(messages: int, chars: int) -> list:
+    return [{"role": "user", "parts": [{"text": "x" * chars}]} for _ in range(messages)]
+
+
+def timed(fn, repeats: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - t0) / repeats
+
+
+def payloads(args):
+    # a real handler writing to memory, so the formatting cost is the one a log file would pay
+    logger = logging.getLogger("benchmark.payloads")
+    logger.propagate = False
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+    messages = chat_payload(args.messages, args.chars)
+    eager = timed(lambda: logger.info(f"sending a chat request {messages}"), args.repeats)
+    eager_bytes = stream.tell() / args.repeats
+
+    stream.seek(0), stream.truncate()
+    lazy_info = timed(lambda: telemetry.log_payload(logger, "sending a chat request %s", messages), args.repeats)
+
+    logger.setLevel(logging.DEBUG)
+    telemetry.payload_sample = args.payload_sample
+    lazy_debug = timed(lambda: telemetry.log_payload(logger, "sending a chat request %s", messages), args.repeats)
+    lazy_bytes = stream.tell() / args.repeats
+    telemetry.payload_sample = 1.0
+
+    print(f"payload: {args.messages} messages x {args.chars} chars, {args.repeats} calls")
+    print(f"  eager f-string at INFO          {eager * 1e6:9.1f}us/call  {eager_bytes / 1024:8.1f} KiB logged/call")
+    print(f"  log_payload, level INFO         {lazy_info * 1e6:9.1f}us/call  {0:8.1f} KiB logged/call  ({eager / lazy_info:,.0f}x)")
+    print(f"  log_payload, DEBUG, {args.payload_sample:.0%} sample  {lazy_debug * 1e6:9.1f}us/call  {lazy_bytes / 1024:8.1f} KiB logged/call  ({eager / lazy_debug:,.0f}x)")
+    logger.removeHandler(handler)
+
+
+def spans(args):
+    telemetry.reset()
+
+    def nested():
+        with telemetry.span("outer"):
+            with telemetry.span("inner", ticker="T000"):
+                pass
+
+    span = timed(nested, args.repeats) / 2
+    telemetry.span_sample = 0.0
+    unsampled = timed(nested, args.repeats) / 2
+    telemetry.span_sample = 1.0
+    counter = timed(lambda: telemetry.count("gemini_tokens_total", 120, model="m", kind="used"), args.repeats)
+    histogram = timed(lambda: telemetry.observe("span_seconds", 0.02, span="outer"), args.repeats)
+
+    print(f"overhead over {args.repeats} calls")
+    print(f"  span, sampled                   {span * 1e6:9.2f}us")
+    print(f"  span, trace not sampled         {unsampled * 1e6:9.2f}us")
+    print(f"  counter                         {counter * 1e6:9.2f}us")
+    print(f"  histogram observation           {histogram * 1e6:9.2f}us")
+
+
+async def export(args):
+    telemetry.reset()
+    tickers = [f"T{i:03d}" for i in range(args.tickers)]
+    source = FixtureSource.synthetic(tickers, START, END, latency=0.01)
+    with tempfile.TemporaryDirectory() as root:
+        optimizer = new_optimizer(source, os.path.join(root, "optimizer.sqlite"), root)
+        t0 = time.perf_counter()
+        await optimizer.run(tickers)
+        elapsed = time.perf_counter() - t0
+
+    traces = {}
+    for record in telemetry.spans:
+        traces.setdefault(record["traceId"], []).append(record)
+    run = max(traces.values(), key=len)
+    children = {}
+    for record in run:
+        children.setdefault(record["parentSpanId"], []).append(record)
+
+    def show(parent, depth):
+        for record in sorted(children.get(parent, []), key=lambda r: r["startTimeUnixNano"]):
+            seconds = (record["endTimeUnixNano"] - record["startTimeUnixNano"]) / 1e9
+            print(f"  {'  ' * depth}{record['name']:<{34 - 2 * depth}} {seconds * 1000:8.1f}ms")
+            show(record["spanId"], depth + 1)
+
+    print(f"optimizer run over {args.tickers} tickers in {elapsed:.2f}s, {len(run)} spans in one trace")
+    show(None, 0)
+
+    body = telemetry.prometheus()
+    render = timed(telemetry.prometheus, 200)
+    print(f"/metrics body {len(body) / 1024:.1f} KiB, {body.count(chr(10))} lines, rendered in {render * 1e3:.2f}ms")
+    for line in body.splitlines():
+        if "counter" in line or "_total" in line or "_count" in line:
+            print(f"  {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--chars", type=int, default=4000)
+    parser.add_argument("--payload-sample", type=float, default=0.1)
+    parser.add_argument("--repeats", type=int, default=2000)
+    parser.add_argument("--tickers", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.getLogger("app").setLevel(logging.WARNING)
+    payloads(args)
+    spans(args)
+    asyncio.run(export(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+'''
+Routing and argument coercion cost of toolRegistry against the previous linear scan + convert_value
+Run from the repository root: python -m benchmarks.toolRegistry
+'''
+import argparse
+import time
+
+from app.mcp.client.toolRegistry import toolRegistry
+
+
+def convert_value(val):
+    # previous string guessing coercion from mcpExecutor.tool_call
+    if isinstance(val, str):
+        if val.lower() == "true": return True
+        if val.lower() == "false": return False
+        try:
+            if "." in val:
+                return float(val)
+            return int(val)
+        except:
+            return val
+    if isinstance(val, list):
+        return [convert_value(v) for v in val]
+    if isinstance(val, dict):
+        return {k: convert_value(v) for k, v in val.items()}
+    return val
+
+
+def scan(tool, args, tools):
+    args = {k: convert_value(v) for k, v in args.items()}
+    url = None
+    for srv, tool_info in tools:
+        if tool == tool_info.get("name"):
+            url = srv
+    return url, args
+
+
+def schema():
+    # the shape FastMCP generates for get_bulk_data style signatures
+    return {
+        "type": "object",
+        "properties": {
+            "tickers": {"type": "array", "items": {"type": "string"}},
+            "start": {"type": "string"},
+            "end": {"type": "string"},
+            "max_points": {"anyOf": [{"type": "integer"}, {"type": "null"}], "default": None},
+            "decimals": {"type": "integer", "default": 4},
+            "adjusted": {"type": "boolean", "default": True},
+        },
+        "required": ["tickers", "start", "end"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", type=int, default=50)
+    parser.add_argument("--tools", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    tools = [
+        (f"http://server{s}/mcp", {"name": f"s{s}_tool_{t}", "inputSchema": schema()})
+        for s in range(args.servers) for t in range(args.tools)
+    ]
+    tools.append(("http://duplicate/mcp", {"name": "s0_tool_0", "inputSchema": schema()}))
+    names = [tool["name"] for _, tool in tools[1:-1]]
+    call = {"tickers": ["AAPL", "1234", "MSFT"], "start": "2024-01-01", "end": "2024-12-31", "max_points": "52", "adjusted": "false"}
+
+    t0 = time.perf_counter()
+    registry = toolRegistry(tools)
+    build = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(args.calls):
+        scan(names[i % len(names)], call, tools)
+    naive = (time.perf_counter() - t0) / args.calls
+
+    t0 = time.perf_counter()
+    for i in range(args.calls):
+        registry.prepare(names[i % len(names)], call)
+    indexed = (time.perf_counter() - t0) / args.calls
+
+    print(f"{len(tools)} tools on {args.servers + 1} servers, registry built in {build * 1000:.1f}ms")
+    print(f"scan + convert_value : {naive * 1e6:8.1f}us per call")
+    print(f"toolRegistry.prepare : {indexed * 1e6:8.1f}us per call  ({naive / indexed:.0f}x)")
+
+    # the old guesser turns the ticker "1234" into an int and cannot tell which duplicate wins
+    _, guessed = scan(names[0], call, tools)
+    _, typed = registry.prepare(names[0], call)
+    print(f"old tickers {guessed['tickers']}, typed tickers {typed['tickers']}, max_points {typed['max_points']!r}")
+    assert typed["tickers"] == ["AAPL", "1234", "MSFT"] and typed["max_points"] == 52 and typed["adjusted"] is False
+    print(f"ambiguous names: {registry.ambiguous}")
+    for bad in ({"tickers": ["AAPL"], "start": "2024-01-01"}, {**call, "decimals": "4.5"}):
+        try:
+            registry.prepare(names[0], bad)
+        except ValueError as e:
+            print(f"rejected: {e}")
+
+
+if __name__ == "__main__":
+    main()
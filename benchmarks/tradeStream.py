@@ -0,0 +1,93 @@
+'''
+Memory, time and response size of the streaming list_trades tool against materializing every trade,
+served by the fake Polygon endpoint from benchmarks.polygonLoad
+Run from the repository root: python -m benchmarks.tradeStream
+'''
+import argparse
+import asyncio
+import dataclasses
+from http.server import ThreadingHTTPServer
+import json
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.polygonLoad import FakePolygon
+
+from polygon.rest import RESTClient
+
+from app.data.priceCache import PriceCache
+from app.mcp.server.polygon import polygonMCP
+
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trades", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    FakePolygon.latency = args.latency
+    FakePolygon.trades_per_day = args.trades
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakePolygon)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    client = RESTClient("benchmark", base=f"http://127.0.0.1:{httpd.server_address[1]}")
+    day = "2024-06-03"
+
+    print(f"{args.trades} trades, {polygonMCP.TRADE_PAGE_SIZE} per page")
+    print(f"{'tool':<28} {'time':>8} {'peak MiB':>9} {'response KiB':>13}")
+
+    # the old tool: drain the iterator, then serialize every trade
+    def materialize():
+        trades = list(client.list_trades("AAPL", timestamp=day, limit=polygonMCP.TRADE_PAGE_SIZE))
+        return trades, json.dumps([dataclasses.asdict(trade) for trade in trades])
+
+    (trades, text), elapsed, peak = measure(materialize)
+    print(f"{'materialized list':<28} {elapsed:7.2f}s {peak / 2**20:9.1f} {len(text) / 1024:13.1f}")
+
+    with tempfile.TemporaryDirectory() as root:
+        server = polygonMCP("benchmark", cache=PriceCache(root), client=client, max_workers=4)
+        cases = [
+            ("raw, limit 1000", {"mode": "raw", "limit": 1000}),
+            ("ohlc 1min", {"mode": "ohlc", "interval": "1min"}),
+            ("vwap 5min", {"mode": "vwap", "interval": "5min"}),
+            ("volume 1M shares", {"mode": "volume", "bucket_volume": 1_000_000}),
+        ]
+        results = {}
+        for name, options in cases:
+            call = lambda: asyncio.run(server.mcp.call_tool("list_trades", {"ticker": "AAPL", "timestamp": day, **options}))
+            content, elapsed, peak = measure(call)
+            results[name] = json.loads(content[0].text)
+            print(f"{name:<28} {elapsed:7.2f}s {peak / 2**20:9.1f} {len(content[0].text) / 1024:13.1f}")
+        server.backend.close()
+
+    # streamed bars must match a pandas resample of the materialized ticks
+    frame = pd.DataFrame(
+        {"price": [t.price for t in trades], "size": [t.size for t in trades]},
+        index=pd.to_datetime([t.sip_timestamp for t in trades]),
+    )
+    reference = frame["price"].resample("1min").ohlc().dropna()
+    ohlc = results["ohlc 1min"]
+    assert ohlc["trades"] == len(trades)
+    assert np.allclose(ohlc["c"], reference["close"]) and np.allclose(ohlc["h"], reference["high"])
+    assert results["raw, limit 1000"]["p"] == [t.price for t in trades[:1000]]
+
+    httpd.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+'''
+Shared pytest setup, run from the repository root with python -m pytest
+The benchmarks package sets the placeholder API keys app.settings needs, and its stubs are reused here
+'''
+import benchmarks  # noqa: F401
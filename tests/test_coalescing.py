@@ -0,0 +1,48 @@
+'''
+Coalescer, shared by ResponseCache.fetch and marketDataBackend.submit
+'''
+import asyncio
+
+import pytest
+
+from app.coalescing import Coalescer
+
+
+def test_callers_share_one_call():
+    coalescer = Coalescer()
+    calls = []
+
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    def start():
+        calls.append(len(calls))
+        return asyncio.ensure_future(work(calls[-1]))
+
+    async def run():
+        results = await asyncio.gather(*(coalescer.run("key", start) for _ in range(5)), coalescer.run(None, start))
+        return results, len(coalescer)
+
+    results, pending = asyncio.run(run())
+    # key=None never joins the running call
+    assert len(calls) == 2
+    assert results == [0] * 5 + [1]
+    assert pending == 0
+
+
+def test_cancelled_caller_does_not_cancel_the_call():
+    coalescer = Coalescer()
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(coalescer.run("key", lambda: asyncio.ensure_future(work())))
+        second = asyncio.ensure_future(coalescer.run("key", lambda: pytest.fail("the second caller started a call")))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)
@@ -0,0 +1,103 @@
+'''
+LLMScheduler behind GeminiClient against the local fake of the Gemini endpoint
+'''
+import asyncio
+
+import pytest
+
+from app.agents.geminiClient import GeminiClient
+from app.agents.llmScheduler import LLMScheduler, ModelLimits
+from app.models import GenerateRequest
+from benchmarks.geminiScheduler import reset, sdk_client
+from benchmarks.geminiStub import geminiStub
+
+
+@pytest.fixture(scope="module")
+def endpoint():
+    stub = geminiStub(latency=0.05)
+    url, server = stub.serve()
+    yield url, stub
+    server.should_exit = True
+
+
+@pytest.fixture
+def stub(endpoint):
+    url, stub = endpoint
+    stub.rpm = None
+    stub.window = 60.0
+    reset(stub)
+    return url, stub
+
+
+def generate(gemini: GeminiClient, prompts: list, priority: int = 10) -> list:
+    return [gemini.generate_completion(GenerateRequest(prompt=p, priority=priority)) for p in prompts]
+
+
+def test_in_flight_cap(stub):
+    url, stub = stub
+    gemini = GeminiClient(scheduler=LLMScheduler(default=ModelLimits(rpm=10_000, max_in_flight=4)), client=sdk_client(url))
+    prompts = [f"prompt {i}" for i in range(16)]
+
+    async def run():
+        return await asyncio.gather(*generate(gemini, prompts))
+
+    results = asyncio.run(run())
+    assert [r.response for r in results] == [f"echo: {p}" for p in prompts]
+    assert stub.stats["peak_in_flight"] <= 4
+    assert gemini.scheduler.report()["in_flight"] == {"gemini-2.5-flash": 0}
+
+
+def test_priority_jumps_the_queue(stub):
+    url, stub = stub
+    gemini = GeminiClient(scheduler=LLMScheduler(default=ModelLimits(rpm=10_000, max_in_flight=1)), client=sdk_client(url))
+
+    async def run():
+        background = generate(gemini, [f"prompt {i}" for i in range(8)])
+        urgent = generate(gemini, [f"urgent {i}" for i in range(2)], priority=0)
+        return await asyncio.gather(*background, *urgent)
+
+    asyncio.run(run())
+    # submitted last, the urgent calls run as soon as the one call already started has finished
+    positions = sorted(stub.order.index(f"urgent {i}") for i in range(2))
+    assert positions[-1] <= 2
+    assert len(stub.order) == 10
+
+
+def test_rate_limited_calls_are_requeued(stub):
+    url, stub = stub
+    stub.rpm = 5
+    stub.window = 1.0
+    # the scheduler believes the limit is twice what the endpoint allows, so it runs into 429s
+    scheduler = LLMScheduler(default=ModelLimits(rpm=10, window=1.0, max_in_flight=8), backoff=0.1, max_backoff=1.0)
+    gemini = GeminiClient(scheduler=scheduler, client=sdk_client(url))
+    prompts = [f"prompt {i}" for i in range(12)]
+
+    async def run():
+        return await asyncio.gather(*generate(gemini, prompts), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert not any(isinstance(r, Exception) for r in results)
+    assert sorted(stub.order) == sorted(prompts)
+    assert stub.stats["rate_limited"] > 0
+    assert scheduler.stats["rate_limited"] == stub.stats["rate_limited"]
+    assert scheduler.stats["completed"] == len(prompts) and scheduler.stats["failed"] == 0
+
+
+def test_cancelled_call_releases_its_slot():
+    scheduler = LLMScheduler(default=ModelLimits(max_in_flight=1))
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def answer():
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(scheduler.submit("model", cancelled))
+        second = asyncio.ensure_future(scheduler.submit("model", answer))
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(first, timeout=5)
+        return await asyncio.wait_for(second, timeout=5)
+
+    assert asyncio.run(run()) == "done"
+    assert scheduler.report()["in_flight"] == {"model": 0}
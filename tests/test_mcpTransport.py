@@ -0,0 +1,94 @@
+'''
+mcpTransport and sessionManager against a stub MCP server that answers over SSE
+'''
+import asyncio
+import json
+import random
+from uuid import uuid4
+
+import pytest
+
+from app.mcp.client.mcpTransport import mcpTransport, sseParser
+from app.mcp.client.sessionManager import sessionManager
+from benchmarks.mcpStub import serve_stub
+from benchmarks.mcpTransport import build_server
+
+
+@pytest.fixture(scope="module")
+def server():
+    url, stub = serve_stub("transport", latency=0.0, mcp=build_server())
+    yield url
+    stub.should_exit = True
+
+
+def call(name: str, arguments: dict, progress: bool = False) -> dict:
+    request_id = str(uuid4())
+    params = {"name": name, "arguments": arguments}
+    if progress:
+        params["_meta"] = {"progressToken": request_id}
+    return {"jsonrpc": "2.0", "id": request_id, "method": "tools/call", "params": params}
+
+
+def test_parser_random_chunking():
+    rng = random.Random(0)
+    events = [{"event": "message", "data": json.dumps({"id": i, "text": "x" * rng.randint(0, 5000)}), "id": str(i)} for i in range(200)]
+    stream = "".join(f": keepalive\r\nid: {e['id']}\r\ndata: {e['data']}\r\n\r\n" for e in events)
+    for _ in range(20):
+        parser, parsed, i = sseParser(), [], 0
+        while i < len(stream):
+            j = i + rng.randint(1, 4096)
+            parsed += parser.feed(stream[i:j])
+            i = j
+        parsed += parser.flush()
+        assert parsed == events
+
+
+def test_parser_line_endings_and_fields():
+    parser = sseParser()
+    # a \r\n split across chunks ends one line, multi line data joins with \n
+    events = parser.feed("event: progress\r")
+    events += parser.feed("\ndata: a\ndata: b\r\rdata: last")
+    assert events == [{"event": "progress", "data": "a\nb", "id": None}]
+    # a stream closed without the final blank line still dispatches its last event
+    assert parser.flush() == [{"event": "message", "data": "last", "id": None}]
+
+
+def test_streamed_progress_before_result(server):
+    async def run():
+        transport = mcpTransport()
+        sessions = sessionManager(transport)
+        payload = call("report", {"rows": 2000, "steps": 3}, progress=True)
+        messages = []
+        try:
+            async for message in sessions.stream(server, payload):
+                messages.append(message)
+        finally:
+            await transport.aclose()
+        return payload, messages
+
+    payload, messages = asyncio.run(run())
+    methods = [message.get("method") for message in messages]
+    assert methods[:3] == ["notifications/progress"] * 3
+    assert messages[-1]["id"] == payload["id"]
+    rows = json.loads(messages[-1]["result"]["content"][0]["text"])["rows"]
+    assert len(rows) == 2000
+
+
+def test_pooled_concurrent_requests(server):
+    async def run():
+        transport = mcpTransport(max_connections=8, max_keepalive_connections=8)
+        sessions = sessionManager(transport)
+        notifications = []
+        payloads = [call("report", {"rows": 10, "steps": 1}, progress=True) for _ in range(30)]
+        try:
+            responses = await asyncio.gather(
+                *(sessions.request(server, payload, on_notification=notifications.append) for payload in payloads)
+            )
+        finally:
+            await transport.aclose()
+        return payloads, responses, notifications
+
+    payloads, responses, notifications = asyncio.run(run())
+    assert [response["id"] for response in responses] == [payload["id"] for payload in payloads]
+    assert all("result" in response for response in responses)
+    assert len(notifications) == len(payloads)
@@ -0,0 +1,26 @@
+'''
+MonteCarloEngine argument checks
+'''
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.portfolio.monteCarlo import MonteCarloEngine
+
+
+@pytest.fixture(scope="module")
+def engine() -> MonteCarloEngine:
+    returns = pd.DataFrame(np.random.default_rng(0).normal(0.0004, 0.01, (300, 3)), columns=["A", "B", "C"])
+    return MonteCarloEngine.from_returns(returns)
+
+
+@pytest.mark.parametrize("kwargs", [{"paths": 0}, {"paths": -5}, {"levels": ()}, {"levels": (0.95, 1.0)}, {"levels": (0,)}])
+def test_simulate_rejects_bad_arguments(engine, kwargs):
+    with pytest.raises(ValueError):
+        engine.simulate([1 / 3] * 3, **kwargs)
+
+
+def test_simulate_small_run(engine):
+    result = engine.simulate([1 / 3] * 3, paths=1000, levels=(0.95, 0.99))
+    assert set(result.var) == {0.95, 0.99}
+    assert result.var[0.99][0] >= result.var[0.95][0]
@@ -0,0 +1,34 @@
+'''
+PriceCache bookkeeping under concurrent read through access
+'''
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from app.data.priceCache import PriceCache
+from app.data.priceLoader import OHLCV_FIELDS
+
+
+def bars(start, end) -> pd.DataFrame:
+    dates = pd.bdate_range(start, pd.Timestamp(end) - pd.Timedelta(days=1))
+    return pd.DataFrame(np.full((len(dates), len(OHLCV_FIELDS)), 100.0), index=dates, columns=OHLCV_FIELDS)
+
+
+def test_concurrent_gets_keep_stats_consistent(tmp_path):
+    cache = PriceCache(str(tmp_path))
+    tickers = [f"T{i}" for i in range(8)]
+    requests = [ticker for ticker in tickers for _ in range(25)]
+
+    def get(ticker):
+        return cache.get(ticker, "2024-01-01", "2024-03-01", bars, adjusted=False)
+
+    with ThreadPoolExecutor(8) as pool:
+        frames = list(pool.map(get, requests))
+
+    report = cache.report()
+    assert all(len(frame) == len(frames[0]) > 0 for frame in frames)
+    assert report["requests"] == len(requests)
+    assert report["misses"] == report["upstream_calls"] == len(tickers)
+    assert report["hits"] == len(requests) - len(tickers)
+    assert report["entries"] == len(tickers)
@@ -0,0 +1,93 @@
+'''
+RollingCovariance against pypfopt and pandas on a small synthetic price history
+'''
+import numpy as np
+import pandas as pd
+import pytest
+from pypfopt import risk_models
+
+from app.portfolio.rollingCovariance import RollingCovariance
+
+TOLERANCE = 1e-10
+
+
+@pytest.fixture(scope="module")
+def prices() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    days, assets = 600, 20
+    steps = rng.normal(0.0004, 0.015, (days, assets)) + rng.normal(0, 0.01, (days, 1))
+    dates = pd.bdate_range("2020-01-01", periods=days)
+    return pd.DataFrame(100 * np.exp(np.cumsum(steps, axis=0)), index=dates, columns=[f"T{i}" for i in range(assets)])
+
+
+def error(estimate, reference) -> float:
+    return np.abs(np.asarray(estimate) - np.asarray(reference)).max()
+
+
+def test_expanding_matches_sample_cov(prices):
+    estimator = RollingCovariance.from_prices(prices)
+    assert error(estimator.covariance(), risk_models.sample_cov(prices)) < TOLERANCE
+
+
+def test_rolling_matches_window_cov(prices):
+    returns = prices.pct_change().dropna()
+    estimator = RollingCovariance.from_returns(returns, window=60)
+    assert error(estimator.covariance(False), returns.iloc[-60:].cov()) < TOLERANCE
+
+
+def test_exponential_matches_pandas_ewm(prices):
+    returns = prices.pct_change().dropna()
+    estimator = RollingCovariance.from_returns(returns, halflife=60)
+    reference = returns.ewm(halflife=60, adjust=False).cov(bias=True).loc[returns.index[-1]]
+    assert error(estimator.covariance(False), reference) < TOLERANCE
+
+
+def test_staggered_listing_is_pairwise(prices):
+    # a ticker listed 300 days after the others, sample_cov is pairwise over the days both traded
+    staggered = prices.copy()
+    staggered.iloc[:300, 0] = np.nan
+    estimator = RollingCovariance.from_prices(staggered)
+    assert error(estimator.covariance(), risk_models.sample_cov(staggered)) < TOLERANCE
+
+
+@pytest.mark.parametrize("resync_every", [None, 10_000])
+def test_rolling_window_across_a_listing(prices, resync_every):
+    # the window slides over the listing date, with and without the exact rebuild from the buffer
+    staggered = prices.copy()
+    staggered.iloc[:300, 0] = np.nan
+    returns = staggered.pct_change(fill_method=None).iloc[1:]
+    estimator = RollingCovariance(returns.shape[1], window=60, tickers=list(returns.columns), resync_every=resync_every)
+    for i, row in enumerate(returns.to_numpy()):
+        estimator.update(row)
+        if i in (320, 350, len(returns) - 1):
+            window = returns.iloc[max(0, i - 59): i + 1]
+            reference = window.cov()
+            assert np.array_equal(np.isnan(estimator.covariance(False).to_numpy()), np.isnan(reference.to_numpy()))
+            assert np.nanmax(np.abs(estimator.covariance(False).to_numpy() - reference.to_numpy())) < TOLERANCE
+
+
+def test_refresh_absorbs_new_days(prices):
+    estimator = RollingCovariance.from_prices(prices.iloc[:-5])
+    assert estimator.refresh(prices) == 5
+    assert estimator.refresh(prices) == 0
+    assert error(estimator.covariance(), risk_models.sample_cov(prices)) < TOLERANCE
+
+
+def test_refresh_rebuilds_after_a_split(prices):
+    # a 4:1 split re-adjusts the whole history upstream, refresh rebuilds instead of absorbing a -75% day
+    estimator = RollingCovariance.from_prices(prices.iloc[:-1])
+    split = prices.copy()
+    split["T0"] /= 4
+    estimator.refresh(split)
+    assert error(estimator.covariance(), risk_models.sample_cov(split)) < TOLERANCE
+
+
+def test_state_round_trip(prices, tmp_path):
+    returns = prices.pct_change().dropna()
+    estimator = RollingCovariance.from_returns(returns.iloc[:-10], window=60)
+    estimator.save(str(tmp_path / "cov"))
+    restored = RollingCovariance.load(str(tmp_path / "cov"))
+    for row in returns.iloc[-10:].to_numpy():
+        estimator.update(row)
+        restored.update(row)
+    assert np.array_equal(estimator.covariance(False).to_numpy(), restored.covariance(False).to_numpy())
@@ -0,0 +1,82 @@
+'''
+PortfolioSolver backends against PyPortfolioOpt's cvxpy path, and the factor model against its dense matrix
+'''
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+from pypfopt.efficient_frontier import EfficientFrontier
+from pypfopt.exceptions import OptimizationError
+
+from app.portfolio.riskModels import FactorModel
+from app.portfolio.solvers import PortfolioSolver
+
+# max abs weight difference allowed against pypfopt, and between the Woodbury and dense paths
+TOLERANCE = 1e-6
+RISK_FREE_RATE = 0.02
+
+CASES = [
+    ("min_volatility", (None, None)),
+    ("efficient_return", (None, None)),
+    ("max_sharpe", (None, None)),
+    ("min_volatility", (0, 1)),
+    ("efficient_return", (0, 1)),
+    ("max_sharpe", (0, 1)),
+    ("efficient_return", (0, 0.2)),
+]
+
+
+@pytest.fixture(scope="module", params=[10, 50])
+def market(request) -> dict:
+    n = request.param
+    rng = np.random.default_rng(1)
+    returns = rng.normal(0.0006, 0.015, (2500, n)) + rng.normal(0, 0.01, (2500, 1))
+    tickers = [f"T{i}" for i in range(n)]
+    mu = pd.Series(returns.mean(axis=0) * 252, index=tickers)
+    cov = pd.DataFrame(np.cov(returns, rowvar=False) * 252, index=tickers, columns=tickers)
+    model = FactorModel.from_returns(pd.DataFrame(returns, columns=tickers), 5)
+    # the capped case aims for the equal weight return, which is always reachable under a 20% cap
+    targets = {(None, None): float(mu.quantile(0.8)), (0, 1): float(mu.quantile(0.8)), (0, 0.2): float(mu.mean())}
+    return {"mu": mu, "cov": cov, "model": model, "targets": targets}
+
+
+def solve(solver, objective, market, cov, bounds):
+    kwargs = {"target_return": market["targets"][bounds]} if objective == "efficient_return" else {}
+    return solver.solve(objective, market["mu"], cov, bounds=bounds, risk_free_rate=RISK_FREE_RATE, **kwargs)
+
+
+def pypfopt_solve(objective, market, bounds):
+    ef = EfficientFrontier(market["mu"], market["cov"], weight_bounds=bounds)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if objective == "max_sharpe":
+            ef.max_sharpe(risk_free_rate=RISK_FREE_RATE)
+        elif objective == "efficient_return":
+            ef.efficient_return(market["targets"][bounds])
+        else:
+            ef.min_volatility()
+    return np.array(list(ef.weights))
+
+
+@pytest.mark.parametrize("objective, bounds", CASES)
+def test_matches_pypfopt(market, objective, bounds):
+    try:
+        reference = pypfopt_solve(objective, market, bounds)
+    except OptimizationError as e:
+        pytest.skip(f"pypfopt failed: {e.args[-1]}")
+    result = solve(PortfolioSolver(), objective, market, market["cov"], bounds)
+    if bounds == (None, None) and np.abs(result.weights).max() > 1:
+        # pypfopt reads unbounded weights as -1 to 1, so the two solve different problems
+        pytest.skip("unbounded weights past pypfopt's implicit +/-1 bounds")
+    assert np.abs(result.weights - reference).max() < TOLERANCE
+
+
+@pytest.mark.parametrize("objective, bounds", CASES)
+def test_factor_model_matches_dense(market, objective, bounds):
+    solver = PortfolioSolver()
+    tickers = market["mu"].index
+    dense = pd.DataFrame(market["model"].dense(), index=tickers, columns=tickers)
+    factored = solve(solver, objective, market, market["model"], bounds)
+    expanded = solve(solver, objective, market, dense, bounds)
+    assert np.abs(factored.weights - expanded.weights).max() < TOLERANCE